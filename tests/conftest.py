@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tools package imports top-level modules such as utils
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,171 @@
+import copy
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from tools.caddy.admin import AdminClient, CaddyAdminError
+
+def route(host: str, body: str) -> dict:
+    return {
+        'match': [{'host': [host]}],
+        'handle': [{'handler': 'static_response', 'body': body}],
+        'terminal': True,
+    }
+
+def config(*routes, listen=(':80',), **server) -> dict:
+    return {'apps': {'http': {'servers': {'srv0': dict(server, listen=list(listen), routes=list(routes))}}}}
+
+class FakeAdmin(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Caddy's admin API as far as AdminClient uses it, over a unix socket."""
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        super().__init__(path, FakeAdminHandler)
+        self.config      = {}
+        self.adaptations = {}       # Caddyfile text -> adapted JSON
+        self.requests    = []
+        self.drop_idle   = False    # hang up after each response, like an idle timeout
+
+class FakeAdminHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status: int, payload=None):
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if self.server.drop_idle:
+            self.close_connection = True
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _dispatch(self):
+        fake = self.server
+        body = self._body()
+        fake.requests.append(f"{self.command} {self.path}")
+
+        if self.path in ('/adapt', '/load'):
+            adapted = fake.adaptations.get(body.decode('utf-8'))
+            if adapted is None:
+                return self.reply(400, {'error': 'adapting config: unknown Caddyfile'})
+            if self.path == '/load':
+                fake.config = copy.deepcopy(adapted)
+                return self.reply(200)
+            return self.reply(200, {'result': adapted})
+
+        parts = [part for part in self.path.split('/')[2:] if part]
+        if self.command == 'GET':
+            node = fake.config
+            for part in parts:
+                node = node[int(part)] if isinstance(node, list) else node.get(part, {})
+            return self.reply(200, node)
+
+        *parents, last = parts
+        node = fake.config
+        for part in parents:
+            node = node[int(part)] if isinstance(node, list) else node[part]
+        payload = json.loads(body) if body else None
+        if self.command == 'PUT' and isinstance(node, list):
+            node.insert(int(last), payload)
+        elif self.command == 'PATCH':
+            node[int(last) if isinstance(node, list) else last] = payload
+        elif self.command == 'DELETE':
+            del node[int(last) if isinstance(node, list) else last]
+        elif self.command == 'POST':
+            node[last].append(payload)
+        else:
+            return self.reply(405, {'error': 'method not allowed'})
+        self.reply(200)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+@pytest.fixture
+def admin(tmp_path):
+    server = FakeAdmin(str(tmp_path / 'admin.sock'))
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    client = AdminClient(f"unix/{tmp_path / 'admin.sock'}")
+    yield server, client
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+def test_changed_route_is_patched_in_place(admin):
+    server, client = admin
+    server.config = config(route('a.com', 'a'), route('b.com', 'b'))
+    new = config(route('a.com', 'a'), route('b.com', 'B'))
+
+    result = client.apply_site('b changed', 'b.com', new)
+    assert result.method == 'patch'
+    assert server.requests == ['GET /config/', 'PATCH /config/apps/http/servers/srv0/routes/1']
+    assert server.config == new
+
+def test_new_route_is_inserted_at_its_position(admin):
+    server, client = admin
+    catch_all = {'handle': [{'handler': 'static_response', 'body': 'fallback'}]}
+    server.config = config(route('a.com', 'a'), catch_all)
+    new = config(route('a.com', 'a'), route('b.com', 'b'), catch_all)
+
+    result = client.apply_site('b added', 'b.com', new)
+    assert result.requests[-1] == 'PUT /config/apps/http/servers/srv0/routes/1'
+    # Ahead of the catch-all, not appended behind it
+    assert server.config == new
+
+def test_removed_route_is_deleted(admin):
+    server, client = admin
+    server.config = config(route('a.com', 'a'), route('b.com', 'b'))
+    new = config(route('a.com', 'a'))
+
+    result = client.apply_site('b removed', 'b.com', new)
+    assert result.requests[-1] == 'DELETE /config/apps/http/servers/srv0/routes/1'
+    assert server.config == new
+
+def test_unchanged_route_is_a_noop(admin):
+    server, client = admin
+    server.config = config(route('a.com', 'a'))
+    result = client.apply_site('same', 'a.com', copy.deepcopy(server.config))
+    assert result.method == 'noop' and server.requests == ['GET /config/']
+
+@pytest.mark.parametrize('new', [
+    # A setting outside the route, e.g. from the site's tls options
+    config(route('a.com', 'a'), route('b.com', 'B'), automatic_https={'disable': True}),
+    # A listener no running server has
+    config(route('a.com', 'a'), route('b.com', 'B'), listen=(':8443',)),
+    # The route moves in front of another one
+    config(route('b.com', 'B'), route('a.com', 'a')),
+])
+def test_anything_beyond_the_route_is_a_full_load(admin, new):
+    server, client = admin
+    server.config = config(route('a.com', 'a'), route('b.com', 'b'))
+    server.adaptations['whole file'] = new
+
+    result = client.apply_site('whole file', 'b.com')
+    assert result.method == 'load'
+    assert server.requests == ['POST /adapt', 'GET /config/', 'POST /load']
+    assert server.config == new
+
+def test_connection_closed_while_idle_is_retried(admin):
+    server, client = admin
+    server.config    = config(route('a.com', 'a'))
+    server.drop_idle = True
+
+    assert client.get_config('apps/http/servers/srv0/listen') == [':80']
+    # The pooled connection is dead now; the request is sent again on a new one
+    assert client.get_config('apps/http/servers/srv0/listen') == [':80']
+    assert server.requests == ['GET /config/apps/http/servers/srv0/listen'] * 2
+
+def test_errors_carry_caddys_message(admin):
+    server, client = admin
+    with pytest.raises(CaddyAdminError, match='unknown Caddyfile') as error:
+        client.load('not adaptable')
+    assert error.value.status == 400
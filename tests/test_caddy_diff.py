@@ -0,0 +1,58 @@
+from tools.caddy.diff import diffSites
+from tools.caddy.management import CaddyTransaction, loadCaddyFile
+from tools.caddy.models import CaddyFile
+
+SOURCE = '''{
+    admin off
+}
+
+http://a.com {
+    handle /api/* {
+        reverse_proxy :8080
+    }
+    handle {
+        file_server
+    }
+}
+
+http://b.com {
+    respond "b"
+}
+'''
+
+def test_reordering_directives_is_a_change():
+    old = CaddyFile.parse_text(SOURCE).sites['a.com']
+    new = old.copy()
+    new.set_directives(list(reversed(new.directives)))
+
+    changes = diffSites(old, new)
+    assert [change.kind for change in changes] == ['reordered']
+    assert changes[0].old == 'handle /api/*, handle' and changes[0].new == 'handle, handle /api/*'
+
+def test_edits_in_place_are_not_reorders():
+    old = CaddyFile.parse_text(SOURCE).sites['a.com']
+    new = old.copy()
+    new.directives[0].subdirectives[0].args = ('localhost:9090',)
+    assert [change.kind for change in diffSites(old, new)] == ['changed']
+
+def test_reorder_only_transaction_is_saved(tmp_path):
+    path = tmp_path / 'Caddyfile'
+    path.write_text(SOURCE)
+
+    with CaddyTransaction(str(path)) as tx:
+        tx.update('a.com', lambda site: site.set_directives(list(reversed(site.directives))))
+
+    assert tx.result is None or tx.result.method != 'noop'
+    assert [change.kind for change in tx.changes] == ['reordered']
+    saved = loadCaddyFile(str(path)).sites['a.com']
+    assert [' '.join([d.name] + list(d.args)) for d in saved.directives] == ['handle', 'handle /api/*']
+
+def test_transaction_without_edits_is_a_noop(tmp_path):
+    path = tmp_path / 'Caddyfile'
+    path.write_text(SOURCE)
+
+    with CaddyTransaction(str(path)) as tx:
+        tx.update('b.com', lambda site: None)
+
+    assert tx.result.method == 'noop' and tx.changes == []
+    assert path.read_text() == SOURCE
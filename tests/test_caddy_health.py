@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+from tools.caddy import health
+from tools.caddy.health import Upstream, probeUpstreams
+
+def test_hanging_upstreams_cost_one_timeout_in_total(monkeypatch):
+    async def hang(host, port):
+        await asyncio.sleep(3600)
+    monkeypatch.setattr(asyncio, 'open_connection', hang)
+    monkeypatch.setattr(health, '_open_file_limit', lambda: 4096)
+
+    upstreams = [Upstream(f'10.0.0.1:{port}', '10.0.0.1', port) for port in range(1000, 1800)]
+    started   = time.perf_counter()
+    results   = probeUpstreams(upstreams, timeout=0.2)
+    elapsed   = time.perf_counter() - started
+
+    assert [result.status for result in results] == ['timeout'] * len(upstreams)
+    assert elapsed < 2 * 0.2
+
+def test_explicit_concurrency_queues_probes(monkeypatch):
+    async def hang(host, port):
+        await asyncio.sleep(3600)
+    monkeypatch.setattr(asyncio, 'open_connection', hang)
+
+    upstreams = [Upstream(f'10.0.0.1:{port}', '10.0.0.1', port) for port in range(1000, 1004)]
+    started   = time.perf_counter()
+    probeUpstreams(upstreams, timeout=0.1, concurrency=2)
+    assert time.perf_counter() - started >= 2 * 0.1
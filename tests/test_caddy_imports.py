@@ -0,0 +1,37 @@
+from tools.caddy.imports import ImportGraph
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+def test_new_file_matching_a_glob_import_is_picked_up(tmp_path):
+    main = tmp_path / 'Caddyfile'
+    write(main, 'import sites/*.caddy\n')
+    write(tmp_path / 'sites' / 'a.caddy', 'http://a.com {\n    respond "a"\n}\n')
+
+    graph = ImportGraph()
+    assert list(graph.expand(str(main)).caddy.sites) == ['a.com']
+    assert graph.refresh() == set()
+
+    write(tmp_path / 'sites' / 'b.caddy', 'http://b.com {\n    respond "b"\n}\n')
+    assert str(main) in graph.refresh()
+    assert list(graph.expand(str(main)).caddy.sites) == ['a.com', 'b.com']
+
+    (tmp_path / 'sites' / 'a.caddy').unlink()
+    graph.refresh()
+    assert list(graph.expand(str(main)).caddy.sites) == ['b.com']
+
+def test_glob_inside_a_block_watches_its_directory(tmp_path):
+    main = tmp_path / 'Caddyfile'
+    write(main, 'http://a.com {\n    import conf.d/*/*.conf\n}\n')
+    write(tmp_path / 'conf.d' / 'x' / 'one.conf', 'encode gzip\n')
+
+    graph = ImportGraph()
+    site  = graph.expand(str(main)).caddy.sites['a.com']
+    assert [d.name for d in site.directives] == ['encode']
+
+    write(tmp_path / 'conf.d' / 'x' / 'two.conf', 'file_server\n')
+    write(tmp_path / 'conf.d' / 'y' / 'three.conf', 'respond "hi"\n')
+    graph.refresh()
+    site = graph.expand(str(main)).caddy.sites['a.com']
+    assert [d.name for d in site.directives] == ['encode', 'file_server', 'respond']
@@ -0,0 +1,35 @@
+from tools.caddy.models import CaddyFile, Directive
+
+CRLF_SOURCE = (
+    '{\r\n    admin unix//tmp/caddy-admin.sock\r\n}\r\n\r\n'
+    'http://a.com {\r\n    respond "hi there" 200\r\n    # comment\r\n}\r\n\r\n'
+    'http://b.com {\r\n    header X-Test "y z"\r\n    root * /srv\r\n}\r\n\r\n'
+    'http://c.com {\r\n    file_server\r\n}\r\n'
+)
+
+def test_crlf_spans_end_at_closing_brace():
+    caddy = CaddyFile.parse_text(CRLF_SOURCE)
+    for site in caddy.sites.values():
+        start, end = site.span
+        assert CRLF_SOURCE[start:].startswith('http://' + site.domain)
+        assert CRLF_SOURCE[end - 1] == '}'
+
+def test_crlf_round_trip(tmp_path):
+    path = tmp_path / 'Caddyfile'
+    path.write_bytes(CRLF_SOURCE.encode('utf-8'))
+
+    caddy = CaddyFile.parse(path)
+    assert caddy.save(path) == CRLF_SOURCE
+
+    caddy.sites['b.com'].add_directive(Directive('encode', ['gzip']))
+    caddy.save(path)
+    text = path.read_bytes().decode('utf-8')
+    assert text == CRLF_SOURCE.replace('    root * /srv\r\n', '    root * /srv\r\n    encode gzip\r\n')
+
+    reloaded = CaddyFile.parse(path)
+    assert [d.name for d in reloaded.sites['b.com'].directives] == ['header', 'root', 'encode']
+    reloaded.sites['a.com'].add_directive(Directive('encode', ['zstd']))
+    reloaded.save(path)
+    text = path.read_bytes().decode('utf-8')
+    assert '\n' not in text.replace('\r\n', '')
+    assert [site.domain for site in CaddyFile.parse(path).sites.values()] == ['a.com', 'b.com', 'c.com']
@@ -0,0 +1,22 @@
+import pytest
+
+from tools.caddy.ports import PortAllocator
+
+@pytest.mark.parametrize('port', [0, -1, 65536, 70000])
+def test_out_of_range_ports_are_rejected(port):
+    ports = PortAllocator()
+    before = bytes(ports.used)
+    with pytest.raises(ValueError, match='between 1 and 65535'):
+        ports.reserve(port)
+    with pytest.raises(ValueError):
+        ports.release(port)
+    # -1 would otherwise have marked port 65535
+    assert bytes(ports.used) == before
+
+def test_reserve_and_release_round_trip():
+    ports = PortAllocator(low=20000, high=20010)
+    ports.reserve(65535)
+    assert not ports.isFree(65535)
+    port = ports.allocate()
+    ports.release(port)
+    assert ports.isFree(port) and ports.allocate() == port
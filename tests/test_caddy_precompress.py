@@ -0,0 +1,37 @@
+import gzip
+import os
+
+from tools.caddy import precompress
+
+def make_root(tmp_path):
+    root = tmp_path / 'site'
+    (root / 'css').mkdir(parents=True)
+    (root / 'index.html').write_text('<p>hello</p>\n' * 200)
+    (root / 'css' / 'app.css').write_text('body { color: red; }\n' * 200)
+    (root / precompress.LEGACY_MANIFEST).write_text('{}')
+    return root
+
+def test_siblings_and_manifest_outside_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(precompress, 'MANIFEST_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(precompress, 'CHUNK_SIZE', 512)
+    root = make_root(tmp_path)
+
+    report = precompress.precompressRoot(str(root), ['gzip'], workers=1)
+    assert report.errors == [] and report.compressed == 2
+    assert gzip.decompress((root / 'index.html.gz').read_bytes()) == (root / 'index.html').read_bytes()
+    assert os.stat(root / 'index.html.gz').st_mtime_ns == os.stat(root / 'index.html').st_mtime_ns
+    assert sorted(os.listdir(root)) == ['css', 'index.html', 'index.html.gz']
+    assert os.path.exists(precompress._manifest_path(str(root)))
+
+    again = precompress.precompressRoot(str(root), ['gzip'], workers=1)
+    assert again.compressed == 0 and again.unchanged == 2
+
+def test_compression_errors_are_reported_per_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(precompress, 'MANIFEST_DIR', str(tmp_path / 'cache'))
+    root = make_root(tmp_path)
+
+    # Without the brotli module every file fails, none of them aborts the run
+    monkeypatch.setattr(precompress, 'brotli', None)
+    report = precompress.precompressRoot(str(root), ['br'], workers=1)
+    assert len(report.errors) == 2 and report.compressed == 0
+    assert not any(name.endswith('.br') or '.tmp' in name for name in os.listdir(root))
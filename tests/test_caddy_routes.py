@@ -0,0 +1,70 @@
+import pytest
+
+from tools.caddy.models import Directive
+from tools.caddy.routes import RouteIndex
+
+def handle(path=None, *children):
+    return Directive('handle', [path] if path else [], list(children))
+
+def index(*paths):
+    return RouteIndex([handle(path) for path in paths])
+
+def paths(routes):
+    return [route.path for route in routes]
+
+def test_exact_path_beside_its_wildcard_is_not_shadowed():
+    conflicts = index('/api/*').conflicts('/api/')
+    assert not conflicts.blocking()
+    assert paths(conflicts.overlaps) == ['/api/*']
+
+def test_wildcard_beside_its_exact_path_does_not_shadow_it():
+    conflicts = index('/api/').conflicts('/api/*')
+    assert not conflicts.blocking()
+    assert paths(conflicts.overlaps) == ['/api/']
+
+def test_exact_path_under_a_longer_prefix_is_shadowed():
+    conflicts = index('/api/*').conflicts('/api/x')
+    assert paths(conflicts.shadowed_by) == ['/api/*']
+    assert conflicts.blocking()
+
+def test_prefix_of_equal_length_goes_after_an_earlier_exact_path():
+    # Same length, so caddy keeps the order of the file and the new route comes last
+    conflicts = index('/a/b').conflicts('/a/*')
+    assert not conflicts.blocking()
+    assert paths(conflicts.overlaps) == ['/a/b']
+
+@pytest.mark.parametrize('matcher', ['/api/*', '@static'])
+def test_duplicates(matcher):
+    routes = RouteIndex([Directive('handle', ['/api/*']), Directive('@static', ['path', '/s/*']),
+                         Directive('handle', ['@static'])])
+    conflicts = routes.conflicts(matcher)
+    assert len(conflicts.duplicates) == 1
+    assert conflicts.describe(matcher) == "Path actually does exist in this site block!"
+
+def test_catch_all_never_conflicts():
+    conflicts = index(None, '/a/*').conflicts('/a/b')
+    assert paths(conflicts.shadowed_by) == ['/a/*']
+    assert paths(conflicts.overlaps) == []
+
+def test_prefix_overlaps_globs_and_prefixes_around_it():
+    conflicts = index('/a/*', '/a/b/*.js', '/a/b/c').conflicts('/a/b/*')
+    assert sorted(paths(conflicts.overlaps)) == ['/a/*', '/a/b/*.js', '/a/b/c']
+    assert not conflicts.blocking()
+
+def test_lookup_prefers_exact_path_over_its_wildcard():
+    routes = index('/api/*', '/api/', None)
+    assert paths(routes.lookup('/api/')) == ['/api/']
+    assert paths(routes.lookup('/api/users')) == ['/api/*']
+    assert paths(routes.lookup('/other')) == ['']
+
+def test_lookup_follows_nested_handle_path():
+    routes = RouteIndex([Directive('handle_path', ['/app/*'], [handle('/static/*')])])
+    assert paths(routes.lookup('/app/static/x.css')) == ['/app/*', '/app/static/*']
+
+def test_removed_route_no_longer_conflicts():
+    directive = handle('/api/*')
+    routes    = RouteIndex([directive])
+    routes.remove(directive)
+    assert len(routes) == 0
+    assert not routes.root.children
+    assert not routes.conflicts('/api/x').shadowed_by
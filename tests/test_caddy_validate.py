@@ -0,0 +1,90 @@
+import os
+import stat
+
+import pytest
+
+from tools.caddy import validate
+from tools.caddy.models import CaddyFile
+
+# Rejects any config mentioning "bogus_directive" and counts its runs
+STUB_CADDY = """#!/bin/sh
+echo run >> "$STUB_CADDY_LOG"
+config=""
+while [ $# -gt 0 ]; do
+    [ "$1" = "--config" ] && config="$2"
+    shift
+done
+if grep -q bogus_directive "$config"; then
+    echo "Error: unrecognized directive: bogus_directive" >&2
+    exit 1
+fi
+echo '{"apps": {}}'
+"""
+
+@pytest.fixture
+def stub_caddy(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'stubbin'
+    bin_dir.mkdir()
+    caddy = bin_dir / 'caddy'
+    caddy.write_text(STUB_CADDY)
+    caddy.chmod(caddy.stat().st_mode | stat.S_IEXEC)
+    log = tmp_path / 'runs.log'
+    log.touch()
+
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv('STUB_CADDY_LOG', str(log))
+    monkeypatch.setattr(validate, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(validate, '_results', {})
+    monkeypatch.setattr(validate, '_site_verdicts', {})
+    monkeypatch.setattr(validate, '_site_verdicts_loaded', False)
+    monkeypatch.setattr(validate, '_recent', {})
+    return lambda: len(log.read_text().splitlines())
+
+def caddyfile(count: int, broken=()) -> str:
+    blocks = []
+    for i in range(count):
+        body = 'bogus_directive' if i in broken else f'respond "site {i}"'
+        blocks.append(f'http://site{i}.example {{\n    {body}\n}}\n')
+    return '{\n    admin off\n}\n\n' + '\n'.join(blocks)
+
+def test_valid_result_is_cached(stub_caddy, tmp_path):
+    text = caddyfile(4)
+    result = validate.validateCaddyfile(text, str(tmp_path), CaddyFile.parse_text(text))
+    assert result.valid and result.adapted == {'apps': {}}
+    assert stub_caddy() == 1
+
+    validate._results.clear()
+    again = validate.validateCaddyfile(text, str(tmp_path), CaddyFile.parse_text(text))
+    assert again.valid and again.cached
+    assert stub_caddy() == 1
+
+def test_broken_site_is_found_by_bisection(stub_caddy, tmp_path):
+    text = caddyfile(32, broken={21})
+    result = validate.validateCaddyfile(text, str(tmp_path), CaddyFile.parse_text(text))
+    assert not result.valid
+    assert result.sites == ['site21.example']
+    # One run for the file, two per halving instead of one per site
+    assert stub_caddy() <= 1 + 2 * 5
+
+def test_blame_work_is_capped(stub_caddy, tmp_path, monkeypatch):
+    monkeypatch.setattr(validate, 'MAX_BLAME_RUNS', 4)
+    text = caddyfile(64, broken=set(range(64)))
+    validate.validateCaddyfile(text, str(tmp_path), CaddyFile.parse_text(text))
+    assert stub_caddy() == 1 + 4
+
+def test_failures_are_not_cached_across_runs(stub_caddy, tmp_path):
+    text = caddyfile(8, broken={3})
+    validate.validateCaddyfile(text, str(tmp_path), CaddyFile.parse_text(text))
+    first = stub_caddy()
+
+    # Same process: the failure is remembered
+    assert not validate.validateCaddyfile(text, str(tmp_path), CaddyFile.parse_text(text)).valid
+    assert stub_caddy() == first
+
+    # A new process re-checks the file, but only the blocks not known good
+    validate._results.clear()
+    validate._site_verdicts.clear()
+    validate._site_verdicts_loaded = False
+    result = validate.validateCaddyfile(text, str(tmp_path), CaddyFile.parse_text(text))
+    assert result.sites == ['site3.example']
+    assert stub_caddy() == first + 2
@@ -0,0 +1,35 @@
+import pytest
+
+from tools.caddy import watch
+from tools.caddy.admin import ApplyResult
+
+SOURCE = '{\n    admin off\n}\n\nhttp://a.com {\n    respond "hi"\n}\n'
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    path = tmp_path / 'Caddyfile'
+    path.write_text(SOURCE)
+    # As on a host without the caddy binary
+    monkeypatch.setattr(watch, 'validateCaddyfile', lambda *args: None)
+    watcher = watch.CaddyfileWatcher(path)
+    yield watcher
+    watcher.close()
+
+def test_admin_off_is_not_counted_as_a_reload(watcher):
+    report = watcher.reload(3, [watcher.path])
+    assert report.result is None and report.error is None
+    assert not report.applied
+    assert watcher.reloads == 0
+    assert watcher.reload(1, [watcher.path]).skipped
+
+def test_failed_apply_is_an_error_and_retried(watcher, monkeypatch):
+    monkeypatch.setattr(watch, 'applyCaddyFile', lambda caddy, text: ApplyResult('error', error='connection refused'))
+    report = watcher.reload(3, [watcher.path])
+    assert not report.applied
+    assert 'connection refused' in report.error
+    assert watcher.reloads == 0
+
+    monkeypatch.setattr(watch, 'applyCaddyFile', lambda caddy, text: ApplyResult('load', ['POST /load']))
+    report = watcher.reload(1, [watcher.path])
+    assert not report.skipped and report.applied
+    assert watcher.reloads == 1
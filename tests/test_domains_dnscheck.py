@@ -0,0 +1,116 @@
+import ipaddress
+import socket
+import struct
+import threading
+
+import pytest
+
+from tools.domains.dnscheck import (A, AAAA, CNAME, TXT, _decode_name, _encode_name, checkDomain, checkDomains)
+from tools.domains.templates import NEST_IPV4, NEST_IPV6
+
+USER = 'alice'
+ZONE = {
+    'good-cname.test': {CNAME: ['alice.hackclub.app']},
+    'wrong-cname.test': {CNAME: ['bob.hackclub.app']},
+    'apex.test': {A: [NEST_IPV4], AAAA: [NEST_IPV6], TXT: ['v=spf1 -all', 'domain-verification=alice']},
+    'no-txt.test': {A: [NEST_IPV4], AAAA: [NEST_IPV6], TXT: ['domain-verification=bob']},
+    'wrong-a.test': {A: ['192.0.2.1'], TXT: ['domain-verification=alice']},
+    # Over 512 bytes, so the UDP answer is truncated and retried over TCP
+    'big-txt.test': {A: [NEST_IPV4], AAAA: [NEST_IPV6], TXT: ['x' * 200] * 4 + ['domain-verification=alice']},
+    # Unicode names live in DNS in their ASCII form: bücher.test and café.test
+    'xn--bcher-kva.test': {CNAME: ['alice.hackclub.app']},
+    'xn--caf-dma.test': {A: [NEST_IPV4], AAAA: [NEST_IPV6], TXT: ['domain-verification=alice']},
+    'alice.hackclub.app': {A: [NEST_IPV4], TXT: ['domain-verification=someone-else']},
+}
+
+def answer(query: bytes, tcp: bool = False) -> bytes:
+    qid = struct.unpack_from('!H', query)[0]
+    name, offset = _decode_name(query, 12)
+    qtype = struct.unpack_from('!H', query, offset)[0]
+    records, current, rcode = [], name, 0
+    while True:
+        zone = ZONE.get(current)
+        if zone is None:
+            rcode = 3 if current == name else 0
+            break
+        if CNAME in zone and qtype != CNAME:
+            records.append((current, CNAME, zone[CNAME][0]))
+            current = zone[CNAME][0]
+            continue
+        records += [(current, qtype, value) for value in zone.get(qtype, [])]
+        break
+
+    body = b''
+    for owner, rtype, value in records:
+        if rtype == A:
+            rdata = ipaddress.IPv4Address(value).packed
+        elif rtype == AAAA:
+            rdata = ipaddress.IPv6Address(value).packed
+        elif rtype == CNAME:
+            rdata = _encode_name(value)
+        else:
+            rdata = bytes([len(value)]) + value.encode()
+        body += _encode_name(owner) + struct.pack('!HHIH', rtype, 1, 60, len(rdata)) + rdata
+    question = query[12:offset + 4]
+    message  = struct.pack('!HHHHHH', qid, 0x8180 | rcode, 1, len(records), 0, 0) + question + body
+    if not tcp and len(message) > 512:
+        message = struct.pack('!HHHHHH', qid, 0x8380, 1, 0, 0, 0) + question
+    return message
+
+@pytest.fixture(scope='module')
+def nameserver():
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(('127.0.0.1', 0))
+    port = udp.getsockname()[1]
+    tcp = socket.socket()
+    tcp.bind(('127.0.0.1', port))
+    tcp.listen()
+
+    def serve_udp():
+        while True:
+            query, addr = udp.recvfrom(4096)
+            udp.sendto(answer(query), addr)
+
+    def serve_tcp():
+        while True:
+            conn, _ = tcp.accept()
+            with conn:
+                length = struct.unpack('!H', conn.recv(2))[0]
+                message = answer(conn.recv(length), tcp=True)
+                conn.sendall(struct.pack('!H', len(message)) + message)
+
+    threading.Thread(target=serve_udp, daemon=True).start()
+    threading.Thread(target=serve_tcp, daemon=True).start()
+    yield [('127.0.0.1', port)]
+    udp.close()
+    tcp.close()
+
+def test_records_are_checked_in_one_batch(nameserver):
+    names   = ['good-cname.test', 'wrong-cname.test', 'apex.test', 'no-txt.test', 'wrong-a.test', 'big-txt.test', 'missing.test']
+    results = {result.domain: result for result in checkDomains(names, USER, nameservers=nameserver)}
+
+    assert all(result.error is None for result in results.values())
+    assert results['good-cname.test'].verified
+    assert results['apex.test'].verified
+    assert results['big-txt.test'].verified
+    assert not results['wrong-cname.test'].verified
+    assert any('domain-verification=alice is missing' in problem for problem in results['no-txt.test'].problems)
+    assert any('192.0.2.1' in problem for problem in results['wrong-a.test'].problems)
+    assert not results['wrong-a.test'].verified and results['wrong-a.test'].warnings
+    assert not results['missing.test'].exists
+
+@pytest.mark.parametrize('name', ['bücher.test', 'Café.test'])
+def test_unicode_domains_match_their_ascii_records(nameserver, name):
+    result = checkDomain(name, USER, nameservers=nameserver)
+    assert result.error is None and result.exists
+    assert result.verified, result.problems
+
+@pytest.mark.parametrize('name', ['bad..test', 'a' * 64 + '.test', '․bad.test', 'xn--é.test'])
+def test_invalid_names_are_reported_not_raised(nameserver, name):
+    result = checkDomain(name, USER, nameservers=nameserver)
+    assert result.error is None and not result.verified
+    assert result.problems and 'Invalid domain name' in result.problems[0]
+
+def test_unreachable_nameserver_is_an_error():
+    result = checkDomain('apex.test', USER, nameservers=[('127.0.0.1', 9)], timeout=0.2)
+    assert result.error is not None and not result.verified
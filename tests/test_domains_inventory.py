@@ -0,0 +1,46 @@
+import os
+import stat
+
+import pytest
+
+from tools.domains import inventory
+
+# Prints the domain list, or fails while $STUB_NEST_FAIL exists; counts its runs
+STUB_NEST = """#!/bin/sh
+echo run >> "$STUB_NEST_LOG"
+if [ -e "$STUB_NEST_FAIL" ]; then
+    echo "nest: could not reach the API" >&2
+    exit 1
+fi
+echo "- example.com (/home/alice/.example.com.webserver.sock)"
+"""
+
+@pytest.fixture
+def stub_nest(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'stubbin'
+    bin_dir.mkdir()
+    nest = bin_dir / 'nest'
+    nest.write_text(STUB_NEST)
+    nest.chmod(nest.stat().st_mode | stat.S_IEXEC)
+    log = tmp_path / 'runs.log'
+    log.touch()
+
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv('STUB_NEST_LOG', str(log))
+    monkeypatch.setenv('STUB_NEST_FAIL', str(tmp_path / 'fail'))
+    monkeypatch.setattr(inventory, '_inventory', None)
+    return tmp_path / 'fail', lambda: len(log.read_text().splitlines())
+
+def test_failed_listing_is_not_cached(stub_nest):
+    fail, runs = stub_nest
+    fail.touch()
+    broken = inventory.domainInventory(with_sites=False)
+    assert broken.domains == [] and 'could not reach the API' in broken.error
+    assert inventory.domainInventory(with_sites=False).error
+    assert runs() == 2
+
+    fail.unlink()
+    listed = inventory.domainInventory(with_sites=False)
+    assert [domain.name for domain in listed.domains] == ['example.com'] and listed.error is None
+    assert inventory.domainInventory(with_sites=False) is listed
+    assert runs() == 3
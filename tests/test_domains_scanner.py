@@ -0,0 +1,80 @@
+import asyncio
+import datetime
+import os
+import ssl
+import threading
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from tools.domains import scanner
+
+# Days until each stand-in certificate expires; negative is already expired
+CERTIFICATES = {'fresh.example.test': 80, 'soon.example.test': 3, 'expired.example.test': -2}
+
+def make_certificate(directory, name: str, days: int):
+    key  = ec.generate_private_key(ec.SECP256R1())
+    now  = datetime.datetime.now(datetime.timezone.utc)
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    cert = (x509.CertificateBuilder().subject_name(subject).issuer_name(subject)
+            .public_key(key.public_key()).serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=30))
+            .not_valid_after(now + datetime.timedelta(days=days))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(name)]), False)
+            .sign(key, hashes.SHA256()))
+    cert_path = directory / f'{name}.pem'
+    key_path  = directory / f'{name}.key'
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return str(cert_path), str(key_path)
+
+@pytest.fixture(scope='module')
+def tls_servers(tmp_path_factory):
+    """A local TLS listener per domain, serving a self-signed certificate."""
+    directory = tmp_path_factory.mktemp('tls')
+    loop      = asyncio.new_event_loop()
+    targets   = {}
+
+    async def start():
+        servers = []
+        for name, days in CERTIFICATES.items():
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ctx.load_cert_chain(*make_certificate(directory, name, days))
+            server = await asyncio.start_server(lambda reader, writer: writer.close(), '127.0.0.1', 0, ssl=ctx)
+            targets[name] = ('127.0.0.1', server.sockets[0].getsockname()[1])
+            servers.append(server)
+        return servers
+
+    servers = loop.run_until_complete(start())
+    thread  = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield targets
+    for server in servers:
+        loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+def test_scan_reads_certificates_and_caches_them(tls_servers, tmp_path):
+    cache   = tmp_path / 'cache' / 'certificates.json'
+    names   = list(CERTIFICATES) + ['closed.example.test']
+    targets = dict(tls_servers, **{'closed.example.test': ('127.0.0.1', 9)})
+
+    results = {r.domain: r for r in scanner.scanCertificates(names, timeout=2, targets=targets,
+                                                              cache_path=str(cache), offline=False)}
+    for name, days in CERTIFICATES.items():
+        assert results[name].info is not None
+        assert abs(results[name].days_left - days) < 0.1
+        # Self-signed, so verification fails but the certificate is still read
+        assert results[name].error
+    assert results['closed.example.test'].info is None and results['closed.example.test'].error
+
+    expiring = scanner.expiringWithin(list(results.values()), 14)
+    assert [r.domain for r in expiring] == ['expired.example.test', 'soon.example.test', 'closed.example.test']
+
+    assert cache.exists() and not [name for name in os.listdir(cache.parent) if name != cache.name]
+    again = scanner.scanCertificates(names, timeout=2, targets=targets, cache_path=str(cache), offline=False)
+    assert all(result.cached for result in again)
@@ -0,0 +1,218 @@
+import http.client
+import json
+import queue
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+class CaddyAdminError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Caddy admin API returned {status}: {message}")
+        self.status  = status
+        self.message = message
+
+@dataclass
+class ApplyResult:
+    method: str                      # 'patch', 'load', 'noop' or 'error'
+    requests: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+def _route_hosts(route: dict) -> List[str]:
+    hosts = []
+    for matcher in route.get('match', []):
+        hosts.extend(matcher.get('host', []))
+    return hosts
+
+def _servers(config: Optional[dict]) -> dict:
+    return ((config or {}).get('apps') or {}).get('http', {}).get('servers') or {}
+
+def _find_route(servers: dict, domain: str) -> Optional[Tuple[str, int, dict]]:
+    for name, server in servers.items():
+        for index, route in enumerate(server.get('routes', [])):
+            if domain in _route_hosts(route):
+                return name, index, route
+    return None
+
+def _without_route(config: Optional[dict], found: Optional[Tuple[str, int, dict]]) -> dict:
+    """`config` with the route `found` points at left out, copying only along the way to it."""
+    config = config or {}
+    if found is None:
+        return config
+    name, index, _ = found
+    apps    = dict(config['apps'])
+    http    = dict(apps['http'])
+    servers = dict(http['servers'])
+    server  = dict(servers[name])
+    routes  = list(server['routes'])
+    del routes[index]
+    server['routes'] = routes
+    servers[name]    = server
+    http['servers']  = servers
+    apps['http']     = http
+    return dict(config, apps=apps)
+
+class AdminClient:
+    """
+    Client for Caddy's admin API, over a unix socket (`unix//path/to.sock`)
+    or TCP (`localhost:2019`). Idle keep-alive connections are pooled, so
+    back-to-back calls skip the connect.
+    """
+    def __init__(self, address: str, pool_size: int = 4, timeout: float = 10.0):
+        if not address or address.split()[0] == 'off':
+            raise ValueError("The Caddy admin endpoint is disabled.")
+
+        address = address.split()[0]
+        if address.startswith('unix/'):
+            self.socket_path = address[len('unix/'):].split('|')[0]
+            self.host        = None
+            # Caddy only accepts an empty Host header on unix sockets
+            self.headers     = {'Host': ''}
+        else:
+            self.socket_path = None
+            self.host        = address.replace('http://', '').replace('tcp/', '')
+            self.headers     = {}
+
+        self.timeout = timeout
+        self.pool    = queue.LifoQueue(maxsize=pool_size)
+
+    @staticmethod
+    def from_caddyfile(caddy) -> 'AdminClient':
+        return AdminClient(caddy.admin or 'localhost:2019')
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path, self.timeout)
+        return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None, content_type: str = 'application/json') -> Tuple[int, bytes]:
+        headers = dict(self.headers)
+        if body is not None:
+            headers['Content-Type'] = content_type
+
+        # A pooled connection may have been closed by Caddy while idle, so a
+        # failure on a reused connection is retried once on a fresh one
+        for attempt in range(2):
+            try:
+                conn   = self.pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                conn   = self._connect()
+                reused = False
+
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data     = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                try:
+                    self.pool.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+
+            if response.status >= 400:
+                try:
+                    message = json.loads(data).get('error', data.decode('utf-8', 'replace'))
+                except ValueError:
+                    message = data.decode('utf-8', 'replace')
+                raise CaddyAdminError(response.status, message.strip())
+            return response.status, data
+
+    def request_json(self, method: str, path: str, payload: Any = None) -> Any:
+        body    = None if payload is None else json.dumps(payload).encode('utf-8')
+        _, data = self.request(method, path, body)
+        return json.loads(data) if data.strip() else None
+
+    def get_config(self, path: str = '') -> Any:
+        return self.request_json('GET', '/config/' + path.strip('/'))
+
+    def adapt(self, caddyfile_text: str) -> dict:
+        _, data = self.request('POST', '/adapt', caddyfile_text.encode('utf-8'), 'text/caddyfile')
+        adapted = json.loads(data)
+        return adapted.get('result', adapted)
+
+    def load(self, caddyfile_text: str) -> ApplyResult:
+        started = time.perf_counter()
+        self.request('POST', '/load', caddyfile_text.encode('utf-8'), 'text/caddyfile')
+        return ApplyResult('load', ['POST /load'], time.perf_counter() - started)
+
+    def apply_site(self, caddyfile_text: str, domain: str, adapted: Optional[dict] = None) -> ApplyResult:
+        """
+        Apply one site's change to the running server with a targeted PATCH,
+        PUT or DELETE on its route. That is only done when the rest of the
+        config stays exactly as it runs, the route keeps its position (Caddy
+        tries routes in order) and its server; anything else (a new
+        listener, site-wide TLS settings, routes shifting) is one /load.
+        Pass the already adapted JSON to skip the /adapt round trip.
+        """
+        started  = time.perf_counter()
+        requests = ['GET /config/']
+        if adapted is None:
+            requests.insert(0, 'POST /adapt')
+            adapted = self.adapt(caddyfile_text)
+        running  = self.get_config() or {}
+        target   = _find_route(_servers(adapted), domain)
+        current  = _find_route(_servers(running), domain)
+
+        def done(method: str, *extra: str) -> ApplyResult:
+            return ApplyResult(method, requests + list(extra), time.perf_counter() - started)
+
+        in_place = current is None or target is None or current[:2] == target[:2]
+        if not in_place or _without_route(adapted, target) != _without_route(running, current):
+            self.request('POST', '/load', caddyfile_text.encode('utf-8'), 'text/caddyfile')
+            return done('load', 'POST /load')
+
+        if target is None and current is None:
+            return done('noop')
+
+        if target is None:
+            name, index, _ = current
+            path = f"/config/apps/http/servers/{name}/routes/{index}"
+            self.request('DELETE', path)
+            return done('patch', f"DELETE {path}")
+
+        name, index, route = target
+        path = f"/config/apps/http/servers/{name}/routes/{index}"
+        if current is None:
+            # PUT on an array index inserts there, ahead of any broader route after it
+            self.request_json('PUT', path, route)
+            return done('patch', f"PUT {path}")
+
+        if current[2] == route:
+            return done('noop')
+        self.request_json('PATCH', path, route)
+        return done('patch', f"PATCH {path}")
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
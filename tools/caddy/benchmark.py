@@ -0,0 +1,65 @@
+import gc
+import sys
+import time
+import tracemalloc
+
+from .models import CaddyFile
+
+def generateCaddyfile(sites: int) -> str:
+    blocks = ["{\n    admin unix//home/nest/caddy-admin.sock\n}\n"]
+    for i in range(sites):
+        blocks.append(
+            f"http://site{i}.nest.hackclub.app {{\n"
+            f"    bind unix//home/nest/.site{i}.webserver.sock|777\n"
+            f"    root * /home/nest/sites/{i}/dist\n"
+            f"    handle /api/* {{\n"
+            f"        reverse_proxy :{20000 + i % 40000}\n"
+            f"    }}\n"
+            f"    handle_path /static/* {{\n"
+            f"        root * \"/home/nest/sites/{i}/static files\"\n"
+            f"        file_server\n"
+            f"    }}\n"
+            f"    # generated route\n"
+            f"    encode gzip\n"
+            f"}}\n"
+        )
+    return "\n".join(blocks)
+
+def timeIt(func, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def benchParse(sites: int = 10000):
+    text    = generateCaddyfile(sites)
+    elapsed = timeIt(lambda: CaddyFile.parse_text(text))
+    size_mb = len(text.encode('utf-8')) / (1024 * 1024)
+
+    print(f"parse: {sites} sites, {size_mb:.1f} MiB in {elapsed * 1000:.1f} ms "
+          f"({sites / elapsed:,.0f} sites/s, {size_mb / elapsed:.1f} MiB/s)")
+
+def countDirectives(directives) -> int:
+    return sum(1 + countDirectives(d.subdirectives) for d in directives)
+
+def benchMemory(directives: int = 50000):
+    # Each generated site holds 7 directives, nested ones included
+    text = generateCaddyfile(directives // 7 + 1)
+
+    gc.collect()
+    tracemalloc.start()
+    caddy    = CaddyFile.parse_text(text)
+    gc.collect()
+    used, _  = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = sum(countDirectives(site.directives) for site in caddy.sites.values())
+    print(f"memory: {count} directives in {len(caddy.sites)} sites, {used / (1024 * 1024):.1f} MiB "
+          f"({used / count:.0f} bytes/directive)")
+
+if __name__ == "__main__":
+    # python -m tools.caddy.benchmark [sites] [directives]
+    benchParse(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
+    benchMemory(int(sys.argv[2]) if len(sys.argv) > 2 else 50000)
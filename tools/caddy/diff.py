@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .models import CaddyFile, Directive, SiteBlock, SharedSites
+
+@dataclass
+class Change:
+    kind: str                        # 'added', 'removed', 'changed' or 'reordered'
+    path: str                        # e.g. "example.com > handle /api/*"
+    old: Optional[str] = None
+    new: Optional[str] = None
+
+    def __str__(self):
+        if self.kind == 'added':
+            return f"+ {self.path}: {self.new}"
+        if self.kind == 'removed':
+            return f"- {self.path}: {self.old}"
+        if self.kind == 'reordered':
+            return f"↕ {self.path}: {self.old} → {self.new}"
+        return f"~ {self.path}: {self.old} → {self.new}"
+
+def _label(directive: Directive) -> str:
+    return ' '.join([directive.name] + list(directive.args))
+
+def _address(site: SiteBlock) -> str:
+    return ', '.join(site.addresses or [f"http://{site.domain}"])
+
+def _key(directive: Directive):
+    return (directive.name, directive.args[0] if directive.args else None)
+
+def diffDirectives(old: List[Directive], new: List[Directive], path: str, memo: Optional[dict] = None) -> List[Change]:
+    """
+    Compare two directive lists by subtree hash. Identical subtrees are
+    matched by hash and never descended into; what is left is paired by name
+    and first argument, and only those pairs are compared further. Caddy
+    runs some directives (handle, route) in the order written, so matched
+    directives that swap places are reported as reordered.
+    """
+    memo    = {} if memo is None else memo
+    changes = []
+    pairs   = []        # (old, new) directives matched or paired up
+
+    unmatched: Dict[bytes, List[Directive]] = {}
+    for directive in old:
+        unmatched.setdefault(directive.digest(memo), []).append(directive)
+
+    added = []
+    for directive in new:
+        same = unmatched.get(directive.digest(memo))
+        if same:
+            pairs.append((same.pop(0), directive))
+        else:
+            added.append(directive)
+
+    removed = [d for d in old if d in unmatched.get(d.digest(memo), ())]
+
+    # Pair what is left by name and first argument, then by name alone
+    for key in (_key, lambda directive: directive.name):
+        by_key: Dict[object, List[Directive]] = {}
+        for directive in removed:
+            by_key.setdefault(key(directive), []).append(directive)
+
+        unpaired = []
+        for directive in added:
+            counterpart = by_key.get(key(directive))
+            if not counterpart:
+                unpaired.append(directive)
+                continue
+
+            before = counterpart.pop(0)
+            removed.remove(before)
+            pairs.append((before, directive))
+            label  = _label(directive)
+            if before.args != directive.args:
+                changes.append(Change('changed', path, old=_label(before), new=label))
+            changes.extend(diffDirectives(before.subdirectives, directive.subdirectives, f"{path} > {label}", memo))
+        added = unpaired
+
+    changes.extend(Change('added', path, new=_label(directive)) for directive in added)
+    changes.extend(Change('removed', path, old=_label(directive)) for directive in removed)
+
+    old_index = {id(directive): index for index, directive in enumerate(old)}
+    new_index = {id(directive): index for index, directive in enumerate(new)}
+    by_old    = sorted(pairs, key=lambda pair: old_index[id(pair[0])])
+    by_new    = sorted(pairs, key=lambda pair: new_index[id(pair[1])])
+    if by_old != by_new:
+        changes.append(Change('reordered', path,
+                              old=', '.join(_label(before) for before, _ in by_old),
+                              new=', '.join(_label(before) for before, _ in by_new)))
+    return changes
+
+def diffSites(old: Optional[SiteBlock], new: Optional[SiteBlock], memo: Optional[dict] = None) -> List[Change]:
+    memo = {} if memo is None else memo
+
+    if old is None and new is None:
+        return []
+    if old is None:
+        return [Change('added', new.domain, new=_address(new))]
+    if new is None:
+        return [Change('removed', old.domain, old=_address(old))]
+    if old is new or old.digest(memo) == new.digest(memo):
+        return []
+
+    changes = []
+    if _address(old) != _address(new):
+        changes.append(Change('changed', new.domain, old=_address(old), new=_address(new)))
+    if old.bind != new.bind:
+        changes.append(Change('changed', f"{new.domain} > bind", old=old.bind, new=new.bind))
+    changes.extend(diffDirectives(old.directives, new.directives, new.domain, memo))
+    return changes
+
+def _peek(sites: dict, domain: str) -> Optional[SiteBlock]:
+    return sites.peek(domain) if isinstance(sites, SharedSites) else sites.get(domain)
+
+def diffCaddyFiles(old: CaddyFile, new: CaddyFile) -> List[Change]:
+    """
+    Every site-level change between two trees. Blocks that are the same
+    object (untouched copy-on-access views) or hash the same are skipped.
+    """
+    memo    = {}
+    changes = []
+
+    if old.render_header() != new.render_header():
+        changes.append(Change('changed', '(global options, snippets, imports)'))
+
+    for domain in old.sites:
+        changes.extend(diffSites(_peek(old.sites, domain), _peek(new.sites, domain), memo))
+    for domain in new.sites:
+        if domain not in old.sites:
+            changes.extend(diffSites(None, _peek(new.sites, domain), memo))
+    return changes
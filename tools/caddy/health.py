@@ -0,0 +1,151 @@
+import asyncio
+import resource
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .models import CaddyFile, Directive
+from .routes import routeMatcher
+
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'h2c': 80}
+
+@dataclass
+class Upstream:
+    target: str                      # as written in the Caddyfile
+    host: Optional[str] = None
+    port: Optional[int] = None
+    socket_path: Optional[str] = None
+    used_by: List[str] = field(default_factory=list)   # "example.com > handle /api/*"
+
+    @property
+    def address(self) -> str:
+        return f"unix/{self.socket_path}" if self.socket_path else f"{self.host}:{self.port}"
+
+@dataclass
+class ProbeResult:
+    upstream: Upstream
+    status: str                      # 'up', 'down', 'timeout' or 'skipped'
+    latency: Optional[float] = None
+    error: Optional[str] = None
+
+def parseUpstream(target: str) -> Optional[Upstream]:
+    """
+    Resolve a reverse_proxy upstream to something we can connect to, or None
+    for placeholders and SRV/dynamic upstreams that are only known at runtime.
+    """
+    if '{' in target:
+        return None
+
+    if target.startswith('unix/'):
+        return Upstream(target, socket_path=target[len('unix/'):].split('|')[0])
+
+    scheme, _, rest = target.rpartition('://')
+    default_port    = DEFAULT_PORTS.get(scheme or 'http', 80)
+    hostport        = rest.split('/')[0]
+
+    if hostport.startswith('['):
+        host, _, port = hostport[1:].partition(']')
+        port          = port.lstrip(':')
+    elif hostport.count(':') == 1:
+        host, port = hostport.split(':')
+    else:
+        host, port = hostport, ''
+
+    try:
+        port = int(port) if port else default_port
+    except ValueError:
+        # Port ranges such as `localhost:8001-8006` are not probed
+        return None
+    return Upstream(target, host or 'localhost', port)
+
+def _targets(directive: Directive) -> List[str]:
+    args = list(directive.args)
+    if args and routeMatcher(directive) != '':
+        args = args[1:]
+
+    for sub in directive.subdirectives:
+        if sub.name == 'to':
+            args.extend(sub.args)
+    return args
+
+def collectUpstreams(caddy: CaddyFile) -> List[Upstream]:
+    """
+    Every reverse_proxy upstream in the Caddyfile, nested handle blocks
+    included, deduplicated by address and annotated with where it is used.
+    """
+    upstreams: Dict[str, Upstream] = {}
+
+    for site in dict.values(caddy.sites):
+        stack = [(directive, site.domain) for directive in reversed(site.directives)]
+        while stack:
+            directive, path = stack.pop()
+
+            if directive.name == 'reverse_proxy':
+                for target in _targets(directive):
+                    upstream = parseUpstream(target)
+                    key      = upstream.address if upstream else target
+                    upstreams.setdefault(key, upstream or Upstream(target)).used_by.append(path)
+                continue
+
+            label = f"{path} > {' '.join([directive.name] + list(directive.args))}"
+            stack.extend((sub, label) for sub in reversed(directive.subdirectives))
+
+    return list(upstreams.values())
+
+async def _probe(upstream: Upstream, timeout: float, limit: asyncio.Semaphore) -> ProbeResult:
+    if upstream.port is None and upstream.socket_path is None:
+        return ProbeResult(upstream, 'skipped', error="resolved at runtime")
+
+    async with limit:
+        started = time.perf_counter()
+        try:
+            if upstream.socket_path:
+                connect = asyncio.open_unix_connection(upstream.socket_path)
+            else:
+                connect = asyncio.open_connection(upstream.host, upstream.port)
+            _, writer = await asyncio.wait_for(connect, timeout)
+        except asyncio.TimeoutError:
+            return ProbeResult(upstream, 'timeout', timeout, f"no answer within {timeout:g}s")
+        except OSError as e:
+            return ProbeResult(upstream, 'down', time.perf_counter() - started, e.strerror or str(e))
+
+        latency = time.perf_counter() - started
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return ProbeResult(upstream, 'up', latency)
+
+def _open_file_limit() -> int:
+    try:
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (OSError, ValueError):
+        return 1024
+
+async def probeUpstreamsAsync(upstreams: List[Upstream], timeout: float = 2.0,
+                              concurrency: Optional[int] = None) -> List[ProbeResult]:
+    if concurrency is None:
+        # Every probe in flight at once, leaving file descriptors for the rest of the process
+        concurrency = min(len(upstreams), _open_file_limit() // 2)
+    limit = asyncio.Semaphore(max(concurrency, 1))
+    return await asyncio.gather(*(_probe(upstream, timeout, limit) for upstream in upstreams))
+
+def probeUpstreams(upstreams: List[Upstream], timeout: float = 2.0, concurrency: Optional[int] = None) -> List[ProbeResult]:
+    """
+    TCP/unix-socket connect to every upstream at once, so the whole run
+    takes about one `timeout` however many of them hang. Only past half
+    the open-file limit, or with a smaller `concurrency`, do probes wait
+    for a free slot, and the run can take a multiple of `timeout`.
+    """
+    return asyncio.run(probeUpstreamsAsync(upstreams, timeout, concurrency))
+
+def formatProbeTable(results: List[ProbeResult]) -> List[str]:
+    rows = [("STATUS", "UPSTREAM", "LATENCY", "USED BY")]
+    for result in sorted(results, key=lambda r: (r.status == 'up', r.upstream.target)):
+        latency = f"{result.latency * 1000:.1f} ms" if result.latency is not None else "-"
+        detail  = f" ({result.error})" if result.error else ""
+        rows.append((result.status + detail, result.upstream.target, latency, ", ".join(result.upstream.used_by)))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(3)]
+    return [f"{row[0]:<{widths[0]}}  {row[1]:<{widths[1]}}  {row[2]:>{widths[2]}}  {row[3]}" for row in rows]
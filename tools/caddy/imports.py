@@ -0,0 +1,254 @@
+import glob
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from .models import CaddyFile, Directive, SiteBlock, _strip_scheme
+
+_ARG_RE = re.compile(r'\{args(?:\[(\d+)\]|\.(\d+)|\[:\])\}')
+# Imported files that hold directives rather than sites are parsed as a snippet
+_FRAGMENT = '__imported'
+
+@dataclass
+class Expansion:
+    """A file with every import resolved; a read-only view over cached parses."""
+    caddy: CaddyFile
+    files: Set[str] = field(default_factory=set)          # every file it was built from
+    origins: Dict[str, str] = field(default_factory=dict)  # site domain -> file defining it
+
+def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+def _substitute(directives: List[Directive], args: Tuple[str, ...]) -> List[Directive]:
+    def replace(arg: str) -> str:
+        def one(match):
+            if match.group(0) == '{args[:]}':
+                return ' '.join(args)
+            index = int(match.group(1) or match.group(2))
+            return args[index] if index < len(args) else ''
+        return _ARG_RE.sub(one, arg) if '{args' in arg else arg
+
+    return [
+        Directive(directive.name, [replace(arg) for arg in directive.args],
+                  _substitute(directive.subdirectives, args) if directive.subdirectives else None)
+        for directive in directives
+    ]
+
+class ImportGraph:
+    """
+    Parses every file reached through `import` once, caching each parse by
+    path and stat signature (inode, size, mtime), and records which file
+    imports which. Expanded views are cached per file too; when a file
+    changes, only it and the files that import it (transitively) are
+    re-parsed or re-expanded, the rest of a split config is reused. The
+    directories a glob import lists are watched the same way, so a file
+    added there or removed from there re-expands the importing files.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        # path -> (stat signature, parse), as a whole file or as a fragment
+        self.parsed:    Dict[str, Tuple[object, CaddyFile]] = {}
+        self.fragments: Dict[str, Tuple[object, List[Directive]]] = {}
+        self.imports:   Dict[str, Set[str]] = {}     # file -> files it imports
+        self.importers: Dict[str, Set[str]] = {}     # file -> files importing it
+        self.expanded:  Dict[str, Expansion] = {}
+        # directory a glob lists -> (stat signature, files whose imports list it)
+        self.listings:  Dict[str, Tuple[object, Set[str]]] = {}
+
+    def clear(self):
+        with self.lock:
+            for table in (self.parsed, self.fragments, self.imports, self.importers, self.expanded, self.listings):
+                table.clear()
+
+    def dependents(self, path: str) -> Set[str]:
+        """`path` and every file that imports it, directly or not."""
+        seen, stack = set(), [path]
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            stack.extend(self.importers.get(current, ()))
+        return seen
+
+    def invalidate(self, path: str):
+        path = os.path.abspath(os.path.expanduser(path))
+        with self.lock:
+            for dependent in self.dependents(path):
+                self.expanded.pop(dependent, None)
+            self.parsed.pop(path, None)
+            self.fragments.pop(path, None)
+
+    def refresh(self) -> Set[str]:
+        """
+        Drop every file whose signature changed, and its dependents, and the
+        expansions of files whose glob imports may now match other files.
+        """
+        with self.lock:
+            known   = list(self.parsed.items()) + list(self.fragments.items())
+            changed = {path for path, (signature, _) in known if _signature(path) != signature}
+            for path in changed:
+                self.invalidate(path)
+            for directory, (signature, importers) in list(self.listings.items()):
+                if _signature(directory) != signature:
+                    del self.listings[directory]
+                    for importer in importers:
+                        for dependent in self.dependents(importer):
+                            self.expanded.pop(dependent, None)
+                    changed |= importers
+            return changed
+
+    def parse(self, path: str) -> CaddyFile:
+        with self.lock:
+            signature = _signature(path)
+            cached    = self.parsed.get(path)
+            if cached and cached[0] == signature:
+                return cached[1]
+            with open(path, 'r', encoding='utf-8', newline='') as file:
+                caddy = CaddyFile.parse_text(file.read())
+            self.parsed[path] = (signature, caddy)
+            return caddy
+
+    def fragment(self, path: str) -> List[Directive]:
+        """An imported file holding directives only, as used inside a block."""
+        with self.lock:
+            signature = _signature(path)
+            cached    = self.fragments.get(path)
+            if cached and cached[0] == signature:
+                return cached[1]
+            with open(path, 'r', encoding='utf-8', newline='') as file:
+                caddy = CaddyFile.parse_text(f"({_FRAGMENT}) {{\n{file.read()}\n}}\n")
+            self.fragments[path] = (signature, caddy.snippets[_FRAGMENT])
+            return caddy.snippets[_FRAGMENT]
+
+    def _watch(self, directory: str, importer: str):
+        # A listing already recorded keeps its signature until refresh() sees it
+        directory = os.path.abspath(directory)
+        self.listings.setdefault(directory, (_signature(directory), set()))[1].add(importer)
+
+    def _files(self, pattern: str, directory: str, importer: str) -> List[str]:
+        pattern = os.path.join(directory, os.path.expanduser(pattern))
+        if glob.has_magic(pattern):
+            # Listed before globbing, so a file added meanwhile is seen next refresh
+            parent = os.path.dirname(pattern)
+            if glob.has_magic(parent):
+                base = parent
+                while glob.has_magic(base):
+                    base = os.path.dirname(base)
+                self._watch(base, importer)
+                for match in glob.glob(parent):
+                    if os.path.isdir(match):
+                        self._watch(match, importer)
+            else:
+                self._watch(parent, importer)
+            return sorted(os.path.abspath(path) for path in glob.glob(pattern))
+        return [os.path.abspath(pattern)] if os.path.isfile(pattern) else []
+
+    def _link(self, importer: str, imported: str):
+        self.imports.setdefault(importer, set()).add(imported)
+        self.importers.setdefault(imported, set()).add(importer)
+
+    def _expand_directives(self, directives: List[Directive], path: str, snippets: Dict[str, List[Directive]],
+                           expansion: Expansion, chain: Tuple[str, ...]) -> List[Directive]:
+        result  = []
+        changed = False
+        for directive in directives:
+            if directive.name == 'import' and directive.args:
+                target, args = directive.args[0], tuple(directive.args[1:])
+                if target in snippets:
+                    changed = True
+                    if target in chain:
+                        raise ValueError(f"Snippet ({target}) imports itself")
+                    body = _substitute(snippets[target], args)
+                    result.extend(self._expand_directives(body, path, snippets, expansion, chain + (target,)))
+                    continue
+
+                files = self._files(target, os.path.dirname(path), path)
+                if not files and not glob.has_magic(target):
+                    # Possibly a snippet of the importing file, resolved there
+                    result.append(directive)
+                    continue
+
+                changed = True
+                for file in files:
+                    if file in chain:
+                        raise ValueError(f"Import cycle: {' -> '.join(chain + (file,))}")
+                    self._link(path, file)
+                    expansion.files.add(file)
+                    body = _substitute(self.fragment(file), args)
+                    result.extend(self._expand_directives(body, file, snippets, expansion, chain + (file,)))
+                continue
+
+            if directive.subdirectives:
+                children = self._expand_directives(directive.subdirectives, path, snippets, expansion, chain)
+                if children is not directive.subdirectives:
+                    directive = Directive(directive.name, directive.args, children)
+                    changed   = True
+            result.append(directive)
+        return result if changed else directives
+
+    def expand(self, path: str, chain: Tuple[str, ...] = ()) -> Expansion:
+        """
+        The file at `path` with its top-level imports (files and snippets)
+        merged in and `import` directives inside blocks inlined, snippet
+        `{args[N]}` placeholders substituted.
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        with self.lock:
+            cached = self.expanded.get(path)
+            if cached is not None:
+                return cached
+
+            chain          = chain + (path,)
+            source         = self.parse(path)
+            caddy          = CaddyFile(source.admin)
+            caddy.options  = source.options
+            caddy.snippets = dict(source.snippets)
+            expansion      = Expansion(caddy, {path})
+
+            for old in self.imports.pop(path, ()):
+                self.importers.get(old, set()).discard(path)
+
+            for directive in source.imports:
+                target, args = directive.args[0], tuple(directive.args[1:])
+                if target in caddy.snippets:
+                    # A snippet imported at the top level holds whole site blocks
+                    for block in _substitute(caddy.snippets[target], args):
+                        site = SiteBlock(_strip_scheme(block.name), list(block.subdirectives), None, [block.name] + list(block.args))
+                        caddy.add_site(site)
+                        expansion.origins[site.domain] = path
+                    continue
+
+                for file in self._files(target, os.path.dirname(path), path):
+                    if file in chain:
+                        raise ValueError(f"Import cycle: {' -> '.join(chain + (file,))}")
+                    self._link(path, file)
+                    child = self.expand(file, chain)
+                    expansion.files |= child.files
+                    caddy.options   = caddy.options or child.caddy.options
+                    caddy.admin     = caddy.admin or child.caddy.admin
+                    for name, directives in child.caddy.snippets.items():
+                        caddy.snippets.setdefault(name, directives)
+                    for domain, site in dict.items(child.caddy.sites):
+                        # Snippets this file defines are visible in the imported one
+                        directives = self._expand_directives(site.directives, file, caddy.snippets, expansion, chain)
+                        if directives is not site.directives:
+                            site = SiteBlock(site.domain, directives, site.bind, site.addresses)
+                        caddy.add_site(site)
+                        expansion.origins[domain] = child.origins.get(domain, file)
+
+            for domain, site in dict.items(source.sites):
+                directives = self._expand_directives(site.directives, path, caddy.snippets, expansion, chain)
+                if directives is not site.directives:
+                    site = SiteBlock(site.domain, directives, site.bind, site.addresses)
+                caddy.add_site(site)
+                expansion.origins[domain] = path
+
+            self.expanded[path] = expansion
+            return expansion
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils import atomic_write
+from .models import CaddyFile, SiteBlock
+
+STATE_DIR   = '~/.cache/nest-cli/access-logs'
+OTHER_HOSTS = '(other)'
+NO_ROUTE    = '(no route)'
+# Requests for hosts the Caddyfile does not know are folded together past this
+MAX_UNKNOWN_HOSTS = 64
+
+class QuantileSketch:
+    """
+    Log-bucketed quantile sketch (the DDSketch scheme): every value lands in
+    bucket ceil(log_gamma(value)), so any quantile is reported within
+    `accuracy` relative error. Memory depends on the spread of the values,
+    not on how many there are; a microsecond-to-minutes latency range fits
+    in about a thousand buckets at 1%.
+    """
+    __slots__ = ('gamma', 'log_gamma', 'buckets', 'zeros', 'count')
+
+    def __init__(self, accuracy: float = 0.01):
+        self.gamma     = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zeros     = 0
+        self.count     = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def merge(self, other: 'QuantileSketch'):
+        self.zeros += other.zeros
+        self.count += other.count
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+
+    def to_json(self) -> dict:
+        return {'zeros': self.zeros, 'count': self.count, 'buckets': self.buckets}
+
+    def load(self, data: dict):
+        self.zeros   = data['zeros']
+        self.count   = data['count']
+        self.buckets = {int(index): n for index, n in data['buckets'].items()}
+
+class TrafficStats:
+    __slots__ = ('requests', 'bytes', 'statuses', 'first', 'last', 'latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes    = 0
+        self.statuses: Dict[str, int] = {}
+        self.first    = None
+        self.last     = None
+        self.latency  = QuantileSketch()
+
+    def add(self, ts: float, status: int, size: int, duration: float):
+        self.requests += 1
+        self.bytes    += size
+        klass          = f"{status // 100}xx"
+        self.statuses[klass] = self.statuses.get(klass, 0) + 1
+        self.first     = ts if self.first is None else min(self.first, ts)
+        self.last      = ts if self.last is None else max(self.last, ts)
+        self.latency.add(duration)
+
+    def rate(self) -> float:
+        """Requests per second over the logged period."""
+        if not self.requests or self.last == self.first:
+            return float(self.requests)
+        return self.requests / (self.last - self.first)
+
+    def merge(self, other: 'TrafficStats'):
+        self.requests += other.requests
+        self.bytes    += other.bytes
+        for klass, n in other.statuses.items():
+            self.statuses[klass] = self.statuses.get(klass, 0) + n
+        if other.first is not None:
+            self.first = other.first if self.first is None else min(self.first, other.first)
+            self.last  = other.last if self.last is None else max(self.last, other.last)
+        self.latency.merge(other.latency)
+
+    def to_json(self) -> dict:
+        return {'requests': self.requests, 'bytes': self.bytes, 'statuses': self.statuses,
+                'first': self.first, 'last': self.last, 'latency': self.latency.to_json()}
+
+    @staticmethod
+    def from_json(data: dict) -> 'TrafficStats':
+        stats = TrafficStats()
+        stats.requests, stats.bytes = data['requests'], data['bytes']
+        stats.statuses              = data['statuses']
+        stats.first, stats.last     = data['first'], data['last']
+        stats.latency.load(data['latency'])
+        return stats
+
+class AccessLogAnalyzer:
+    """
+    Aggregates Caddy's JSON access logs per host and per route, where a route
+    is the chain of handle/handle_path/reverse_proxy matchers of the site
+    block that serves the request path. Only one stats entry exists per
+    known route, so memory stays bounded however large the logs are.
+    """
+    def __init__(self, caddy: CaddyFile):
+        self.sites: Dict[str, SiteBlock] = {}
+        for site in dict.values(caddy.sites):
+            self.sites[site.domain] = site
+            for address in site.addresses or ():
+                host = address.split('://')[-1].split('/')[0].rsplit(':', 1)[0]
+                if host:
+                    self.sites.setdefault(host, site)
+
+        self.hosts:  Dict[str, TrafficStats] = {}
+        self.routes: Dict[Tuple[str, str], TrafficStats] = {}
+        self._route_labels: Dict[Tuple[str, str], str] = {}
+
+    def _route(self, host: str, path: str) -> str:
+        site = self.sites.get(host)
+        if site is None:
+            return NO_ROUTE
+        chain = site.routes.lookup(path)
+        return " → ".join(str(route) for route in chain) if chain else NO_ROUTE
+
+    def add(self, entry: dict):
+        request = entry.get('request') or {}
+        host    = (request.get('host') or '').rsplit(':', 1)[0].lower()
+        path    = (request.get('uri') or '/').split('?', 1)[0]
+
+        if host not in self.sites and host not in self.hosts and len(self.hosts) >= MAX_UNKNOWN_HOSTS + len(self.sites):
+            host = OTHER_HOSTS
+
+        ts       = float(entry.get('ts') or 0)
+        status   = int(entry.get('status') or 0)
+        size     = int(entry.get('size') or 0)
+        duration = float(entry.get('duration') or 0)
+
+        stats = self.hosts.get(host)
+        if stats is None:
+            stats = self.hosts[host] = TrafficStats()
+        stats.add(ts, status, size, duration)
+
+        # Repeated paths skip the trie walk; the memo is capped so a crawler
+        # requesting endless unique paths cannot grow it
+        key   = (host, path)
+        route = self._route_labels.get(key)
+        if route is None:
+            route = self._route(host, path)
+            if len(self._route_labels) < 100_000:
+                self._route_labels[key] = route
+
+        stats = self.routes.get((host, route))
+        if stats is None:
+            stats = self.routes[(host, route)] = TrafficStats()
+        stats.add(ts, status, size, duration)
+
+    def feed(self, lines: Iterable[bytes]) -> int:
+        count = 0
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and 'status' in entry:
+                self.add(entry)
+                count += 1
+        return count
+
+    def merge(self, other: 'AccessLogAnalyzer'):
+        for table, theirs in ((self.hosts, other.hosts), (self.routes, other.routes)):
+            for key, stats in theirs.items():
+                if key in table:
+                    table[key].merge(stats)
+                else:
+                    table[key] = stats
+
+    def to_json(self) -> dict:
+        return {
+            'hosts': {host: stats.to_json() for host, stats in self.hosts.items()},
+            'routes': [[host, route, stats.to_json()] for (host, route), stats in self.routes.items()],
+        }
+
+    def load(self, data: dict):
+        self.hosts  = {host: TrafficStats.from_json(stats) for host, stats in data['hosts'].items()}
+        self.routes = {(host, route): TrafficStats.from_json(stats) for host, route, stats in data['routes']}
+
+def logFiles(caddy: CaddyFile) -> List[str]:
+    """Files named by `log { output file <path> }`, globally and per site."""
+    paths = []
+    stack = list(caddy.options)
+    for site in dict.values(caddy.sites):
+        stack.extend(site.directives)
+
+    while stack:
+        directive = stack.pop()
+        if directive.name == 'output' and len(directive.args) >= 2 and directive.args[0] == 'file':
+            path = os.path.expanduser(directive.args[1])
+            if path not in paths:
+                paths.append(path)
+        stack.extend(directive.subdirectives)
+    return paths
+
+def _lines(buffer: mmap.mmap, start: int, end: int) -> Iterable[bytes]:
+    position = start
+    while position < end:
+        newline = buffer.find(b'\n', position, end)
+        if newline == -1:
+            return
+        if newline > position:
+            yield buffer[position:newline]
+        position = newline + 1
+
+def _state_path(log_path: str) -> str:
+    name = hashlib.blake2b(os.path.abspath(log_path).encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(os.path.expanduser(STATE_DIR), name + '.json')
+
+def analyzeLog(log_path: str, caddy: CaddyFile, incremental: bool = True) -> Tuple[AccessLogAnalyzer, int]:
+    """
+    Aggregate `log_path`, reading only the lines not seen before, and return
+    the totals with how many new entries were read. The file is memory-mapped,
+    so a multi-GB log is paged in by the kernel instead of read into memory.
+    The offset of the last complete line is kept with the aggregates; a
+    rotated log (new inode or shorter file) is read from the start again.
+    """
+    analyzer   = AccessLogAnalyzer(caddy)
+    state_path = _state_path(log_path)
+    st         = os.stat(log_path)
+    offset     = 0
+
+    if incremental:
+        try:
+            with open(state_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            if state['inode'] == st.st_ino and state['offset'] <= st.st_size:
+                offset = state['offset']
+                analyzer.load(state['stats'])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    read = 0
+    end  = st.st_size
+    if end > offset:
+        with open(log_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            end    = min(end, len(buffer))
+            # Stop at the last complete line, the writer may be mid-line
+            last   = buffer.rfind(b'\n', offset, end)
+            end    = last + 1 if last != -1 else offset
+            read   = analyzer.feed(_lines(buffer, offset, end))
+
+    if incremental:
+        state = {'inode': st.st_ino, 'offset': end, 'stats': analyzer.to_json()}
+        try:
+            os.makedirs(os.path.dirname(state_path), exist_ok=True)
+            atomic_write(state_path, json.dumps(state))
+        except OSError:
+            pass
+    return analyzer, read
+
+def analyzeLogs(caddy: CaddyFile, paths: Optional[List[str]] = None) -> Tuple[AccessLogAnalyzer, int]:
+    """Every log of the Caddyfile (or `paths`) merged into one set of totals."""
+    total, read = AccessLogAnalyzer(caddy), 0
+    for path in paths if paths is not None else logFiles(caddy):
+        if os.path.isfile(path):
+            analyzer, count = analyzeLog(path, caddy)
+            total.merge(analyzer)
+            read += count
+    return total, read
+
+def formatStatsTable(stats: Dict[object, TrafficStats], label) -> List[str]:
+    rows = [("NAME", "REQS", "REQ/S", "2xx/3xx/4xx/5xx", "BYTES", "P50", "P95", "P99")]
+    for key, entry in sorted(stats.items(), key=lambda item: -item[1].requests):
+        mix = "/".join(str(entry.statuses.get(f"{n}xx", 0)) for n in range(2, 6))
+        ms  = [entry.latency.quantile(q) for q in (0.5, 0.95, 0.99)]
+        rows.append((label(key), str(entry.requests), f"{entry.rate():.2f}", mix, _size(entry.bytes),
+                     *(f"{value * 1000:.1f}ms" if value is not None else "-" for value in ms)))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return ["  ".join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i]) for i, cell in enumerate(row)) for row in rows]
+
+def _size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
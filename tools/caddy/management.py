@@ -1,16 +1,173 @@
-from .models import CaddyFile, SiteBlock, Directive
+import hashlib
+import os
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from .admin import AdminClient, ApplyResult, CaddyAdminError
+from .diff import Change, diffCaddyFiles, diffSites
+from .imports import Expansion, ImportGraph
+from .models import CaddyFile, SiteBlock, SharedSites, Directive
+from .precompress import precompressedDirective
+from .validate import CaddyValidationError, recentAdaptation, requireValid
+
+CADDYFILE_PATH = '~/Caddyfile'
+# CADDYFILE_PATH = '/home/khaled/nest-cli/CaddyfileTest'
+
+# Files modified this recently may change again within the same mtime tick,
+# so their stat signature alone is not trusted.
+_RACY_WINDOW = 2.0
+
+# path -> (stat signature, content digest, parsed CaddyFile)
+_parsed_cache = {}
+_parsed_lock  = threading.Lock()
+
+# Every file reached through `import`, parsed once and re-expanded only when
+# it or something it imports changes
+_import_graph = ImportGraph()
+
+def _signature(st: os.stat_result):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def configDigest(text: str, imported: Iterable[str] = ()) -> bytes:
+    """
+    A digest of the Caddyfile's text and the contents of the files it
+    imports, which change the outcome without changing the main text.
+    Imported files that can't be read are left out.
+    """
+    digests = [_digest(text.encode('utf-8'))]
+    for path in sorted(imported):
+        try:
+            with open(path, 'rb') as file:
+                digests.append(_digest(file.read()))
+        except OSError:
+            continue
+    return _digest(b''.join(digests))
+
+def loadCaddyFile(path=CADDYFILE_PATH) -> CaddyFile:
+    """
+    Return a private copy of the parsed Caddyfile at `path`.
+
+    The parsed tree is cached per process and only re-parsed when the file's
+    stat signature and content digest both say it changed. The copy shares
+    site blocks with the cache until they are accessed, so editing it never
+    touches the cached tree.
+    """
+    path = os.path.expanduser(path)
+
+    with _parsed_lock:
+        st     = os.stat(path)
+        cached = _parsed_cache.get(path)
+        racy   = time.time() - st.st_mtime < _RACY_WINDOW
+
+        if cached and cached[0] == _signature(st) and not racy:
+            return cached[2].copy()
+
+        with open(path, 'rb') as file:
+            data = file.read()
+        digest = _digest(data)
+
+        if cached and cached[1] == digest:
+            _parsed_cache[path] = (_signature(st), digest, cached[2])
+            return cached[2].copy()
+
+        caddy = CaddyFile.parse_text(data.decode('utf-8'))
+        _parsed_cache[path] = (_signature(st), digest, caddy)
+        return caddy.copy()
+
+def _dependencies(path) -> List[str]:
+    try:
+        return importedFiles(path)
+    except (OSError, ValueError):
+        return []
+
+def saveCaddyFile(caddy: CaddyFile, path=CADDYFILE_PATH, validate: bool = True) -> str:
+    """
+    Write `caddy` to `path` and keep it as the cached tree for that file.
+    The new text is checked with `caddy adapt --validate` first (cached by
+    content hash); CaddyValidationError is raised and nothing is written
+    when Caddy rejects it.
+    """
+    path      = os.path.expanduser(path)
+    directory = os.path.dirname(path)
+    check     = (lambda text: requireValid(text, directory, caddy, _dependencies(path))) if validate else None
+
+    with _parsed_lock:
+        text = caddy.save(path, check)
+        _parsed_cache[path] = (_signature(os.stat(path)), _digest(text.encode('utf-8')), caddy.snapshot())
+    return text
+
+def invalidateCaddyFileCache(path=None):
+    with _parsed_lock:
+        if path is None:
+            _parsed_cache.clear()
+            _import_graph.clear()
+        else:
+            _parsed_cache.pop(os.path.expanduser(path), None)
+            _import_graph.invalidate(path)
+
+def loadExpandedCaddyFile(path=CADDYFILE_PATH) -> Expansion:
+    """
+    The Caddyfile with imports and snippets resolved, for reading: sites of
+    imported files included, `import` directives inlined. Edits still go
+    through loadCaddyFile, which keeps imports as written.
+    """
+    _import_graph.refresh()
+    return _import_graph.expand(path)
+
+def importedFiles(path=CADDYFILE_PATH) -> List[str]:
+    """Every file `path` imports, directly or not."""
+    return sorted(loadExpandedCaddyFile(path).files - {os.path.abspath(os.path.expanduser(path))})
+
+# admin address -> AdminClient, so pooled connections outlive a single call
+_admin_clients = {}
+
+def getAdminClient(caddy: CaddyFile) -> AdminClient:
+    address = caddy.admin or 'localhost:2019'
+    if address not in _admin_clients:
+        _admin_clients[address] = AdminClient(address)
+    return _admin_clients[address]
+
+def applySiteChange(caddy: CaddyFile, text: str, domain: str) -> Optional[ApplyResult]:
+    """
+    Push a saved site change to the running Caddy through its admin API.
+    Returns None when the admin endpoint is off, and a result carrying the
+    error when Caddy could not be reached, since the file is already saved.
+    """
+    if caddy.admin and caddy.admin.split()[0] == 'off':
+        return None
+
+    started = time.perf_counter()
+    try:
+        return getAdminClient(caddy).apply_site(text, domain, recentAdaptation(text))
+    except (OSError, CaddyAdminError, ValueError) as e:
+        return ApplyResult('error', [], time.perf_counter() - started, str(e))
+
+def applyCaddyFile(caddy: CaddyFile, text: str) -> Optional[ApplyResult]:
+    """Like applySiteChange, but replaces the running config with one /load."""
+    if caddy.admin and caddy.admin.split()[0] == 'off':
+        return None
+
+    started = time.perf_counter()
+    try:
+        return getAdminClient(caddy).load(text)
+    except (OSError, CaddyAdminError, ValueError) as e:
+        return ApplyResult('error', [], time.perf_counter() - started, str(e))
 
 def listSites():
-    caddy = CaddyFile.parse('~/Caddyfile')
-    # caddy = CaddyFile.parse('/home/khaled/nest-cli/CaddyfileTest')
+    return loadCaddyFile().sites
 
-    return caddy.sites
+def checkRoute(site:SiteBlock, path):
+    conflicts = site.routes.conflicts(path)
+    if conflicts.blocking():
+        raise ValueError(conflicts.describe(path))
+    return conflicts
 
 def addReverseProxy(site:SiteBlock, path, port):
-    for directive in site.directives:
-        if directive.name in ('handle', 'handle_path', 'reverse_proxy'):
-            if len(directive.args) != 0 and directive.args[0] == path:
-                raise ValueError("Path actually does exist in this site block!")
+    checkRoute(site, path)
     
     site.add_directive(Directive("handle", [path], [
         Directive("reverse_proxy", [f":{port}"])
@@ -19,32 +176,144 @@ def addReverseProxy(site:SiteBlock, path, port):
     return site
 
 def addStaticRoute(site:SiteBlock, route_path, path):
-    for directive in site.directives:
-        if directive.name in ('handle', 'handle_path', 'reverse_proxy'):
-            if len(directive.args) != 0 and directive.args[0] == route_path:
-                raise ValueError("Path actually does exist in this site block!")
+    checkRoute(site, route_path)
 
     site.add_directive(Directive("handle_path", [route_path], [
         Directive("root", ["*", path]),
-        Directive("file_server")
+        Directive("file_server", subdirectives=[precompressedDirective()])
     ]))
 
     return site
 
+def _savedSite(caddy: CaddyFile, domain):
+    return caddy.sites.peek(domain) if isinstance(caddy.sites, SharedSites) else caddy.sites.get(domain)
+
+def previewSiteChanges(site:SiteBlock) -> List[Change]:
+    """What saving `site` would change compared to the Caddyfile on disk."""
+    return diffSites(_savedSite(loadCaddyFile(), site.domain), site)
+
 def saveUpdatedSite(site:SiteBlock):
-    caddy = CaddyFile.parse('~/Caddyfile')
-    # caddy = CaddyFile.parse('/home/khaled/nest-cli/CaddyfileTest')
+    caddy = loadCaddyFile()
+    saved = _savedSite(caddy, site.domain)
+
+    if saved is not None and saved.digest() == site.digest():
+        return ApplyResult('noop')
 
     caddy.sites[site.domain] = site
 
-    caddy.save('~/Caddyfile')
-    # caddy.save('/home/khaled/nest-cli/CaddyfileTest')
+    text = saveCaddyFile(caddy)
+    return applySiteChange(caddy, text, site.domain)
 
 def deleteSite(site:SiteBlock):
-    caddy = CaddyFile.parse('~/Caddyfile')
-    # caddy = CaddyFile.parse('/home/khaled/nest-cli/CaddyfileTest')
+    caddy = loadCaddyFile()
 
     del caddy.sites[site.domain]
 
-    caddy.save('~/Caddyfile')
-    # caddy.save('/home/khaled/nest-cli/CaddyfileTest')
\ No newline at end of file
+    text = saveCaddyFile(caddy)
+    return applySiteChange(caddy, text, site.domain)
+
+def _siteDigest(caddy: CaddyFile, domain: str, memo: dict) -> Optional[bytes]:
+    # Peeking keeps untouched copy-on-access blocks shared with the cache
+    sites = caddy.sites
+    site  = sites.peek(domain) if isinstance(sites, SharedSites) else sites.get(domain)
+    return site.digest(memo) if site is not None else None
+
+class CaddyTransactionError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__("Transaction rolled back:\n" + "\n".join(f"  - {error}" for error in errors))
+        self.errors = errors
+
+class CaddyTransaction:
+    """
+    Batch edits across many sites into one write and one reload.
+
+        with CaddyTransaction() as tx:
+            tx.addReverseProxy('example.com', '/api/*', 8080)
+            tx.deleteSite('old.example.com')
+
+    Edits are queued and only run against a private copy of the Caddyfile
+    on commit. Every edit is validated first; if any fails, nothing is
+    written and CaddyTransactionError lists all the failures.
+    """
+    def __init__(self, path=CADDYFILE_PATH):
+        self.path       = path
+        self.operations = []
+        self.changes    = []
+        self.result     = None
+
+    def __enter__(self) -> 'CaddyTransaction':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def _queue(self, description: str, domain, operation):
+        self.operations.append((description, domain, operation))
+        return self
+
+    def update(self, domain, operation):
+        """Queue `operation(site)` to run on the named site."""
+        return self._queue(f"update {domain}", domain, operation)
+
+    def addReverseProxy(self, domain, path, port):
+        return self._queue(f"reverse proxy {path} on {domain}", domain, lambda site: addReverseProxy(site, path, port))
+
+    def addStaticRoute(self, domain, route_path, path):
+        return self._queue(f"static route {route_path} on {domain}", domain, lambda site: addStaticRoute(site, route_path, path))
+
+    def saveSite(self, site:SiteBlock):
+        return self._queue(f"save {site.domain}", None, lambda caddy: caddy.sites.__setitem__(site.domain, site))
+
+    def deleteSite(self, domain):
+        return self._queue(f"delete {domain}", None, lambda caddy: caddy.sites.__delitem__(domain))
+
+    def rollback(self):
+        self.operations = []
+
+    def commit(self) -> Optional[ApplyResult]:
+        caddy    = loadCaddyFile(self.path)
+        original = caddy.copy()
+        errors   = []
+
+        for description, domain, operation in self.operations:
+            try:
+                if domain is None:
+                    operation(caddy)
+                elif domain not in caddy.sites:
+                    raise KeyError(f"no site named {domain}")
+                else:
+                    operation(caddy.sites[domain])
+            except (ValueError, KeyError) as e:
+                errors.append(f"{description}: {e.args[0] if e.args else e}")
+
+        self.operations = []
+        if errors:
+            raise CaddyTransactionError(errors)
+
+        # Whether anything changed comes from the sites' Merkle digests, the
+        # diff is only what gets reported
+        memo    = {}
+        header  = original.render_header() != caddy.render_header()
+        domains = {
+            domain for domain in set(original.sites) | set(caddy.sites)
+            if _siteDigest(original, domain, memo) != _siteDigest(caddy, domain, memo)
+        }
+        self.changes = diffCaddyFiles(original, caddy)
+        if not header and not domains:
+            self.result = ApplyResult('noop')
+            return self.result
+
+        try:
+            text = saveCaddyFile(caddy, self.path)
+        except CaddyValidationError as e:
+            raise CaddyTransactionError([str(e)]) from e
+        if not header and len(domains) == 1:
+            # One site touched: a targeted PATCH is cheaper than a full /load
+            self.result = applySiteChange(caddy, text, domains.pop())
+        else:
+            self.result = applyCaddyFile(caddy, text)
+        return self.result
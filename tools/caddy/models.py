@@ -1,23 +1,146 @@
+import hashlib
 import os
+import re
+import sys
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from utils import atomic_write
+from .routes import RouteIndex
+
+# One alternative per token kind, tried in order at each position. Comments only
+# start at the beginning of a token, so `nixpkgs#foo` stays a single word.
+_TOKEN_RE = re.compile(r'''
+      (?P<nl>\r?\n)
+    | (?P<ws>[ \t\r\f\v]+)
+    | (?P<comment>\#[^\n]*)
+    | (?P<dq>"(?:[^"\\]|\\.)*")
+    | (?P<bt>`[^`]*`)
+    | (?P<heredoc><<(?P<marker>[A-Za-z0-9_-]+)[ \t]*(?=\r?\n))
+    | (?P<bad>["`])
+    | (?P<word>\S+)
+''', re.X | re.S)
+
+_NEEDS_QUOTES_RE = re.compile(r'[\s"#`]|^$|^[{}]$')
+
+class _Quoted(str):
+    """A token that came from quotes or a heredoc, so `{` and `}` in it are literal."""
+    __slots__ = ()
+
+# (line number, start offset, end offset, tokens)
+Line = Tuple[int, int, int, List[str]]
+
+def _tokenize(text: str) -> Iterator[Line]:
+    """
+    Yield the tokens of `text` one logical line at a time in a single pass.
+
+    Plain lines are split directly; only lines holding quotes or heredocs go
+    through the token regex, which may run across line breaks.
+    """
+    match = _TOKEN_RE.match
+    lines = text.split('\n')
+    index = 0
+    pos   = 0
+
+    while index < len(lines):
+        raw = lines[index]
+
+        if '"' not in raw and '`' not in raw and '<<' not in raw:
+            tokens = raw.split()
+            if '#' in raw:
+                for i, token in enumerate(tokens):
+                    if token[0] == '#':
+                        del tokens[i:]
+                        break
+            if tokens:
+                # A CRLF line's '\r' belongs to the line break, not the line
+                yield index + 1, pos, pos + len(raw) - raw.endswith('\r'), tokens
+            index += 1
+            pos   += len(raw) + 1
+            continue
+
+        start  = pos
+        end    = None
+        tokens = []
+        while pos < len(text):
+            m    = match(text, pos)
+            kind = m.lastgroup
+
+            if kind == 'nl':
+                # Step over the whole break, '\r\n' included
+                end = pos
+                pos = m.end()
+                break
+            elif kind == 'word':
+                tokens.append(m.group())
+            elif kind == 'dq':
+                tokens.append(_Quoted(m.group()[1:-1].replace('\\"', '"')))
+            elif kind == 'bt':
+                tokens.append(_Quoted(m.group()[1:-1]))
+            elif kind == 'heredoc':
+                marker  = m.group('marker')
+                body_at = text.index('\n', m.end()) + 1
+                closing = re.compile(r'^([ \t]*)' + re.escape(marker) + r'(?=\s|$)', re.M).search(text, body_at)
+                if closing is None:
+                    raise ValueError(f"Line {index + 1}: heredoc marker {marker!r} is never closed")
+
+                indent = closing.group(1)
+                body   = text[body_at:closing.start()].rstrip('\r\n').split('\n') if closing.start() > body_at else []
+                tokens.append(_Quoted('\n'.join(l[len(indent):] if l.startswith(indent) else l.lstrip() for l in body)))
+                pos = closing.end()
+                continue
+            elif kind == 'bad':
+                raise ValueError(f"Line {index + 1}: unterminated quoted string")
+
+            pos = m.end()
+
+        if end is None:
+            end = pos
+        if tokens:
+            yield index + 1, start, end, tokens
+        index += text.count('\n', start, end) + 1
+        if pos == end:
+            # End of text, or a break the loop did not consume
+            pos += 1
+
+def _quote(arg: str) -> str:
+    if '\n' in arg:
+        return f"<<EOF\n{arg}\nEOF"
+    if _NEEDS_QUOTES_RE.search(arg):
+        return '"' + arg.replace('"', '\\"') + '"'
+    return arg
+
+def _strip_scheme(address: str) -> str:
+    return address.replace("http://", "").replace("https://", "")
+
+# Directives without arguments or a block all share these, a config with
+# tens of thousands of directives would otherwise carry as many empty lists
+_NO_ARGS       = ()
+_NO_DIRECTIVES = ()
+
+def _intern_args(words) -> tuple:
+    # Quoted tokens are a str subclass, which sys.intern refuses
+    return tuple([sys.intern(w) if type(w) is str else sys.intern(str(w)) for w in words])
 
 class Directive:
+    __slots__ = ('name', 'args', 'subdirectives')
+
     def __init__(self, name: str, args: Optional[List[str]] = None, subdirectives: Optional[List['Directive']] = None):
-        self.name          = name
-        self.args          = args or []
-        self.subdirectives = subdirectives or []
+        self.name          = sys.intern(name)
+        self.args          = args or _NO_ARGS
+        self.subdirectives = subdirectives or _NO_DIRECTIVES
     
     def add_arg(self, arg: str):
-        self.args.append(arg)
+        self.args = list(self.args) + [arg]
     
     def add_subdirective(self, subdirective: 'Directive'):
+        if type(self.subdirectives) is tuple:
+            self.subdirectives = list(self.subdirectives)
         self.subdirectives.append(subdirective)
     
     def render(self, indent: int = 0) -> str:
         indent_str = ' ' * (indent * 4)
-        args_str   = ' '.join(self.args)
-        lines      = [f"{indent_str}{self.name} {args_str}"]
+        lines      = [indent_str + ' '.join([self.name] + [_quote(arg) for arg in self.args])]
 
         if self.subdirectives:
             lines[0] += " {"
@@ -27,23 +150,86 @@ class Directive:
 
         return "\n".join(lines)
 
+    def digest(self, memo: Optional[dict] = None) -> bytes:
+        """
+        Content hash of this directive and everything nested in it. Pass a
+        `memo` dict to reuse subtree hashes across calls on the same tree.
+        """
+        if memo is not None and id(self) in memo:
+            return memo[id(self)]
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.name.encode('utf-8'))
+        for arg in self.args:
+            h.update(b'\x1f' + arg.encode('utf-8'))
+        h.update(b'\x1e')
+        for sub in self.subdirectives:
+            h.update(sub.digest(memo))
+
+        digest = h.digest()
+        if memo is not None:
+            memo[id(self)] = digest
+        return digest
+
+    def copy(self) -> 'Directive':
+        # Argument tuples are immutable, so copies can keep sharing them
+        args = self.args if type(self.args) is tuple else list(self.args)
+        return Directive(self.name, args, [sub.copy() for sub in self.subdirectives])
+
     def __str__(self):
-        return f"{self.name} | {self.args} | {len(self.subdirectives)}"
+        return f"{self.name} | {list(self.args)} | {len(self.subdirectives)}"
 
 class SiteBlock:
-    def __init__(self, domain: str, directives, bind):
+    __slots__ = ('domain', 'directives', 'bind', 'addresses', 'span', '_routes')
+
+    def __init__(self, domain: str, directives, bind, addresses: Optional[List[str]] = None):
         self.domain     = domain
         self.directives = directives or []
         self.bind       = bind
+        self.addresses  = addresses or []
+        # (start, end) offsets of the block in the text it was parsed from
+        self.span       = None
+        self._routes    = None
+
+    @property
+    def routes(self) -> RouteIndex:
+        """Route index over this site's directives, rebuilt if the list was edited directly."""
+        routes = self._routes
+        if routes is None or routes[0] is not self.directives or routes[1] != len(self.directives):
+            routes = self._routes = (self.directives, len(self.directives), RouteIndex(self.directives))
+        return routes[2]
 
     def add_directive(self, directive: Directive):
         self.directives.append(directive)
+        if self._routes is not None and self._routes[0] is self.directives:
+            self._routes[2].add(directive)
+            self._routes = (self.directives, len(self.directives), self._routes[2])
+
+    def remove_directive(self, directive: Directive):
+        self.directives.remove(directive)
+        if self._routes is not None and self._routes[0] is self.directives:
+            self._routes[2].remove(directive)
+            self._routes = (self.directives, len(self.directives), self._routes[2])
 
     def set_directives(self, directives: List[Directive]):
         self.directives = directives
+
+    def digest(self, memo: Optional[dict] = None) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(', '.join(self.addresses or [f"http://{self.domain}"]).encode('utf-8'))
+        h.update(b'\x1e' + (self.bind or '').encode('utf-8') + b'\x1e')
+        for directive in self.directives:
+            h.update(directive.digest(memo))
+        return h.digest()
+
+    def copy(self) -> 'SiteBlock':
+        site      = SiteBlock(self.domain, [d.copy() for d in self.directives], self.bind, list(self.addresses))
+        site.span = self.span
+        return site
     
     def render(self) -> str:
-        lines = [f"http://{self.domain} {{"]
+        address = ', '.join(self.addresses) if self.addresses else f"http://{self.domain}"
+        lines   = [f"{address} {{"]
 
         if self.bind:
             lines.append(f"    bind {self.bind}")
@@ -55,10 +241,67 @@ class SiteBlock:
         lines.append("}")
         return "\n".join(lines)
 
+class SharedSites(dict):
+    """
+    Sites mapping of a CaddyFile copy whose blocks start out shared with the
+    original tree. A block is cloned the first time it is handed out, so
+    callers can edit what they get while untouched blocks are never copied.
+    """
+    def __init__(self, sites, shared=None):
+        super().__init__(sites)
+        self.shared = set(dict.keys(self)) if shared is None else set(shared)
+
+    def peek(self, domain: str, default=None):
+        """Read a block without taking ownership of it; it must not be edited."""
+        return dict.get(self, domain, default)
+
+    def _own(self, domain: str) -> SiteBlock:
+        site = dict.__getitem__(self, domain)
+        if domain in self.shared:
+            self.shared.discard(domain)
+            site = site.copy()
+            dict.__setitem__(self, domain, site)
+        return site
+
+    def __getitem__(self, domain: str) -> SiteBlock:
+        return self._own(domain)
+
+    def __setitem__(self, domain: str, site: SiteBlock):
+        self.shared.discard(domain)
+        dict.__setitem__(self, domain, site)
+
+    def __delitem__(self, domain: str):
+        self.shared.discard(domain)
+        dict.__delitem__(self, domain)
+
+    def get(self, domain: str, default=None):
+        return self._own(domain) if domain in self else default
+
+    def pop(self, domain: str, *default):
+        if domain not in self:
+            return dict.pop(self, domain, *default)
+        site = self._own(domain)
+        del self[domain]
+        return site
+
+    def values(self):
+        return [self._own(domain) for domain in self]
+
+    def items(self):
+        return [(domain, self._own(domain)) for domain in self]
+
 class CaddyFile:
     def __init__(self, admin: Optional[str] = None):
         self.admin       = admin
+        self.options     = []
+        self.snippets    = {}
+        self.imports     = []
         self.sites       = {}
+        # What the file looked like when parsed: its text, the rendered header
+        # (options, snippets, imports) and the untouched site blocks in order
+        self.source      = None
+        self.header      = None
+        self.layout      = []
 
     def add_site(self, site: SiteBlock):
         self.sites[site.domain] = site
@@ -73,100 +316,285 @@ class CaddyFile:
             if directives:
                 site.set_directives(directives)
 
+    def copy(self) -> 'CaddyFile':
+        caddyfile          = CaddyFile(self.admin)
+        caddyfile.options  = [option.copy() for option in self.options]
+        caddyfile.snippets = {name: [d.copy() for d in directives] for name, directives in self.snippets.items()}
+        caddyfile.imports  = [directive.copy() for directive in self.imports]
+        caddyfile.sites    = SharedSites(dict.items(self.sites))
+        caddyfile.source   = self.source
+        caddyfile.header   = self.header
+        caddyfile.layout   = self.layout
+        return caddyfile
+
+    def snapshot(self) -> 'CaddyFile':
+        """Independent copy: only blocks still shared from this copy's source are reused."""
+        shared          = self.sites.shared if isinstance(self.sites, SharedSites) else ()
+        caddyfile       = self.copy()
+        caddyfile.sites = {domain: site if domain in shared else site.copy() for domain, site in dict.items(self.sites)}
+        return caddyfile
+
+    def render_options(self) -> Optional[str]:
+        options = []
+        if self.admin and not any(option.name == 'admin' for option in self.options):
+            options.append(Directive('admin', self.admin.split()))
+
+        for option in self.options:
+            if option.name == 'admin':
+                if not self.admin:
+                    continue
+                option = Directive('admin', self.admin.split(), option.subdirectives)
+            options.append(option)
+
+        if not options:
+            return None
+        return "{\n" + "\n".join(option.render(indent=1) for option in options) + "\n}\n"
+
+    def render_header(self) -> str:
+        output  = []
+        options = self.render_options()
+        if options:
+            output.append(options)
+        for name, directives in self.snippets.items():
+            output.append("\n".join([f"({name}) {{"] + [d.render(indent=1) for d in directives] + ["}"]))
+            output.append("")
+        for directive in self.imports:
+            output.append(directive.render())
+            output.append("")
+        return "\n".join(output)
+
     def render(self) -> str:
-        output = []
-        if self.admin:
-            output.append(f"{{\n    admin {self.admin}\n}}\n")
-        for site in self.sites.values():
+        output = [self.render_header()]
+        # dict.values so rendering a SharedSites copy does not clone every block
+        for site in dict.values(self.sites):
             output.append(site.render())
             output.append("")
         return "\n".join(output).strip()
 
-    def save(self, path: str | Path):
-        Path(os.path.expanduser(path)).write_text(self.render(), encoding="utf-8")
+    def _is_untouched(self, domain: str, site: SiteBlock, original: SiteBlock) -> bool:
+        if site is original or (isinstance(self.sites, SharedSites) and domain in self.sites.shared):
+            return True
+        return site.digest() == original.digest()
+
+    def _splice(self) -> Optional[Tuple[str, List[SiteBlock], set]]:
+        """
+        Rebuild the source text, re-rendering only the site blocks that changed.
+
+        Returns the text, the new layout and the domains still holding their
+        parsed block, or None when the header changed and the whole file has
+        to be rendered.
+        """
+        if self.source is None or self.render_header() != self.header:
+            return None
+
+        source    = self.source
+        # Re-rendered blocks follow the file's own line endings
+        newline   = '\r\n' if '\r\n' in source else '\n'
+        current   = dict(dict.items(self.sites))
+        output    = []
+        layout    = []
+        shared    = set()
+        size      = 0
+        last      = 0
+
+        def emit(text: str):
+            nonlocal size
+            output.append(text)
+            size += len(text)
+
+        for original in self.layout:
+            start, end = original.span
+            emit(source[last:start])
+            site = current.pop(original.domain, None)
+
+            if site is None:
+                # Deleted: drop the block and the blank lines after it
+                while end < len(source) and source[end] in '\r\n':
+                    end += 1
+                last = end
+                continue
+
+            if self._is_untouched(original.domain, site, original):
+                text     = source[start:end]
+                pristine = original
+                if site is original:
+                    shared.add(original.domain)
+            else:
+                text     = site.render().replace('\n', newline)
+                pristine = site.copy()
+
+            pristine.span = (size, size + len(text))
+            emit(text)
+            layout.append(pristine)
+            last = end
+        emit(source[last:])
+
+        for domain, site in current.items():
+            if size and not output[-1].endswith('\n'):
+                emit(newline)
+            if size:
+                emit(newline)
+            text          = site.render().replace('\n', newline)
+            pristine      = site.copy()
+            pristine.span = (size, size + len(text))
+            emit(text + newline)
+            layout.append(pristine)
+
+        return ''.join(output), layout, shared
+
+    def save(self, path: str | Path, validate: Optional[Callable[[str], object]] = None) -> str:
+        """
+        Atomically write the file, splicing re-rendered blocks into the parsed
+        text so comments and formatting elsewhere survive. Nothing is written
+        when the result matches what is already on disk.
+
+        `validate` is called with the new text before anything is written or
+        changed; if it raises, the save is abandoned.
+        """
+        path    = os.path.expanduser(path)
+        spliced = self._splice()
+
+        if spliced is None:
+            text   = self.render()
+            shared = set()
+        else:
+            text, layout, shared = spliced
+            if text == self.source and os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as file:
+                    if file.read() == text:
+                        return text
+
+        if validate is not None:
+            validate(text)
+
+        if spliced is None:
+            parsed = CaddyFile.parse_text(text)
+            self.source, self.header, self.layout = parsed.source, parsed.header, parsed.layout
+        else:
+            self.source, self.layout = text, layout
+
+        atomic_write(path, text)
+
+        # Blocks rendered just now become the new baseline; the caller keeps
+        # its own objects for those sites while they are compared against it
+        if isinstance(self.sites, SharedSites) or shared:
+            self.sites = SharedSites(dict.items(self.sites), shared)
+        return text
 
     @staticmethod
     def parse(path) -> 'CaddyFile':
-        with open(os.path.expanduser(path), 'r', encoding='utf-8') as file:
-            lines = file.readlines()
+        with open(os.path.expanduser(path), 'r', encoding='utf-8', newline='') as file:
+            return CaddyFile.parse_text(file.read())
 
-        caddyfile = CaddyFile()
-        current_site = None
-
-        def parse_directives(lines: List[str], start_index: int = 0) -> (List[Directive], int):
-            directives = []
-            i = start_index
-            while i < len(lines):
-                line = lines[i].strip()
-                if line == "}":
-                    return directives, i
-                if not line or line.startswith("#"):
-                    i += 1
-                    continue
+    @staticmethod
+    def parse_text(text: str) -> 'CaddyFile':
+        """
+        Build a CaddyFile from Caddyfile source in one pass over its tokens.
 
-                parts = line.split()
-                name  = parts[0]
-                args  = parts[1:]
+        Blocks are tracked with an explicit stack instead of recursion, so
+        nesting depth and file size only cost linear time.
+        """
+        caddyfile = CaddyFile()
+        parsed    = []
+        last_end  = 0
+        # Each frame is (kind, directives list being filled, owning node)
+        stack: List[Tuple[str, list, object]] = []
+        # A directive or frame whose `{` may still arrive alone on the next line
+        pending = None
+        # A site declared without braces owns the rest of the file
+        braceless = None
+
+        def close(line, end):
+            if not stack:
+                raise ValueError(f"Line {line}: unexpected '}}'")
+            kind, _, node = stack.pop()
+            if kind == 'site':
+                node.span = (node.span[0], end)
+                caddyfile.add_site(node)
+                parsed.append(node)
+
+        for line, start, end, words in _tokenize(text):
+            last_end = end
+            while words and words[0] == '}' and type(words[0]) is str:
+                pending = None
+                close(line, end)
+                del words[0]
+            if not words:
+                continue
 
-                if args and args[-1] == "{":
-                    args.pop()
-                    subdirectives, new_index = parse_directives(lines, i + 1)
-                    directives.append(Directive(name, args, subdirectives))
-                    i = new_index + 1
+            opens = words[-1] == '{' and type(words[-1]) is str
+            if opens:
+                del words[-1]
+
+            if not words:
+                if isinstance(pending, Directive):
+                    pending.subdirectives = []
+                    stack.append(('block', pending.subdirectives, pending))
+                    pending = None
+                elif pending is not None:
+                    stack.append(pending)
+                    pending = None
+                elif not stack and not caddyfile.sites and not caddyfile.snippets and not caddyfile.options:
+                    stack.append(('options', caddyfile.options, None))
                 else:
-                    directives.append(Directive(name, args))
-                    i += 1
-            return directives, i
-
-        
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if not line or line.startswith("#"):
-                i += 1
+                    raise ValueError(f"Line {line}: unexpected '{{'")
                 continue
 
-            if line.strip().startswith("{"):
-                i += 1
-                while i < len(lines) and not lines[i].strip().startswith("}"):
-                    inner_line = lines[i].strip()
-                    if inner_line.startswith("admin"):
-                        parts = inner_line.split()
-                        if len(parts) == 2:
-                            caddyfile.admin = parts[1]
-                        elif len(parts) == 1 and i + 1 < len(lines):
-                            next_line = lines[i+1].strip()
-                            caddyfile.admin = next_line
-                            i += 1
-                    i += 1
+            if type(pending) is tuple and pending[0] == 'site':
+                braceless = pending
+                stack.append(pending)
+            pending = None
+
+            if not stack:
+                if words[0] == 'import' and not opens:
+                    caddyfile.imports.append(Directive(words[0], words[1:]))
+                    continue
+
+                if len(words) == 1 and words[0].startswith('(') and words[0].endswith(')'):
+                    directives = []
+                    caddyfile.snippets[words[0][1:-1]] = directives
+                    frame = ('snippet', directives, None)
+                else:
+                    addresses = [a for a in ' '.join(words).replace(',', ' ').split() if a]
+                    site      = SiteBlock(_strip_scheme(addresses[0]), [], None, addresses)
+                    site.span = (start, end)
+                    frame     = ('site', site.directives, site)
+            else:
+                kind, directives, node = stack[-1]
+                directive = Directive(words[0], _intern_args(words[1:]))
+
+                if kind == 'site' and directive.name == 'bind' and not opens:
+                    node.bind = ' '.join(directive.args)
+                    continue
+                if kind == 'options' and directive.name == 'admin':
+                    caddyfile.admin = ' '.join(directive.args) or None
+
+                directives.append(directive)
+                if opens:
+                    directive.subdirectives = []
+                    stack.append(('block', directive.subdirectives, directive))
+                else:
+                    pending = directive
                 continue
 
-            if line.startswith("http://") or line.startswith("https://"):
-                domain = line.split()[0].replace("http://", "").replace("https://", "")
-                current_site = SiteBlock(domain, [], None)
-                i += 1
-
-                while i < len(lines):
-                    inner_line = lines[i].strip()
-                    if inner_line == "}":
-                        caddyfile.add_site(current_site)
-                        current_site = None
-                        i += 1
-                        break
-                    if inner_line.startswith("bind"):
-                        bind_parts = inner_line.split()
-                        if len(bind_parts) == 2:
-                            current_site.bind = bind_parts[1]
-                        i += 1
-                        continue
-
-                    directives, new_index = parse_directives(lines, i)
-                    for directive in directives:
-                        current_site.add_directive(directive)
-                    i = new_index
+            if opens:
+                stack.append(frame)
             else:
-                i += 1
-        return caddyfile
+                pending = frame
+
+        if type(pending) is tuple and pending[0] == 'site':
+            braceless = pending
+            stack.append(pending)
+        if stack and stack != [braceless]:
+            raise ValueError(f"Unclosed '{{' in {stack[-1][0]} block at end of file")
+        if stack:
+            close(None, last_end)
+
+        caddyfile.source = text
+        caddyfile.header = caddyfile.render_header()
+        caddyfile.layout = [site for site in parsed if caddyfile.sites[site.domain] is site]
+        # Hand out a copy so the parsed blocks stay a pristine baseline for save()
+        return caddyfile.copy()
 
 if __name__ == "__main__":
     # caddyfile = CaddyFile(admin="unix//home/khaled/caddy-admin.sock")
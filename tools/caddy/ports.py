@@ -0,0 +1,134 @@
+import os
+import stat
+from typing import Iterable, List, Optional, Set, Tuple
+
+from .health import Upstream, collectUpstreams
+from .models import CaddyFile
+
+PROC_NET_TCP   = ('/proc/net/tcp', '/proc/net/tcp6')
+PORT_RANGE     = '/proc/sys/net/ipv4/ip_local_port_range'
+LOCAL_HOSTS    = ('localhost', '127.0.0.1', '::1', '0.0.0.0', '::', '')
+TCP_LISTEN     = '0A'
+
+def _local_port_range() -> Tuple[int, int]:
+    try:
+        with open(PORT_RANGE) as file:
+            low, high = file.read().split()
+        return int(low), int(high)
+    except (OSError, ValueError):
+        return 32768, 60999
+
+def boundPorts(paths: Iterable[str] = PROC_NET_TCP) -> Tuple[Set[int], Set[int]]:
+    """
+    Local TCP ports from /proc/net/tcp{,6}: (listening, bound in any state).
+    Covers every user's sockets on the host, not only ours.
+    """
+    listening, bound = set(), set()
+    for path in paths:
+        try:
+            with open(path) as file:
+                next(file, None)
+                for line in file:
+                    fields = line.split(None, 4)
+                    port   = int(fields[1].rsplit(':', 1)[1], 16)
+                    bound.add(port)
+                    if fields[3] == TCP_LISTEN:
+                        listening.add(port)
+        except OSError:
+            continue
+    return listening, bound
+
+def _is_local(upstream: Upstream) -> bool:
+    return upstream.port is not None and upstream.host in LOCAL_HOSTS
+
+def _site_ports(caddy: CaddyFile) -> Set[int]:
+    ports = set()
+    for site in dict.values(caddy.sites):
+        for address in site.addresses or ():
+            _, _, port = address.split('://')[-1].split('/')[0].rpartition(':')
+            if port.isdigit():
+                ports.add(int(port))
+    return ports
+
+class PortAllocator:
+    """
+    Free-port allocator over a 64 KiB map with one byte per port, marked for
+    every port the Caddyfile references and every port bound on the host.
+    Handing out a port is a linear scan for a zero byte, run at C speed by
+    `bytearray.find`: forward from a moving cursor, then once more from `low`
+    after wrapping. It is O(n) in the ports taken, not O(1), but cheap even
+    when most of the range is held by other users.
+    """
+    def __init__(self, caddy: Optional[CaddyFile] = None, low: int = 1024, high: Optional[int] = None):
+        ephemeral_low, ephemeral_high = _local_port_range()
+
+        self.low    = low
+        # Kernel-picked ephemeral ports come and go, so stay below that range
+        self.high   = high if high is not None else ephemeral_low - 1
+        self.used   = bytearray(65536)
+        self.cursor = self.low
+
+        self.listening, bound = boundPorts()
+        self.referenced       = set()
+        self.upstreams        = collectUpstreams(caddy) if caddy is not None else []
+
+        for upstream in self.upstreams:
+            if _is_local(upstream):
+                self.referenced.add(upstream.port)
+        if caddy is not None:
+            self.referenced |= _site_ports(caddy)
+
+        for port in bound | self.referenced:
+            self.used[port] = 1
+
+    def isFree(self, port: int) -> bool:
+        return 0 < port < 65536 and not self.used[port]
+
+    @staticmethod
+    def _check(port: int):
+        # Port 0 asks the kernel for any port, and the map would silently take negative indices
+        if not 0 < port < 65536:
+            raise ValueError(f"Port {port} is out of range, it must be between 1 and 65535.")
+
+    def reserve(self, port: int):
+        self._check(port)
+        self.used[port] = 1
+
+    def release(self, port: int):
+        self._check(port)
+        self.used[port] = 0
+        if self.low <= port < self.cursor:
+            self.cursor = port
+
+    def allocate(self) -> int:
+        port = self.used.find(0, self.cursor, self.high + 1)
+        if port == -1:
+            # Wrap around once for ports released behind the cursor
+            port = self.used.find(0, self.low, self.high + 1)
+            if port == -1:
+                raise ValueError(f"No free port left between {self.low} and {self.high}.")
+        self.used[port] = 1
+        self.cursor     = port + 1
+        return port
+
+    def deadUpstreams(self) -> List[Upstream]:
+        """Local reverse_proxy targets nothing is listening on."""
+        dead = []
+        for upstream in self.upstreams:
+            if upstream.socket_path:
+                try:
+                    if not stat.S_ISSOCK(os.stat(upstream.socket_path).st_mode):
+                        dead.append(upstream)
+                except OSError:
+                    dead.append(upstream)
+            elif _is_local(upstream) and upstream.port not in self.listening:
+                dead.append(upstream)
+        return dead
+
+    def describe(self, port: int) -> Optional[str]:
+        """Why `port` is taken, or None when it is free."""
+        if port in self.referenced:
+            return f"Port {port} is already used by a site in the Caddyfile."
+        if self.used[port]:
+            return f"Port {port} is already bound on this host."
+        return None
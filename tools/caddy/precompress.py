@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from utils import atomic_write
+from .models import CaddyFile, Directive, SiteBlock
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Caddy's preference order for `file_server { precompressed ... }`
+PRECOMPRESSED_FORMATS = ('br', 'zstd', 'gzip')
+SUFFIXES              = {'br': '.br', 'zstd': '.zst', 'gzip': '.gz'}
+MANIFEST_DIR          = '~/.cache/nest-cli/precompress'
+# Where manifests used to live, inside the served root
+LEGACY_MANIFEST       = '.precompress.json'
+MIN_SIZE              = 256
+CHUNK_SIZE            = 1 << 20
+
+# Already compressed formats gain nothing from another pass
+SKIP_EXTENSIONS = {
+    '.gz', '.zst', '.br', '.zip', '.7z', '.xz', '.bz2',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.ico',
+    '.woff', '.woff2', '.mp3', '.mp4', '.webm', '.ogg', '.pdf',
+}
+
+def availableFormats() -> List[str]:
+    formats = ['gzip']
+    if zstandard is not None:
+        formats.insert(0, 'zstd')
+    if brotli is not None:
+        formats.insert(0, 'br')
+    return formats
+
+def precompressedDirective(formats=PRECOMPRESSED_FORMATS) -> Directive:
+    return Directive("precompressed", list(formats))
+
+@dataclass
+class StaticRoot:
+    domain: str
+    path: str
+    file_servers: List[Directive] = field(default_factory=list)
+
+@dataclass
+class PrecompressReport:
+    root: str
+    compressed: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    saved_bytes: int = 0
+    errors: List[str] = field(default_factory=list)
+
+def _root_path(directive: Directive) -> Optional[str]:
+    args = list(directive.args)
+    if len(args) == 2:
+        args = args[1:]
+    if len(args) != 1 or '{' in args[0]:
+        return None
+    return os.path.expanduser(args[0])
+
+def staticRoots(caddy: CaddyFile) -> List[StaticRoot]:
+    """
+    Every directory served by file_server, with the file_server directives
+    serving it. A block's `root` applies to file_servers nested below it
+    unless they set their own.
+    """
+    roots: Dict[str, StaticRoot] = {}
+
+    for site in dict.values(caddy.sites):
+        stack = [(site.directives, None)]
+        while stack:
+            directives, inherited = stack.pop()
+            root = inherited
+            for directive in directives:
+                if directive.name == 'root':
+                    root = _root_path(directive) or root
+
+            for directive in directives:
+                if directive.name == 'file_server' and root:
+                    entry = roots.setdefault(root, StaticRoot(site.domain, root))
+                    entry.file_servers.append(directive)
+                elif directive.subdirectives and directive.name != 'file_server':
+                    stack.append((directive.subdirectives, root))
+
+    return list(roots.values())
+
+def enablePrecompressed(site: SiteBlock, formats=PRECOMPRESSED_FORMATS) -> bool:
+    """Add `precompressed` to every file_server in `site` that lacks it."""
+    changed = False
+    stack   = list(site.directives)
+    while stack:
+        directive = stack.pop()
+        if directive.name == 'file_server':
+            if not any(sub.name == 'precompressed' for sub in directive.subdirectives):
+                directive.add_subdirective(precompressedDirective(formats))
+                changed = True
+        else:
+            stack.extend(directive.subdirectives)
+    return changed
+
+def _fingerprint(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _compressor(fmt: str):
+    """(compress, flush) of an incremental compressor for `fmt`."""
+    if fmt == 'gzip':
+        # wbits 31 writes a gzip container; its header carries no mtime
+        stream = zlib.compressobj(9, zlib.DEFLATED, 31)
+        return stream.compress, stream.flush
+    if fmt == 'zstd':
+        stream = zstandard.ZstdCompressor(level=19).compressobj()
+        return stream.compress, stream.flush
+    stream = brotli.Compressor(quality=11)
+    return stream.process, stream.finish
+
+def _compress_file(job: Tuple[str, List[str], Optional[str]]):
+    """Worker: (path, formats, previous hash) -> (path, hash, saved bytes, error)."""
+    path, formats, previous = job
+    outputs = {}
+    try:
+        st     = os.stat(path)
+        digest = _fingerprint(path)
+        if digest == previous and all(os.path.exists(path + SUFFIXES[fmt]) for fmt in formats):
+            return path, digest, None, None
+
+        # Every format is fed the same chunks, so the file is read once and
+        # never held in memory as a whole
+        for fmt in formats:
+            compress, flush = _compressor(fmt)
+            tmp             = f"{path}{SUFFIXES[fmt]}.tmp{os.getpid()}"
+            outputs[fmt]    = (tmp, open(tmp, 'wb'), compress, flush)
+        size = 0
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+                for _, out, compress, _ in outputs.values():
+                    out.write(compress(chunk))
+
+        saved = 0
+        for fmt, (tmp, out, _, flush) in outputs.items():
+            out.write(flush())
+            out.close()
+            sibling    = path + SUFFIXES[fmt]
+            compressed = os.path.getsize(tmp)
+            if compressed < size:
+                # Match the source's mtime so the sidecar's Last-Modified agrees with it
+                os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+                os.replace(tmp, sibling)
+                saved += size - compressed
+            else:
+                os.unlink(tmp)
+                if os.path.exists(sibling):
+                    os.unlink(sibling)
+        return path, digest, saved, None
+    except Exception as e:
+        # Reported per file; one bad file must not stop the rest of the pool
+        return path, None, None, str(e) if isinstance(e, OSError) else f"{type(e).__name__}: {e}"
+    finally:
+        for tmp, out, _, _ in outputs.values():
+            out.close()
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+def _manifest_path(root: str) -> str:
+    # Kept out of the served directory, which must not list its own files
+    key = hashlib.blake2b(os.path.realpath(root).encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(os.path.expanduser(MANIFEST_DIR), key + '.json')
+
+def _wanted(name: str, size: int) -> bool:
+    if name == LEGACY_MANIFEST or size < MIN_SIZE:
+        return False
+    return os.path.splitext(name)[1].lower() not in SKIP_EXTENSIONS
+
+def precompressRoot(root: str, formats: Optional[List[str]] = None, workers: Optional[int] = None,
+                    pool: Optional[ProcessPoolExecutor] = None) -> PrecompressReport:
+    """
+    Write .gz/.zst/.br siblings for every compressible file under `root`.
+
+    A manifest per root under ~/.cache/nest-cli remembers each file's size,
+    mtime and content hash, so files with an unchanged stat are skipped
+    without being read, and files only touched (same hash) are not
+    recompressed. Siblings of files that were deleted are removed.
+    """
+    formats = formats or availableFormats()
+    report  = PrecompressReport(root)
+    path    = _manifest_path(root)
+
+    try:
+        os.unlink(os.path.join(root, LEGACY_MANIFEST))
+    except OSError:
+        pass
+
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = {}
+    if manifest.get('formats') != formats:
+        manifest = {}
+    files = manifest.get('files', {})
+
+    seen, jobs = {}, []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            full = os.path.join(directory, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            if not _wanted(name, st.st_size):
+                continue
+
+            rel       = os.path.relpath(full, root)
+            entry     = files.get(rel)
+            seen[rel] = entry
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                report.unchanged += 1
+            else:
+                jobs.append((full, formats, entry[2] if entry else None))
+
+    if jobs:
+        own_pool = pool is None
+        pool     = pool or ProcessPoolExecutor(max_workers=workers)
+        try:
+            for full, digest, saved, error in pool.map(_compress_file, jobs, chunksize=16):
+                rel = os.path.relpath(full, root)
+                if error:
+                    report.errors.append(f"{rel}: {error}")
+                    seen.pop(rel, None)
+                    continue
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    seen.pop(rel, None)
+                    continue
+                seen[rel] = [st.st_size, st.st_mtime_ns, digest]
+                if saved is None:
+                    report.unchanged += 1
+                else:
+                    report.compressed  += 1
+                    report.saved_bytes += saved
+        finally:
+            if own_pool:
+                pool.shutdown()
+
+    for rel in set(files) - set(seen):
+        for fmt in formats:
+            try:
+                os.unlink(os.path.join(root, rel) + SUFFIXES[fmt])
+                report.removed += 1
+            except OSError:
+                pass
+
+    if seen != files:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, json.dumps({'formats': formats, 'files': seen}))
+        except OSError as e:
+            report.errors.append(f"{path}: {e}")
+    return report
+
+def precompressSites(caddy: CaddyFile, workers: Optional[int] = None) -> List[PrecompressReport]:
+    """Precompress every static root in the Caddyfile, sharing one process pool."""
+    roots   = [root for root in staticRoots(caddy) if os.path.isdir(root.path)]
+    formats = availableFormats()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [precompressRoot(root.path, formats, pool=pool) for root in roots]
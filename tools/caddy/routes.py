@@ -0,0 +1,266 @@
+import re
+from functools import cmp_to_key
+from typing import Dict, List, Optional, Tuple
+
+ROUTE_DIRECTIVES = ('handle', 'handle_path', 'reverse_proxy')
+
+def routeMatcher(directive) -> Optional[str]:
+    """
+    The path or named matcher of a route directive, '' when it matches every
+    request, or None when the directive is not a route at all.
+    """
+    if directive.name not in ROUTE_DIRECTIVES:
+        return None
+    if not directive.args:
+        return ''
+
+    matcher = directive.args[0]
+    # `reverse_proxy :8080` has no matcher, its first argument is an upstream
+    if matcher[0] not in '/*@':
+        return ''
+    return '' if matcher == '*' else matcher
+
+class Route:
+    __slots__ = ('path', 'literal', 'kind', 'pattern', 'directive', 'order', 'children')
+
+    def __init__(self, path: str, directive, order: int):
+        self.path      = path
+        self.directive = directive
+        self.order     = order
+        self.children  = None
+        self.pattern   = None
+
+        if not path:
+            self.kind    = 'prefix'
+            self.literal = ''
+        elif '*' not in path:
+            self.kind    = 'exact'
+            self.literal = path
+        elif path.index('*') == len(path) - 1:
+            self.kind    = 'prefix'
+            self.literal = path[:-1]
+        else:
+            self.kind    = 'glob'
+            self.literal = path[:path.index('*')]
+            self.pattern = re.compile('.*'.join(re.escape(part) for part in path.split('*')) + r'\Z')
+
+    def matches(self, path: str) -> bool:
+        if self.kind == 'exact':
+            return path == self.path
+        if self.kind == 'prefix':
+            return path.startswith(self.literal)
+        return self.pattern.match(path) is not None
+
+    def sort_key(self) -> Tuple[int, int]:
+        # Caddy tries the longest path matcher first, then the earliest one
+        return (-len(self.path), self.order)
+
+    def precedes(self, other: 'Route') -> bool:
+        """Whether caddy tries this route before `other`."""
+        mine, theirs = _stem(self.path), _stem(other.path)
+        if mine == theirs and self.path != other.path:
+            # `/api/` against `/api/*`: the one without the wildcard is more
+            # specific and goes first, although it is shorter
+            return len(self.path) < len(other.path)
+        return self.sort_key() < other.sort_key()
+
+    def __str__(self):
+        return f"{self.directive.name} {self.path or '(catch-all)'}"
+
+def _stem(path: str) -> str:
+    return path[:-1] if path.endswith('*') else path
+
+def _compare(a: Route, b: Route) -> int:
+    return -1 if a.precedes(b) else 1 if b.precedes(a) else 0
+
+class _Node:
+    __slots__ = ('children', 'exact', 'prefix', 'globs')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.exact:  List[Route] = []
+        self.prefix: List[Route] = []
+        self.globs:  List[Route] = []
+
+class RouteConflicts:
+    def __init__(self):
+        self.duplicates:  List[Route] = []
+        self.shadowed_by: List[Route] = []
+        self.shadows:     List[Route] = []
+        self.overlaps:    List[Route] = []
+
+    def blocking(self) -> bool:
+        return bool(self.duplicates or self.shadowed_by or self.shadows)
+
+    def describe(self, matcher: str) -> str:
+        if self.duplicates:
+            return "Path actually does exist in this site block!"
+        if self.shadowed_by:
+            return f"{matcher} would never be reached, {self.shadowed_by[0]} already serves all of it."
+        if self.shadows:
+            return f"{matcher} would take over every request of {self.shadows[0]}."
+        if self.overlaps:
+            return f"{matcher} overlaps " + ", ".join(str(route) for route in self.overlaps)
+        return ""
+
+class RouteIndex:
+    """
+    Character trie over the path matchers of one block's handle, handle_path
+    and reverse_proxy directives, keyed by the literal part before the first
+    `*`. Lookups and conflict checks for an exact path walk the trie along a
+    single path, so they cost O(path length) however many routes the site
+    has. A prefix or glob matcher also overlaps every route below its
+    literal, so its check costs O(path length + the subtree under it): the
+    routes it reports plus the trie nodes leading to them, nothing else.
+    Nested handle blocks get their own index, scoped under the parent's path.
+    """
+    def __init__(self, directives=(), scope: str = ''):
+        self.scope  = scope
+        self.root   = _Node()
+        self.named: Dict[str, List[Route]] = {}
+        self.routes: Dict[int, Route] = {}
+        self.order  = 0
+
+        for directive in directives:
+            self.add(directive)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def _walk(self, literal: str, create: bool = False) -> Optional[_Node]:
+        node = self.root
+        for char in literal:
+            child = node.children.get(char)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[char] = _Node()
+            node = child
+        return node
+
+    def _path(self, matcher: str) -> str:
+        if not matcher or matcher.startswith('@'):
+            return matcher
+        return self.scope + matcher
+
+    def add(self, directive) -> Optional[Route]:
+        matcher = routeMatcher(directive)
+        if matcher is None:
+            return None
+
+        route       = Route(self._path(matcher), directive, self.order)
+        self.order += 1
+        self.routes[id(directive)] = route
+
+        if matcher.startswith('@'):
+            self.named.setdefault(matcher, []).append(route)
+        else:
+            node = self._walk(route.literal, create=True)
+            getattr(node, route.kind if route.kind != 'glob' else 'globs').append(route)
+
+        if directive.subdirectives:
+            # handle_path strips its prefix, so nested paths are relative to it
+            scope          = route.literal.rstrip('/') if directive.name == 'handle_path' else self.scope
+            route.children = RouteIndex(directive.subdirectives, scope)
+        return route
+
+    def remove(self, directive) -> Optional[Route]:
+        route = self.routes.pop(id(directive), None)
+        if route is None:
+            return None
+
+        if route.path.startswith('@'):
+            self.named[route.path].remove(route)
+        else:
+            path = [self.root]
+            for char in route.literal:
+                path.append(path[-1].children[char])
+            getattr(path[-1], route.kind if route.kind != 'glob' else 'globs').remove(route)
+            # Prune the branch it leaves empty, so subtree walks only meet live routes
+            for depth in range(len(route.literal), 0, -1):
+                node = path[depth]
+                if node.children or node.exact or node.prefix or node.globs:
+                    break
+                del path[depth - 1].children[route.literal[depth - 1]]
+        return route
+
+    def lookup(self, path: str) -> List[Route]:
+        """The chain of routes serving `path`, outermost first; empty if none does."""
+        candidates = list(self.root.prefix) + [r for r in self.root.globs if r.matches(path)]
+        node = self.root
+        for char in path:
+            node = node.children.get(char)
+            if node is None:
+                break
+            candidates.extend(node.prefix)
+            candidates.extend(route for route in node.globs if route.matches(path))
+        else:
+            candidates.extend(node.exact)
+
+        if not candidates:
+            return []
+        winner = min(candidates, key=cmp_to_key(_compare))
+        chain  = [winner]
+        if winner.children is not None:
+            chain.extend(winner.children.lookup(path))
+        return chain
+
+    def conflicts(self, matcher: str) -> RouteConflicts:
+        """
+        How a new route with `matcher` would interact with the existing ones.
+        Exact paths cost O(path length); prefixes and globs also visit the
+        subtree below their literal, since every route there overlaps them.
+        """
+        result = RouteConflicts()
+        if matcher == '*':
+            matcher = ''
+
+        if matcher.startswith('@'):
+            result.duplicates.extend(self.named.get(matcher, []))
+            return result
+
+        new  = Route(self._path(matcher), None, self.order)
+        node = self.root
+        for depth in range(len(new.literal) + 1):
+            for route in node.prefix + node.globs:
+                if route.path == new.path:
+                    result.duplicates.append(route)
+                elif not route.path:
+                    # Catch-alls always run last, they overlap everything by design
+                    continue
+                elif new.kind == 'exact' and route.matches(new.path):
+                    # It covers every path the new route would match
+                    if route.precedes(new):
+                        result.shadowed_by.append(route)
+                    else:
+                        result.overlaps.append(route)
+                elif route.kind == 'prefix' or new.kind != 'exact':
+                    result.overlaps.append(route)
+
+            if depth == len(new.literal):
+                below = list(node.exact)
+                if new.kind != 'exact':
+                    for child in node.children.values():
+                        below.extend(self._subtree(child))
+                for route in below:
+                    if route.path == new.path:
+                        result.duplicates.append(route)
+                    elif route.kind == 'exact' and new.matches(route.path) and new.precedes(route):
+                        result.shadows.append(route)
+                    elif new.kind != 'exact':
+                        result.overlaps.append(route)
+                break
+
+            node = node.children.get(new.literal[depth])
+            if node is None:
+                break
+
+        return result
+
+    def _subtree(self, node: _Node) -> List[Route]:
+        routes, stack = [], [node]
+        while stack:
+            node = stack.pop()
+            routes.extend(node.exact + node.prefix + node.globs)
+            stack.extend(node.children.values())
+        return routes
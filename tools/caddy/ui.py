@@ -1,9 +1,49 @@
 import os
+import time
 from colorama import Fore
 import questionary
-from .management import listSites, addReverseProxy, addStaticRoute, saveUpdatedSite, deleteSite
+from .management import CADDYFILE_PATH, CaddyTransaction, CaddyTransactionError, loadExpandedCaddyFile, listSites, addReverseProxy, addStaticRoute, saveUpdatedSite, deleteSite, previewSiteChanges
+from .validate import CaddyValidationError
+from .health import collectUpstreams, formatProbeTable, probeUpstreams
+from .ports import PortAllocator
+from .watch import CaddyfileWatcher
+from .logs import analyzeLogs, formatStatsTable, logFiles
+from .precompress import precompressedDirective, precompressSites, staticRoots, enablePrecompressed
 from .models import SiteBlock, Directive
 
+def printApplyResult(result):
+    if result is None:
+        return
+    if result.error:
+        print(f"{Fore.YELLOW}Saved, but the running Caddy was not updated: {result.error}{Fore.RESET}")
+    elif result.method == 'noop':
+        print(f"{Fore.CYAN}Running Caddy already has this configuration.{Fore.RESET}")
+    else:
+        print(f"{Fore.GREEN}Applied live via {result.method} in {result.elapsed * 1000:.0f} ms{Fore.RESET}")
+
+def printOverlaps(site, route_path):
+    conflicts = site.routes.conflicts(route_path)
+    if conflicts.overlaps and not conflicts.blocking():
+        print(f"{Fore.YELLOW}Note: {conflicts.describe(route_path)}{Fore.RESET}")
+
+def askPort(ports, prompt):
+    suggested = ports.allocate()
+    while True:
+        port = input(f"{prompt} (e.g. 8080, Enter for free port {suggested}): ").strip() or str(suggested)
+        if port == str(suggested):
+            return port
+
+        if port.isdigit():
+            try:
+                ports.reserve(int(port))
+            except ValueError as e:
+                print(Fore.RED + str(e) + Fore.RESET)
+                continue
+            if int(port) in ports.referenced:
+                print(f"{Fore.YELLOW}Note: {ports.describe(int(port))}{Fore.RESET}")
+        ports.release(suggested)
+        return port
+
 def start():
     while True:
         print(Fore.MAGENTA + "\nCaddy Management:" + Fore.RESET)
@@ -11,6 +51,10 @@ def start():
         print("2- Add Site")
         print("3- Update Site")
         print("4- Delete Site")
+        print("5- Check Upstream Health")
+        print("6- Precompress Static Sites")
+        print("7- Analyze Access Logs")
+        print("8- Watch Caddyfile")
         print("0- Back to Main Menu")
 
         try:
@@ -19,7 +63,7 @@ def start():
             print(Fore.RED + "Please, enter a valid choice!" + Fore.RESET)
             continue
         
-        if res < 0 or res > 4:
+        if res < 0 or res > 8:
             print(Fore.RED + "Please, enter a choice in valid range!" + Fore.RESET)
             continue
         
@@ -28,11 +72,14 @@ def start():
             break
 
         if res == 1:
-            sites = listSites()
+            expansion = loadExpandedCaddyFile()
+            main_file = os.path.abspath(os.path.expanduser(CADDYFILE_PATH))
 
             print("\n")
-            for i, (domain, siteBlock) in enumerate(sites.items()):
-                print(f"{i+1}. {domain}")
+            for i, domain in enumerate(expansion.caddy.sites):
+                origin = expansion.origins.get(domain, main_file)
+                source = f" {Fore.CYAN}(from {origin}){Fore.RESET}" if origin != main_file else ""
+                print(f"{i+1}. {domain}{source}")
             print("\n")
         elif res == 3:
             sites   = listSites()
@@ -43,6 +90,9 @@ def start():
                     choices=choices
                 ).ask()
             
+            ports = PortAllocator(loadExpandedCaddyFile().caddy)
+            dead  = [u.target for u in ports.deadUpstreams() if any(use.split(' > ')[0] == domain for use in u.used_by)]
+
             while True:
                 updated_site       = sites[domain]
                 encoding_directive = None
@@ -66,6 +116,8 @@ def start():
                     print(f"{Fore.MAGENTA}Root Directory:{Fore.RESET}", sites[domain].directives[0].args[1])
                 if root_reverseproxy != None:
                     print(f"{Fore.MAGENTA}Root Reverse Proxy:{Fore.RESET}", root_reverseproxy.args[0])
+                if dead:
+                    print(f"{Fore.RED}Nothing is listening on:{Fore.RESET}", ", ".join(dead))
                 
                 if len(handles) != 0:
                     print(Fore.MAGENTA + "Routes:" + Fore.RESET)
@@ -82,15 +134,16 @@ def start():
 
                 action = questionary.select(
                         "Choose an action:",
-                        choices=['Add Reverse Proxy', 'Add Static Route', 'Delete Route', 'Save Changes', 'Cancel']
+                        choices=['Add Reverse Proxy', 'Add Static Route', 'Delete Route', 'Find Route for Path', 'Save Changes', 'Cancel']
                     ).ask()
             
 
                 if action == 'Add Reverse Proxy':
                     route_path = input("Enter Path (e.g. /api/*): ")
-                    route_port = input("Enter Target (e.g. 8080): ")
+                    route_port = askPort(ports, "Enter Target")
                     
                     try:
+                        printOverlaps(sites[domain], route_path)
                         updated_site = addReverseProxy(sites[domain], route_path, route_port)
                         print(f"Reverse Proxy Added:\n{route_path} → :{route_port}")
                     except ValueError as e:
@@ -101,6 +154,7 @@ def start():
                     path       = input("Enter Folder Path: ")
 
                     try:
+                        printOverlaps(sites[domain], route_path)
                         updated_site = addStaticRoute(sites[domain], route_path, path)
                         print(f"Static Route Added:\n{route_path} → :{path}")
                     except ValueError as e:
@@ -111,19 +165,126 @@ def start():
                         print(f"{i+1}. {route.args[0]}")
                     
                     route_to_delete = int(input("Which route would you like to delete? "))
-                    if route_to_delete <= len(handles):
-                        updated_site.directives.remove(handles[route_to_delete])
+                    if 1 <= route_to_delete <= len(handles):
+                        updated_site.remove_directive(handles[route_to_delete - 1])
                         print(f"Route deleted successfully!")
                     else:
                         print("Sorry, but you chose a route that doesn't exist.")
                 
+                if action == 'Find Route for Path':
+                    request_path = input("Enter Request Path (e.g. /api/users): ")
+                    chain        = updated_site.routes.lookup(request_path)
+
+                    if chain:
+                        print(f"{request_path} → " + " → ".join(str(route) for route in chain))
+                    else:
+                        print(f"{request_path} → (no route, site-level directives)")
+
                 if action == 'Save Changes':
-                    saveUpdatedSite(updated_site)
+                    changes = previewSiteChanges(updated_site)
+                    if not changes:
+                        print(Fore.CYAN + "Nothing changed, no save needed." + Fore.RESET)
+                        break
+
+                    print(Fore.MAGENTA + "Changes:" + Fore.RESET)
+                    for change in changes:
+                        color = {'added': Fore.GREEN, 'removed': Fore.RED}.get(change.kind, Fore.YELLOW)
+                        print(f"  {color}{change}{Fore.RESET}")
+
+                    try:
+                        result = saveUpdatedSite(updated_site)
+                    except CaddyValidationError as e:
+                        print(f"{Fore.RED}{e}\nNothing was saved.{Fore.RESET}")
+                        continue
                     print("Updates saved successfully!")
+                    printApplyResult(result)
                     break
                 
                 if action == 'Cancel':
                     break
+        elif res == 5:
+            upstreams = collectUpstreams(loadExpandedCaddyFile().caddy)
+            if not upstreams:
+                print(Fore.CYAN + "No reverse_proxy upstreams found." + Fore.RESET)
+                continue
+
+            print(Fore.YELLOW + f"\nProbing {len(upstreams)} upstreams...\n" + Fore.RESET)
+            started = time.perf_counter()
+            results = probeUpstreams(upstreams)
+            colors  = {'up': Fore.GREEN, 'down': Fore.RED, 'timeout': Fore.RED}
+
+            lines = formatProbeTable(results)
+            print(Fore.MAGENTA + lines[0] + Fore.RESET)
+            for line in lines[1:]:
+                print(colors.get(line.split()[0], Fore.YELLOW) + line + Fore.RESET)
+
+            up = sum(result.status == 'up' for result in results)
+            print(f"\n{up}/{len(results)} up, checked in {time.perf_counter() - started:.2f}s")
+        elif res == 6:
+            caddy = loadExpandedCaddyFile().caddy
+            roots = staticRoots(caddy)
+            if not roots:
+                print(Fore.CYAN + "No file_server roots found." + Fore.RESET)
+                continue
+
+            print(Fore.YELLOW + f"\nPrecompressing {len(roots)} static roots...\n" + Fore.RESET)
+            started = time.perf_counter()
+            for report in precompressSites(caddy):
+                print(f" - {report.root}: {report.compressed} compressed, {report.unchanged} unchanged, "
+                      f"{report.removed} stale removed, {report.saved_bytes / 1024:.0f} KiB saved")
+                for error in report.errors:
+                    print(f"   {Fore.RED}{error}{Fore.RESET}")
+            print(f"Done in {time.perf_counter() - started:.2f}s")
+
+            try:
+                # Sites defined in imported files are left for their own file
+                editable = listSites()
+                with CaddyTransaction() as tx:
+                    for domain in {root.domain for root in roots if root.domain in editable}:
+                        tx.update(domain, enablePrecompressed)
+                printApplyResult(tx.result)
+            except CaddyTransactionError as e:
+                print(f"{Fore.RED}{e}{Fore.RESET}")
+        elif res == 7:
+            caddy = loadExpandedCaddyFile().caddy
+            paths = logFiles(caddy)
+            if not paths:
+                print(Fore.CYAN + "No site logs to a file. Add `log { output file <path> }` to a site first." + Fore.RESET)
+                continue
+
+            print(Fore.YELLOW + f"\nReading {len(paths)} access logs...\n" + Fore.RESET)
+            started        = time.perf_counter()
+            analyzer, read = analyzeLogs(caddy, paths)
+
+            for title, stats, label in (("Per Host:", analyzer.hosts, str),
+                                        ("Per Route:", analyzer.routes, lambda key: f"{key[0]} {key[1]}")):
+                lines = formatStatsTable(stats, label)
+                print(Fore.MAGENTA + title + Fore.RESET)
+                print(Fore.MAGENTA + lines[0] + Fore.RESET)
+                print("\n".join(lines[1:]) + "\n")
+            print(f"{read} new entries read in {time.perf_counter() - started:.2f}s")
+        elif res == 8:
+            def report(reload):
+                stamp = time.strftime('%H:%M:%S')
+                files = ", ".join(os.path.basename(path) for path in reload.files)
+                if reload.skipped:
+                    print(f"[{stamp}] {files} touched, content unchanged")
+                elif reload.error:
+                    print(f"{Fore.RED}[{stamp}] {files} changed, not reloaded:\n{reload.error}{Fore.RESET}")
+                elif not reload.applied:
+                    print(f"{Fore.YELLOW}[{stamp}] {files} changed, saved, not applied "
+                          f"(the admin endpoint is off){Fore.RESET}")
+                else:
+                    print(f"{Fore.GREEN}[{stamp}] {files} changed, reloaded "
+                          f"({reload.events} writes, {reload.coalesced} reloads coalesced){Fore.RESET}")
+                    printApplyResult(reload.result)
+
+            watcher = CaddyfileWatcher(on_reload=report)
+            print(Fore.YELLOW + f"\nWatching {len(watcher.files)} files"
+                  f"{'' if watcher.inotify else ' (polling)'}, Ctrl+C to stop...\n" + Fore.RESET)
+            watcher.run()
+            watcher.close()
+            print(f"\n{watcher.reloads} reloads, {watcher.coalesced} coalesced into them.")
         elif res == 4:
             sites   = listSites()
             choices = list(sites.keys())
@@ -136,14 +297,19 @@ def start():
             confirmation = input(f"Are you sure you want to delete site \"{site_to_delete}\"? (y/n):")
 
             if confirmation == 'y':
-                deleteSite(sites[site_to_delete])
-                print("Site deleted successfully!")
+                try:
+                    result = deleteSite(sites[site_to_delete])
+                    print("Site deleted successfully!")
+                    printApplyResult(result)
+                except CaddyValidationError as e:
+                    print(f"{Fore.RED}{e}\nNothing was deleted.{Fore.RESET}")
 
                 input("Press any key to continue ...")
         elif res == 2:
             print("Adding a new site:")
             domain    = input("Enter Domain: ")
             site      = SiteBlock(domain, [], f"unix//home/khaled/.{domain}.webserver.sock")
+            ports     = PortAllocator(loadExpandedCaddyFile().caddy)
             site_type = questionary.select(
                     "Choose Site Type:",
                     choices=('Static File Hosting', 'Reverse Proxy', 'Mixed (Static + Reverse Proxy)')
@@ -153,16 +319,17 @@ def start():
                 root_dir_path = input('Enter Root Folder Path: ')
                 site.add_directive(Directive("root", ["*", root_dir_path]))
                 site.add_directive(Directive("file_server", subdirectives=[
-                    Directive("hide", [".git", ".env"])
+                    Directive("hide", [".git", ".env"]),
+                    precompressedDirective()
                 ]))
             elif site_type == 'Reverse Proxy':
-                proxy_port = input('Enter Proxy Target (e.g. 8080): ')
+                proxy_port = askPort(ports, 'Enter Proxy Target')
                 site.add_directive(Directive("reverse_proxy", [f"localhost:{proxy_port}"]))
             elif site_type == 'Mixed (Static + Reverse Proxy)':
                 print("Add Reverse Proxy Routes:")
                 while True:
                     path = input("Enter route Path: ")
-                    port = input("Enter route Port: ")
+                    port = askPort(ports, "Enter route Port")
 
                     site.add_directive(Directive("handle", [path], [
                         Directive("reverse_proxy", [f":{port}"])
@@ -180,7 +347,7 @@ def start():
 
                     site.add_directive(Directive("handle_path", [path], [
                         Directive("root", ["*", folder]),
-                        Directive("file_server")
+                        Directive("file_server", subdirectives=[precompressedDirective()])
                     ]))
 
                     wanna_another = input("Add another? (y/n): ")
@@ -193,5 +360,10 @@ def start():
                 if gzipEncoding.lower() == 'y':
                     site.add_directive(Directive("encode", ["gzip"]))
                 
-                print(Fore.GREEN + "Site created Successfully!" + Fore.RESET)
-                saveUpdatedSite(site)
\ No newline at end of file
+                try:
+                    result = saveUpdatedSite(site)
+                except CaddyValidationError as e:
+                    print(f"{Fore.RED}{e}\nThe site was not created.{Fore.RESET}")
+                else:
+                    print(Fore.GREEN + "Site created Successfully!" + Fore.RESET)
+                    printApplyResult(result)
\ No newline at end of file
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from utils import atomic_write
+from .models import CaddyFile
+
+CACHE_DIR = '~/.cache/nest-cli/caddy-validate'
+# Upper bound on the caddy runs spent pinpointing the failing site blocks
+MAX_BLAME_RUNS = 24
+# Persisted per-block verdicts kept, newest last
+MAX_SITE_VERDICTS = 4096
+
+class CaddyValidationError(ValueError):
+    def __init__(self, result: 'ValidationResult'):
+        where = f" (in {', '.join(result.sites)})" if result.sites else ""
+        super().__init__(f"Caddy rejected the new Caddyfile{where}:\n{result.output.strip()}")
+        self.result = result
+
+@dataclass
+class ValidationResult:
+    valid: bool
+    adapted: Optional[dict] = None
+    output: str = ''
+    sites: List[str] = field(default_factory=list)    # blocks that fail on their own
+    cached: bool = False
+
+# content hash -> ValidationResult, shared by every save in this process
+_results: Dict[str, ValidationResult] = {}
+# (header hash, site digest) -> whether that block adapts on its own
+_site_verdicts: Dict[tuple, bool] = {}
+_site_verdicts_loaded = False
+# text hash -> adapted JSON of the latest valid result for that text
+_recent: Dict[str, dict] = {}
+_lock = threading.Lock()
+
+def _key(text: str, dependencies: Iterable[str] = ()) -> str:
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16)
+    # Imported files are part of what caddy validates, so they are part of the key
+    for path in dependencies:
+        digest.update(b'\0' + path.encode('utf-8') + b'\0')
+        try:
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+def _cache_path(key: str) -> str:
+    return os.path.join(os.path.expanduser(CACHE_DIR), key + '.json')
+
+def _load(key: str) -> Optional[ValidationResult]:
+    try:
+        with open(_cache_path(key), 'r', encoding='utf-8') as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return ValidationResult(data['valid'], data.get('adapted'), data.get('output', ''), data.get('sites', []), cached=True)
+
+def _store(key: str, result: ValidationResult):
+    # A rejection can come from the surroundings (a missing certificate, a
+    # caddy without some plugin), so only passes outlive this process
+    if not result.valid:
+        return
+    data = {'valid': result.valid, 'adapted': result.adapted, 'output': result.output, 'sites': result.sites}
+    try:
+        os.makedirs(os.path.expanduser(CACHE_DIR), exist_ok=True)
+        atomic_write(_cache_path(key), json.dumps(data))
+    except OSError:
+        # The cache only saves time, a read-only home must not block a save
+        pass
+
+def _sites_path() -> str:
+    return os.path.join(os.path.expanduser(CACHE_DIR), 'sites.json')
+
+def _load_site_verdicts():
+    """Merge the blocks known to be good from earlier runs, once per process."""
+    global _site_verdicts_loaded
+    with _lock:
+        if _site_verdicts_loaded:
+            return
+        _site_verdicts_loaded = True
+    try:
+        with open(_sites_path(), 'r', encoding='utf-8') as file:
+            keys = json.load(file)
+    except (OSError, ValueError):
+        return
+    with _lock:
+        for key in keys:
+            header_hash, _, digest = str(key).partition(':')
+            _site_verdicts.setdefault((header_hash, bytes.fromhex(digest)), True)
+
+def _store_site_verdicts():
+    with _lock:
+        keys = [f"{header_hash}:{digest.hex()}" for (header_hash, digest), valid in _site_verdicts.items() if valid]
+    try:
+        os.makedirs(os.path.expanduser(CACHE_DIR), exist_ok=True)
+        atomic_write(_sites_path(), json.dumps(keys[-MAX_SITE_VERDICTS:]))
+    except OSError:
+        pass
+
+def _run_adapt(text: str, directory: str) -> ValidationResult:
+    # The file is written next to the real one so relative imports resolve
+    fd, path = tempfile.mkstemp(prefix='.Caddyfile.validate-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+        process = subprocess.run(
+            ['caddy', 'adapt', '--config', path, '--adapter', 'caddyfile', '--validate'],
+            capture_output=True,
+            text=True
+        )
+    finally:
+        os.unlink(path)
+
+    output = process.stderr.replace(path, 'Caddyfile')
+    if process.returncode != 0:
+        return ValidationResult(False, output=output)
+    try:
+        adapted = json.loads(process.stdout)
+    except ValueError:
+        adapted = None
+    return ValidationResult(True, adapted, output)
+
+def cachedResult(text: str, dependencies: Iterable[str] = ()) -> Optional[ValidationResult]:
+    """The cached verdict for `text`, without ever running caddy."""
+    key = _key(text, dependencies)
+    with _lock:
+        result = _results.get(key)
+    if result is None:
+        result = _load(key)
+        if result is not None:
+            with _lock:
+                _results[key] = result
+    return result
+
+def recentAdaptation(text: str) -> Optional[dict]:
+    """Adapted JSON from the latest successful validation of `text`, if any."""
+    with _lock:
+        return _recent.get(_key(text))
+
+def _remember(text: str, result: ValidationResult):
+    if result.valid and result.adapted is not None:
+        with _lock:
+            if len(_recent) >= 32:
+                _recent.pop(next(iter(_recent)))
+            _recent[_key(text)] = result.adapted
+
+def _blame_sites(caddy: CaddyFile, directory: str, header_hash: str) -> List[str]:
+    """
+    Bisect the blocks not already known to be good, adapting each half under
+    the file's global options, to point at the ones that break the config.
+    A single bad block among n costs about 2*log2(n) caddy runs, and no more
+    than MAX_BLAME_RUNS are spent in total. Blocks that only fail together
+    with another one are not blamed.
+    """
+    header   = caddy.render_header()
+    sites    = list(dict.values(caddy.sites))
+    broken   = set()
+    suspects = []
+    for site in sites:
+        with _lock:
+            verdict = _site_verdicts.get((header_hash, site.digest()))
+        if verdict is False:
+            broken.add(site.domain)
+        elif verdict is None:
+            suspects.append(site)
+
+    runs = 0
+    def check(group: List, failed: bool = False):
+        nonlocal runs
+        if not failed:
+            if runs >= MAX_BLAME_RUNS:
+                return
+            runs += 1
+            valid = _run_adapt(header + '\n' + '\n'.join(site.render() for site in group), directory).valid
+            if valid or len(group) == 1:
+                with _lock:
+                    for site in group:
+                        _site_verdicts[(header_hash, site.digest())] = valid
+                if not valid:
+                    broken.add(group[0].domain)
+                return
+        middle = len(group) // 2
+        check(group[:middle])
+        check(group[middle:])
+
+    if suspects:
+        # With nothing ruled out yet, the whole file already failed
+        check(suspects, failed=len(suspects) == len(sites) > 1)
+        _store_site_verdicts()
+    return [site.domain for site in sites if site.domain in broken]
+
+def validateCaddyfile(text: str, directory: str = '~', caddy: Optional[CaddyFile] = None,
+                      dependencies: Iterable[str] = ()) -> Optional[ValidationResult]:
+    """
+    Adapt and validate `text` with the caddy binary.
+
+    Verdicts and adapted JSON are cached in memory by a hash of the text,
+    and on disk when the config passed, so an unchanged config never runs
+    the subprocess twice. When it fails and the tree is given, the failing
+    site blocks are pinpointed by bisection; the blocks known to be good are
+    remembered across runs, so only changed blocks get re-checked.
+    Returns None when caddy is not installed.
+    """
+    dependencies = list(dependencies)
+    result       = cachedResult(text, dependencies)
+    if result is not None:
+        _remember(text, result)
+        return result
+
+    if shutil.which('caddy') is None:
+        return None
+
+    directory = os.path.expanduser(directory)
+    result    = _run_adapt(text, directory)
+
+    if caddy is not None:
+        _load_site_verdicts()
+        header_hash = _key(caddy.render_header(), dependencies)
+        if result.valid:
+            with _lock:
+                for site in dict.values(caddy.sites):
+                    _site_verdicts[(header_hash, site.digest())] = True
+            _store_site_verdicts()
+        else:
+            result.sites = _blame_sites(caddy, directory, header_hash)
+
+    key = _key(text, dependencies)
+    with _lock:
+        _results[key] = result
+    _store(key, result)
+    _remember(text, result)
+    return result
+
+def requireValid(text: str, directory: str = '~', caddy: Optional[CaddyFile] = None,
+                 dependencies: Iterable[str] = ()) -> Optional[ValidationResult]:
+    result = validateCaddyfile(text, directory, caddy, dependencies)
+    if result is not None and not result.valid:
+        raise CaddyValidationError(result)
+    return result
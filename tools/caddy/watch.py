@@ -0,0 +1,223 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set
+
+from .admin import ApplyResult
+from .management import CADDYFILE_PATH, applyCaddyFile, configDigest, importedFiles, invalidateCaddyFileCache, loadCaddyFile
+from .validate import validateCaddyfile
+
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM  = 0x040
+IN_MOVED_TO    = 0x080
+IN_CREATE      = 0x100
+IN_DELETE      = 0x200
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+
+# Atomic saves (ours, and most editors') replace the file by rename, which a
+# watch on the file itself would miss, so the parent directories are watched
+WATCH_MASK   = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE
+_EVENT       = struct.Struct('iIII')
+
+class Inotify:
+    """Minimal inotify(7) binding over libc; raises OSError where unsupported."""
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available on this system")
+
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm  = libc.inotify_rm_watch
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = self._add(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.watches[wd] = path
+        return wd
+
+    def remove_watch(self, wd: int):
+        self._rm(self.fd, wd)
+        self.watches.pop(wd, None)
+
+    def read(self, timeout: Optional[float]) -> List[str]:
+        """Full paths touched since the last read, waiting up to `timeout`."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths, offset = [], 0
+        while offset < len(data):
+            wd, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name    = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += length
+            if wd in self.watches:
+                paths.append(os.path.join(self.watches[wd], name))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+@dataclass
+class ReloadReport:
+    events: int                      # filesystem events folded into this reload
+    files: List[str]
+    result: Optional[ApplyResult] = None
+    error: Optional[str] = None
+    skipped: bool = False            # content identical to the last reload
+
+    @property
+    def coalesced(self) -> int:
+        return max(self.events - 1, 0)
+
+    @property
+    def applied(self) -> bool:
+        """Whether the running Caddy took the new config."""
+        return self.result is not None and self.result.method != 'error'
+
+class CaddyfileWatcher:
+    """
+    Watch the Caddyfile and every file it imports. Each event drops the
+    cached parse; once writes have been quiet for `debounce` seconds, the
+    whole burst becomes a single validate-and-reload. Without inotify, the
+    files' stat signatures are polled instead.
+    """
+    def __init__(self, path=CADDYFILE_PATH, debounce: float = 0.5,
+                 on_reload: Optional[Callable[[ReloadReport], None]] = None):
+        self.path      = os.path.abspath(os.path.expanduser(path))
+        self.directory = os.path.dirname(self.path)
+        self.debounce  = debounce
+        self.on_reload = on_reload
+
+        self.files: Set[str] = {self.path}
+        self.reloads     = 0
+        self.coalesced   = 0
+        self.last_digest = None
+
+        try:
+            self.inotify = Inotify()
+        except OSError:
+            self.inotify = None
+        self._rewatch()
+
+    def _rewatch(self):
+        try:
+            self.files = {self.path} | set(importedFiles(self.path))
+        except (OSError, ValueError):
+            self.files = self.files or {self.path}
+
+        if self.inotify is None:
+            self._stats = {path: self._stat(path) for path in self.files}
+            return
+
+        directories = {os.path.dirname(path) for path in self.files}
+        for wd, directory in list(self.inotify.watches.items()):
+            if directory not in directories:
+                self.inotify.remove_watch(wd)
+        for directory in directories - set(self.inotify.watches.values()):
+            try:
+                self.inotify.add_watch(directory)
+            except OSError:
+                continue
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            st = os.stat(path)
+            return (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    def _changed(self, timeout: float) -> List[str]:
+        if self.inotify is not None:
+            return [path for path in self.inotify.read(timeout) if path in self.files]
+
+        time.sleep(timeout)
+        changed = []
+        for path in self.files:
+            signature = self._stat(path)
+            if signature != self._stats.get(path):
+                self._stats[path] = signature
+                changed.append(path)
+        return changed
+
+    def reload(self, events: int, files: List[str]) -> ReloadReport:
+        report = ReloadReport(events, sorted(set(files)))
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                text = file.read()
+            caddy = loadCaddyFile(self.path)
+        except (OSError, ValueError) as e:
+            report.error = str(e)
+            return report
+
+        digest = configDigest(text, self.files - {self.path})
+        if digest == self.last_digest:
+            report.skipped = True
+            return report
+
+        validation = validateCaddyfile(text, self.directory, caddy, sorted(self.files - {self.path}))
+        if validation is not None and not validation.valid:
+            report.error = validation.output.strip() or "Caddy rejected the Caddyfile."
+            return report
+
+        report.result = applyCaddyFile(caddy, text)
+        if report.result is not None and report.result.method == 'error':
+            # Left unrecorded, so the next write retries it
+            report.error = f"Caddy did not take it: {report.result.error}"
+            return report
+
+        self.last_digest = digest
+        if report.applied:
+            self.reloads += 1
+        return report
+
+    def run(self, stop: Optional[Callable[[], bool]] = None, poll: float = 1.0):
+        """Watch until `stop()` returns true (or forever); Ctrl+C ends it too."""
+        pending: List[str] = []
+        deadline = None
+
+        try:
+            while not (stop and stop()):
+                timeout = poll if deadline is None else max(deadline - time.monotonic(), 0)
+                changed = self._changed(timeout)
+
+                if changed:
+                    for path in set(changed):
+                        invalidateCaddyFileCache(path)
+                    pending.extend(changed)
+                    deadline = time.monotonic() + self.debounce
+                    continue
+
+                if deadline is not None and time.monotonic() >= deadline:
+                    report = self.reload(len(pending), pending)
+                    # Only a burst that ended in a reload saved any reloads
+                    if report.applied:
+                        self.coalesced += report.coalesced
+                    pending, deadline = [], None
+                    self._rewatch()
+                    if self.on_reload:
+                        self.on_reload(report)
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from utils import atomic_write, username
+from .management import _user_prefix_pattern, list_user_databases
+from .pool import connection
+
+BACKUP_DIR = '~/.local/share/nest-cli/backups'
+# Tried in order; older or minimal pg_dump builds lack zstd (and lz4), and
+# before 16 pg_dump takes no method at all. None leaves --compress out,
+# which for the directory format means gzip.
+COMPRESSIONS = ('zstd', 'lz4', 'gzip', None)
+
+FINGERPRINT_QUERY = """
+SELECT d.datname,
+       s.tup_inserted, s.tup_updated, s.tup_deleted,
+       s.stats_reset,
+       d.datfrozenxid::text
+FROM pg_database d
+LEFT JOIN pg_stat_database s ON s.datid = d.oid
+WHERE NOT d.datistemplate AND d.datname LIKE %s;
+"""
+
+@dataclass
+class BackupResult:
+    database: str
+    status: str                         # 'ok', 'skipped' or 'failed'
+    manifest: Optional[str] = None      # path of the snapshot manifest
+    size: int = 0                       # bytes of the dump
+    stored: int = 0                     # of those, bytes not already in the store
+    duration: float = 0.0
+    error: Optional[str] = None
+
+def backup_root(root: Optional[str] = None) -> str:
+    return os.path.expanduser(root or BACKUP_DIR)
+
+def fingerprints() -> Dict[str, str]:
+    """
+    A fingerprint per user database that changes whenever its contents can
+    have: row change counters (catalog rows included, so DDL and TRUNCATE
+    count) and the stats reset time, all read in one query. The size is
+    left out on purpose, merely reading a database can grow it. Counters
+    reach the statistics within seconds of a commit, not instantly.
+    """
+    with connection(username) as conn:
+        with conn.cursor() as cur:
+            cur.execute(FINGERPRINT_QUERY, (_user_prefix_pattern(),))
+            rows = cur.fetchall()
+    return {
+        row[0]: hashlib.blake2b(repr(row[1:]).encode('utf-8'), digest_size=16).hexdigest()
+        for row in rows
+    }
+
+def _snapshot_dir(root: str, database: str) -> str:
+    return os.path.join(root, 'snapshots', database)
+
+def _object_path(root: str, digest: str) -> str:
+    return os.path.join(root, 'objects', digest[:2], digest)
+
+def list_backups(database: str, root: Optional[str] = None) -> List[str]:
+    """Manifest paths of `database`'s snapshots, oldest first."""
+    directory = _snapshot_dir(backup_root(root), database)
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    except OSError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+def load_manifest(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def newest_backup(database: str, root: Optional[str] = None) -> Optional[dict]:
+    for path in reversed(list_backups(database, root)):
+        try:
+            manifest = load_manifest(path)
+        except (OSError, ValueError):
+            continue
+        manifest['path'] = path
+        return manifest
+    return None
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _store(root: str, staging: str) -> Dict[str, dict]:
+    """
+    Move every file pg_dump wrote into the object store under its content
+    hash. A file already stored (an unchanged table from an earlier
+    snapshot) is dropped instead, so snapshots share their common data.
+    """
+    files = {}
+    for directory, _, names in os.walk(staging):
+        for name in names:
+            path     = os.path.join(directory, name)
+            relative = os.path.relpath(path, staging)
+            digest   = _hash_file(path)
+            size     = os.path.getsize(path)
+            target   = _object_path(root, digest)
+            stored   = not os.path.exists(target)
+            if stored:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+                os.chmod(target, 0o400)
+            files[relative] = {'hash': digest, 'size': size, 'new': stored}
+    return files
+
+class _Compression:
+    """The best compression this pg_dump supports, found on first use."""
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.choices = list(COMPRESSIONS)
+
+    def current(self) -> Optional[str]:
+        with self.lock:
+            return self.choices[0]
+
+    def unsupported(self, method: Optional[str]) -> bool:
+        with self.lock:
+            if method not in self.choices:
+                # Another dump already found out
+                return True
+            if len(self.choices) > 1:
+                self.choices.remove(method)
+                return True
+            return False
+
+def _dump(database: str, staging: str, jobs: int, compression: _Compression) -> str:
+    while True:
+        method  = compression.current()
+        options = [f'--compress={method}'] if method else []
+        process = subprocess.run(
+            ['pg_dump', '--format=directory', f'--jobs={jobs}', *options, f'--file={staging}', '--dbname', database],
+            capture_output=True,
+            text=True
+        )
+        if process.returncode == 0:
+            return method or 'gzip'
+        shutil.rmtree(staging, ignore_errors=True)
+        # 16+ says "invalid compression specification", older ones reject the value of -Z/--compress
+        if 'compress' in process.stderr and compression.unsupported(method):
+            continue
+        raise RuntimeError(process.stderr.strip() or f"pg_dump exited with {process.returncode}")
+
+def backup_database(database: str, fingerprint: Optional[str], root: Optional[str] = None, jobs: int = 2,
+                   force: bool = False, compression: Optional[_Compression] = None) -> BackupResult:
+    root    = backup_root(root)
+    started = time.perf_counter()
+    if not force and fingerprint is not None:
+        newest = newest_backup(database, root)
+        if newest is not None and newest.get('fingerprint') == fingerprint:
+            return BackupResult(database, 'skipped', newest['path'], newest.get('size', 0))
+
+    created = datetime.now(timezone.utc)
+    staging = os.path.join(root, 'staging', f"{database}-{os.getpid()}-{threading.get_ident()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(os.path.dirname(staging), exist_ok=True)
+    try:
+        method = _dump(database, staging, jobs, compression or _Compression())
+        files  = _store(root, staging)
+    except (OSError, RuntimeError) as e:
+        return BackupResult(database, 'failed', duration=time.perf_counter() - started, error=str(e))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    duration = time.perf_counter() - started
+    manifest = {
+        'database': database,
+        'created': created.isoformat(),
+        'fingerprint': fingerprint,
+        'format': 'directory',
+        'compression': method,
+        'size': sum(entry['size'] for entry in files.values()),
+        'duration': round(duration, 3),
+        'files': {name: {'hash': entry['hash'], 'size': entry['size']} for name, entry in files.items()},
+    }
+    directory = _snapshot_dir(root, database)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, created.strftime('%Y%m%dT%H%M%S%fZ') + '.json')
+    atomic_write(path, json.dumps(manifest, indent=2))
+
+    stored = sum(entry['size'] for entry in files.values() if entry['new'])
+    return BackupResult(database, 'ok', path, manifest['size'], stored, duration)
+
+def backup_databases(databases: Optional[Iterable[str]] = None, root: Optional[str] = None, workers: int = 4,
+                    jobs: int = 2, force: bool = False) -> List[BackupResult]:
+    """
+    Back up many databases at once, `workers` pg_dump processes at a time,
+    each dumping `jobs` tables in parallel in directory format, compressed
+    by pg_dump itself. Databases whose fingerprint matches their newest
+    snapshot are skipped unless `force` is set.
+    """
+    databases   = list(databases) if databases is not None else list_user_databases()
+    prints      = fingerprints()
+    compression = _Compression()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(
+            lambda database: backup_database(database, prints.get(database), root, jobs, force, compression),
+            databases
+        ))
+
+def materialize(manifest: dict, target: str, root: Optional[str] = None) -> str:
+    """
+    Recreate a snapshot's pg_dump directory at `target` by hard-linking the
+    stored objects (copying only across filesystems), ready for pg_restore.
+    """
+    root = backup_root(root)
+    for name, entry in manifest['files'].items():
+        path = os.path.join(target, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        source = _object_path(root, entry['hash'])
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+    return target
@@ -0,0 +1,46 @@
+import sys
+import time
+
+import psycopg2
+
+from utils import username
+from .management import USER_DATABASES_QUERY, _user_prefix_pattern, list_user_databases
+from .pool import closePools
+
+def listUnpooled():
+    # The same query as list_user_databases on a fresh connection per call,
+    # so the comparison measures the pool and nothing else
+    conn = psycopg2.connect(dbname=username)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(USER_DATABASES_QUERY, (_user_prefix_pattern(),))
+    dbs = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return dbs
+
+def timeCalls(func, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return time.perf_counter() - started
+
+def benchList(calls: int = 1000):
+    """
+    `calls` back-to-back list_user_databases calls, with and without the
+    pool. Point it at a throwaway server with the usual libpq variables,
+    e.g. PGHOST=/tmp/pg python -m tools.databases.benchmark
+    """
+    closePools()
+    list_user_databases()           # warm up, and fail early without a server
+
+    unpooled = timeCalls(listUnpooled, calls)
+    pooled   = timeCalls(list_user_databases, calls)
+
+    print(f"unpooled: {calls} calls in {unpooled:.2f}s ({unpooled / calls * 1000:.2f} ms/call)")
+    print(f"pooled:   {calls} calls in {pooled:.2f}s ({pooled / calls * 1000:.2f} ms/call), "
+          f"{unpooled / pooled:.1f}x faster")
+
+if __name__ == "__main__":
+    # python -m tools.databases.benchmark [calls]
+    benchList(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
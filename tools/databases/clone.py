@@ -0,0 +1,170 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import psycopg2
+from psycopg2 import errors, sql
+
+from .backup import backup_database, backup_root, fingerprints, materialize, newest_backup
+from .management import create_db, invalidate_inventory
+from .pool import closePool, connection
+
+STATE_QUERY = """
+SELECT pid, state FROM pg_stat_activity
+WHERE datname = %s AND pid <> pg_backend_pid() AND backend_type = 'client backend';
+"""
+
+@dataclass
+class CloneResult:
+    source: str
+    target: str
+    strategy: Optional[str] = None                  # 'template' or 'restore'
+    timings: Dict[str, float] = field(default_factory=dict)
+    notes: List[str] = field(default_factory=list)  # why a faster strategy was not used
+    error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+    @property
+    def duration(self) -> float:
+        return sum(self.timings.values())
+
+class _Timer:
+    def __init__(self, result: CloneResult, step: str):
+        self.result = result
+        self.step   = step
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.result.timings[self.step] = self.result.timings.get(self.step, 0.0) + time.perf_counter() - self.started
+
+def _busy_sessions(cur, database: str) -> List[str]:
+    cur.execute(STATE_QUERY, (database,))
+    return [f"{pid} ({state})" for pid, state in cur.fetchall() if state != 'idle']
+
+def _clone_from_template(source: str, target: str, result: CloneResult, attempts: int = 3) -> bool:
+    # Our own idle pooled connections would count as users of the template
+    closePool(source)
+    with connection('postgres') as conn:
+        with conn.cursor() as cur:
+            with _Timer(result, 'check'):
+                busy = _busy_sessions(cur, source)
+            if busy:
+                result.notes.append(f"{source} is in use by {', '.join(busy)}")
+                return False
+
+            # FILE_COPY copies the data files instead of writing them all to WAL
+            strategy = sql.SQL(" STRATEGY FILE_COPY") if conn.server_version >= 150000 else sql.SQL("")
+            query    = sql.SQL("CREATE DATABASE {} TEMPLATE {}{};").format(sql.Identifier(target), sql.Identifier(source), strategy)
+            for _ in range(attempts):
+                # Only sessions sitting idle are ended, never one doing work
+                with _Timer(result, 'terminate'):
+                    cur.execute(
+                        "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                        "WHERE datname = %s AND pid <> pg_backend_pid() AND state = 'idle';",
+                        (source,)
+                    )
+                try:
+                    with _Timer(result, 'copy'):
+                        cur.execute(query)
+                    return True
+                except errors.ObjectInUse:
+                    # Someone connected between terminating and copying
+                    with _Timer(result, 'check'):
+                        busy = _busy_sessions(cur, source)
+                    if busy:
+                        result.notes.append(f"{source} became busy: {', '.join(busy)}")
+                        return False
+                except psycopg2.Error as e:
+                    result.notes.append(f"CREATE DATABASE ... TEMPLATE failed: {e.pgerror or e}".strip())
+                    return False
+    result.notes.append(f"{source} kept getting new connections")
+    return False
+
+def _create_empty(target: str, result: CloneResult):
+    with _Timer(result, 'create'):
+        try:
+            with connection('postgres') as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("CREATE DATABASE {};").format(sql.Identifier(target)))
+        except errors.InsufficientPrivilege:
+            # Nest users create databases through the nest CLI
+            if not create_db(target):
+                raise RuntimeError(f"Creating database {target} with `nest db create` failed")
+
+def _drop(target: str, result: CloneResult):
+    closePool(target)
+    try:
+        with connection('postgres') as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("DROP DATABASE IF EXISTS {};").format(sql.Identifier(target)))
+        result.notes.append(f"Dropped the partially restored {target}")
+    except psycopg2.Error as e:
+        result.notes.append(f"Could not drop the partially restored {target}: {str(e).strip()}")
+
+def _clone_from_backup(source: str, target: str, result: CloneResult, jobs: int, root: Optional[str]):
+    with _Timer(result, 'backup'):
+        manifest = newest_backup(source, root)
+        current  = fingerprints().get(source)
+        if manifest is None or manifest.get('fingerprint') != current:
+            backup = backup_database(source, current, root)
+            if backup.status == 'failed':
+                raise RuntimeError(f"Backing up {source} failed: {backup.error}")
+            manifest = newest_backup(source, root)
+        else:
+            result.notes.append(f"Restored from the up-to-date snapshot of {manifest['created']}")
+
+    _create_empty(target, result)
+
+    staging = None
+    try:
+        os.makedirs(backup_root(root), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f'restore-{target}-', dir=backup_root(root))
+        with _Timer(result, 'materialize'):
+            materialize(manifest, staging, root)
+        with _Timer(result, 'restore'):
+            process = subprocess.run(
+                ['pg_restore', f'--jobs={jobs}', '--no-owner', '--no-acl', '--exit-on-error', '--dbname', target, staging],
+                capture_output=True,
+                text=True
+            )
+        if process.returncode != 0:
+            raise RuntimeError(process.stderr.strip() or f"pg_restore exited with {process.returncode}")
+    except BaseException:
+        # A half-restored copy is worse than none
+        _drop(target, result)
+        raise
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+
+def clone_database(source: str, target: str, jobs: int = 4, root: Optional[str] = None) -> CloneResult:
+    """
+    Copy `source` into a new database `target`.
+
+    When nothing is running in the source, its stray idle connections are
+    terminated and the copy is a server-side CREATE DATABASE ... TEMPLATE,
+    which copies files instead of rows. Otherwise (or without the privilege
+    to do so) the newest backup of the source, refreshed first if the source
+    changed since, is restored with a parallel pg_restore. Every step is
+    timed in the result.
+    """
+    result = CloneResult(source, target)
+    try:
+        if _clone_from_template(source, target, result):
+            result.strategy = 'template'
+        else:
+            result.strategy = 'restore'
+            _clone_from_backup(source, target, result, jobs, root)
+    except (psycopg2.Error, OSError, RuntimeError) as e:
+        result.error = str(e).strip()
+    invalidate_inventory()
+    return result
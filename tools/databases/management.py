@@ -1,35 +1,126 @@
 import psycopg2
+from psycopg2 import sql
 from utils import username
 import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .models import DatabaseStats
+from .pool import closePool, connection
+
+INVENTORY_TTL = 5.0
+
+USER_DATABASES_QUERY = "SELECT datname FROM pg_database WHERE NOT datistemplate AND datname LIKE %s ORDER BY datname;"
+
+INVENTORY_QUERY = """
+SELECT d.datname,
+       CASE WHEN has_database_privilege(d.oid, 'CONNECT') THEN pg_database_size(d.oid) END,
+       coalesce(s.numbackends, 0),
+       (SELECT count(*) FROM pg_stat_activity a WHERE a.datid = d.oid AND a.state = 'active'),
+       coalesce(s.xact_commit, 0),
+       coalesce(s.xact_rollback, 0),
+       age(d.datfrozenxid),
+       s.stats_reset
+FROM pg_database d
+LEFT JOIN pg_stat_database s ON s.datid = d.oid
+WHERE NOT d.datistemplate AND d.datname LIKE %s
+ORDER BY d.datname;
+"""
+
+_inventory: Optional[tuple] = None             # (read at, stats)
+_inventory_lock = threading.Lock()
+# name -> previous sample, to turn transaction counters into rates
+_samples: Dict[str, DatabaseStats] = {}
+
+def _user_prefix_pattern():
+    # The prefix ends in "_", a LIKE wildcard, so it is matched literally
+    prefix = username + "_"
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
 
 def create_db(db_name):
-    os.system(f'nest db create {db_name}')
+    status = os.system(f'nest db create {db_name}')
+    invalidate_inventory()
+    return status == 0
 
 def list_user_databases():
-    conn = psycopg2.connect(
-        dbname=username,
-    )
-    conn.autocommit = True
-    cur = conn.cursor()
-    cur.execute("SELECT datname FROM pg_database WHERE datistemplate = false;")
-    dbs = [row[0] for row in cur.fetchall() if row[0].startswith(username + "_")]
-    cur.close()
-    conn.close()
+    with connection(username) as conn:
+        with conn.cursor() as cur:
+            cur.execute(USER_DATABASES_QUERY, (_user_prefix_pattern(),))
+            dbs = [row[0] for row in cur.fetchall()]
     return dbs
 
+def database_inventory(max_age: float = INVENTORY_TTL) -> List[DatabaseStats]:
+    """
+    Size, connections and activity of every database of the user, filtered
+    by name on the server and read in one query. Results are reused for
+    `max_age` seconds. Transaction rates come from the difference to the
+    previous sample, or are averaged since the stats reset on the first call.
+    """
+    global _inventory
+    with _inventory_lock:
+        if _inventory is not None and time.monotonic() - _inventory[0] < max_age:
+            return _inventory[1]
+
+        with connection(username) as conn:
+            with conn.cursor() as cur:
+                cur.execute(INVENTORY_QUERY, (_user_prefix_pattern(),))
+                rows = cur.fetchall()
+
+        now       = time.monotonic()
+        wallclock = datetime.now(timezone.utc)
+        inventory = []
+        for name, size, connections, active, commits, rollbacks, xid_age, stats_reset in rows:
+            stats    = DatabaseStats(name, size, connections, active, commits, rollbacks, xid_age, stats_reset, now)
+            previous = _samples.get(name)
+            if previous is not None and now > previous.sampled and stats.transactions >= previous.transactions:
+                stats.tps = (stats.transactions - previous.transactions) / (now - previous.sampled)
+            elif stats_reset is not None and wallclock > stats_reset:
+                stats.tps = stats.transactions / (wallclock - stats_reset).total_seconds()
+            _samples[name] = stats
+            inventory.append(stats)
+
+        _inventory = (now, inventory)
+        return inventory
+
+def invalidate_inventory():
+    global _inventory
+    with _inventory_lock:
+        _inventory = None
+
+def _size(size: Optional[int]) -> str:
+    if size is None:
+        return "-"
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if size < 1024 or unit == 'TiB':
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+
+def format_inventory_table(inventory: List[DatabaseStats]) -> List[str]:
+    rows = [("Database", "Size", "Conns", "Active", "TPS", "Commits", "Rollbacks", "XID age")]
+    for stats in inventory:
+        rows.append((stats.name, _size(stats.size), str(stats.connections), str(stats.active),
+                     f"{stats.tps:.2f}" if stats.tps is not None else "-",
+                     str(stats.commits), str(stats.rollbacks), str(stats.xid_age)))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return ["  ".join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i]) for i, cell in enumerate(row)) for row in rows]
+
 def remove_database(db_name):
-    conn = psycopg2.connect(
-        dbname='postgres',
-    )
-    conn.autocommit = True
-    cur = conn.cursor()
+    # Only the user's own databases, never one of another account
+    if not db_name.startswith(username + "_"):
+        return False, f"Database {db_name} does not belong to {username}; only {username}_* databases can be removed."
+    # Our own idle connections to it would make the DROP fail
+    closePool(db_name)
     try:
-        cur.execute(f"DROP DATABASE {db_name};")
+        with connection('postgres') as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("DROP DATABASE {};").format(sql.Identifier(db_name)))
         success = True
         message = f"Database {db_name} removed successfully."
+        invalidate_inventory()
     except Exception as e:
         success = False
         message = str(e)
-    cur.close()
-    conn.close()
     return success, message
\ No newline at end of file
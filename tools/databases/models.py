@@ -0,0 +1,20 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+@dataclass
+class DatabaseStats:
+    name: str
+    size: Optional[int]               # bytes, None without CONNECT privilege
+    connections: int                  # backends connected to it
+    active: int                       # of those, running a statement right now
+    commits: int
+    rollbacks: int
+    xid_age: int                      # transactions since its oldest unfrozen xid, i.e. since the last freezing vacuum
+    stats_reset: Optional[datetime]
+    sampled: float                    # time.monotonic() when read
+    tps: Optional[float] = None       # transactions per second
+
+    @property
+    def transactions(self) -> int:
+        return self.commits + self.rollbacks
@@ -0,0 +1,163 @@
+import atexit
+import select
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+import psycopg2
+import psycopg2.extensions
+
+class PoolError(psycopg2.Error):
+    pass
+
+class ConnectionPool:
+    """
+    A small thread-safe pool of autocommit connections to one database.
+
+    Connections are opened lazily, up to `maxconn` at a time; callers beyond
+    that wait up to `timeout` seconds for one to be returned. Connections
+    idle longer than `idle_timeout` are closed instead of reused, and one
+    that sat idle longer than `check_after`, or whose socket turned readable
+    while idle, is pinged before it is handed out, so a restarted server or
+    a terminated backend costs a reconnect rather than an error.
+    """
+    def __init__(self, dbname: str, maxconn: int = 8, idle_timeout: float = 300.0,
+                 check_after: float = 30.0, timeout: float = 30.0, **connect_kwargs):
+        self.dbname         = dbname
+        self.maxconn        = maxconn
+        self.idle_timeout   = idle_timeout
+        self.check_after    = check_after
+        self.timeout        = timeout
+        self.connect_kwargs = connect_kwargs
+        self.condition      = threading.Condition()
+        self.idle           = deque()           # (connection, returned at), most recent last
+        self.in_use         = 0
+        self.closed         = False
+
+    def _connect(self):
+        conn = psycopg2.connect(dbname=self.dbname, **self.connect_kwargs)
+        conn.autocommit = True
+        return conn
+
+    def _healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        # An idle connection has nothing to read unless the server hung up
+        # on it (or sent a notice), so a readable socket is worth a ping too
+        if idle_for < self.check_after and not select.select([conn], [], [], 0)[0]:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _evict(self, now: float):
+        # Oldest connections sit at the left end
+        while self.idle and now - self.idle[0][1] > self.idle_timeout:
+            self.idle.popleft()[0].close()
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise PoolError(f"Connection pool for {self.dbname} is closed")
+                self._evict(time.monotonic())
+                if self.idle or self.in_use < self.maxconn:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.condition.wait(remaining):
+                    raise PoolError(f"No connection to {self.dbname} became free within {self.timeout:g}s")
+            self.in_use += 1
+            candidate = self.idle.pop() if self.idle else None
+
+        try:
+            while candidate is not None:
+                conn, returned = candidate
+                if self._healthy(conn, time.monotonic() - returned):
+                    return conn
+                conn.close()
+                with self.condition:
+                    candidate = self.idle.pop() if self.idle else None
+            return self._connect()
+        except BaseException:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+    def putconn(self, conn, discard: bool = False):
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                    conn.autocommit = True
+                except psycopg2.Error:
+                    discard = True
+
+        with self.condition:
+            self.in_use -= 1
+            if discard or conn.closed or self.closed:
+                conn.close()
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                self.idle.pop()[0].close()
+            self.condition.notify_all()
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def getPool(dbname: str) -> ConnectionPool:
+    """The process-wide pool for `dbname`, created on first use."""
+    with _pools_lock:
+        pool = _pools.get(dbname)
+        if pool is None or pool.closed:
+            pool = _pools[dbname] = ConnectionPool(dbname)
+        return pool
+
+def connection(dbname: str):
+    """`with connection(name) as conn:` borrows a pooled autocommit connection."""
+    return getPool(dbname).connection()
+
+def closePool(dbname: str):
+    """Close the idle connections to `dbname`, e.g. before dropping it."""
+    with _pools_lock:
+        pool = _pools.pop(dbname, None)
+    if pool is not None:
+        pool.close()
+
+def closePools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+atexit.register(closePools)
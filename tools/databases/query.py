@@ -0,0 +1,184 @@
+import itertools
+import os
+import re
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+
+import psycopg2
+from psycopg2 import sql
+
+from .pool import connection
+
+BATCH_SIZE = 2000
+# Statements that can back a cursor (DECLARE ... CURSOR FOR) and return rows
+_ROW_QUERY = re.compile(r'^\s*(?:select|with|values|table)\b', re.IGNORECASE)
+# DECLARE refuses data-modifying CTEs, those run on a plain cursor
+_MODIFIES  = re.compile(r'\b(?:insert|update|delete|merge)\b', re.IGNORECASE)
+_TABLE     = re.compile(r'^[A-Za-z_][\w$]*(?:\.[A-Za-z_][\w$]*)?$')
+
+_cursor_ids = itertools.count(1)
+
+class QueryResult:
+    """
+    Rows of a statement, read lazily in batches. For row-returning queries
+    this is a named (server-side) cursor, so only one batch at a time is in
+    memory however large the result is; other statements just report
+    their row count.
+    """
+    def __init__(self, columns: List[str], batches: Iterator[List[tuple]], rowcount: int = -1):
+        self.columns  = columns
+        self.batches  = batches
+        self.rowcount = rowcount
+
+    def __iter__(self):
+        for batch in self.batches:
+            yield from batch
+
+def _statement(query: str) -> str:
+    return query.strip().rstrip(';').strip()
+
+@contextmanager
+def run_query(database: str, query: str, params=None, batch_size: int = BATCH_SIZE) -> Iterator[QueryResult]:
+    """
+    `with run_query(db, "SELECT ...") as result:` holds a pooled connection
+    and the cursor for as long as the block reads from `result`.
+    """
+    query = _statement(query)
+    with connection(database) as conn:
+        if not _ROW_QUERY.match(query) or (query[:4].lower() == 'with' and _MODIFIES.search(query)):
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                columns = [column.name for column in cur.description] if cur.description else []
+                yield QueryResult(columns, iter([cur.fetchall()] if columns else []), cur.rowcount)
+            return
+
+        # Named cursors live inside a transaction. It is committed once the
+        # block is done reading, so side effects of the query (nextval(),
+        # functions that write) are kept like they would be in psql
+        conn.autocommit = False
+        try:
+            cur = conn.cursor(name=f"nest_cli_{os.getpid()}_{next(_cursor_ids)}")
+            cur.itersize = batch_size
+            try:
+                cur.execute(query, params)
+                # The first fetch is what runs the query and fills in the description
+                first   = cur.fetchmany(batch_size)
+                columns = [column.name for column in cur.description] if cur.description else []
+
+                def batches():
+                    batch = first
+                    while batch:
+                        yield batch
+                        batch = cur.fetchmany(batch_size)
+
+                yield QueryResult(columns, batches())
+            finally:
+                cur.close()
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if not conn.closed:
+                conn.autocommit = True
+
+def format_rows(columns: List[str], rows: List[tuple], width: int = 40) -> List[str]:
+    def cell(value) -> str:
+        text = 'NULL' if value is None else str(value).replace('\n', '\\n')
+        return text if len(text) <= width else text[:width - 1] + '…'
+
+    table  = [tuple(columns)] + [tuple(cell(value) for value in row) for row in rows]
+    widths = [max(len(row[i]) for row in table) for i in range(len(columns))]
+    lines  = [" | ".join(value.ljust(widths[i]) for i, value in enumerate(row)) for row in table]
+    lines.insert(1, "-+-".join("-" * w for w in widths))
+    return lines
+
+@dataclass
+class ExportResult:
+    path: str
+    rows: int
+    bytes: int
+    duration: float
+
+    @property
+    def rate(self) -> float:
+        return self.rows / self.duration if self.duration > 0 else 0.0
+
+class _ProgressWriter:
+    """File wrapper COPY writes into; counts rows and reports progress now and then."""
+    def __init__(self, file, progress: Optional[Callable[[int, int, float], None]], interval: float = 0.5):
+        self.file     = file
+        self.progress = progress
+        self.interval = interval
+        self.rows     = 0
+        self.bytes    = 0
+        self.started  = time.perf_counter()
+        self.reported = self.started
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.file.write(data)
+        self.bytes += len(data)
+        # One line per row, except for CSV values holding newlines; the final count comes from COPY
+        self.rows  += data.count(b'\n')
+        if self.progress is not None:
+            now = time.perf_counter()
+            if now - self.reported >= self.interval:
+                self.reported = now
+                self.progress(self.rows, self.bytes, now - self.started)
+        return len(data)
+
+def _source_query(source: str) -> sql.Composable:
+    source = _statement(source)
+    if _TABLE.match(source):
+        return sql.SQL("SELECT * FROM {}").format(sql.Identifier(*source.split('.')))
+    if not _ROW_QUERY.match(source):
+        raise ValueError("Only a table name or a SELECT/WITH/VALUES/TABLE query can be exported")
+    return sql.SQL(source)
+
+def _copy_statement(source: str, fmt: str) -> sql.Composable:
+    query = _source_query(source)
+    if fmt == 'csv':
+        return sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)").format(query)
+    if fmt == 'ndjson':
+        # CSV with quote and delimiter bytes JSON never contains unescaped
+        # leaves every row_to_json document on its own line, untouched
+        return sql.SQL("COPY (SELECT row_to_json(r) FROM ({}) r) TO STDOUT "
+                       "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')").format(query)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+def export_query(database: str, source: str, path: str, fmt: str = 'csv',
+                 progress: Optional[Callable[[int, int, float], None]] = None) -> ExportResult:
+    """
+    Export a table or query to CSV or NDJSON with COPY ... TO STDOUT. Rows
+    are streamed from the server straight into the file, so memory use
+    stays flat whatever the size; the file appears under `path` only once
+    it is complete. `progress(rows, bytes, seconds)` is called every half
+    second or so.
+    """
+    path = os.path.expanduser(path)
+    tmp  = f"{path}.part"
+    with connection(database) as conn:
+        statement = _copy_statement(source, fmt).as_string(conn)
+        with conn.cursor() as cur:
+            try:
+                with open(tmp, 'wb', buffering=1 << 20) as file:
+                    writer = _ProgressWriter(file, progress)
+                    cur.copy_expert(statement, writer)
+                os.replace(tmp, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                raise
+            rows = cur.rowcount if cur.rowcount >= 0 else max(writer.rows - (fmt == 'csv'), 0)
+
+    duration = time.perf_counter() - writer.started
+    if progress is not None:
+        progress(rows, writer.bytes, duration)
+    return ExportResult(path, rows, writer.bytes, duration)
@@ -1,15 +1,69 @@
 import os
 import sys
+import time
 from colorama import Fore
-from .management import list_user_databases, remove_database, create_db
+from .backup import backup_databases
+from .clone import clone_database
+from .query import export_query, format_rows, run_query
+from .management import list_user_databases, remove_database, create_db, database_inventory, format_inventory_table
 
 
+PAGE_SIZE = 50
+
+def choose_database():
+    print(Fore.YELLOW + "\nListing Databases...\n" + Fore.RESET)
+    db_list = list_user_databases()
+    for i, db in enumerate(db_list):
+        print(f"   {i + 1}. {db}")
+    choice = input("\nChoose a database (number or name): ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(db_list):
+        return db_list[int(choice) - 1]
+    return choice
+
+def query_console(db_name):
+    print(Fore.CYAN + f"\nConnected to {db_name}. End a statement with Enter, \\q to quit." + Fore.RESET)
+    while True:
+        query = input(f"{db_name}> ").strip()
+        if query in ('\\q', 'quit', 'exit'):
+            break
+        if not query:
+            continue
+        started = time.perf_counter()
+        try:
+            with run_query(db_name, query) as result:
+                if not result.columns:
+                    print(Fore.GREEN + f"OK, {result.rowcount} rows affected ({time.perf_counter() - started:.2f}s)" + Fore.RESET)
+                    continue
+                shown = 0
+                page  = []
+                for row in result:
+                    page.append(row)
+                    if len(page) == PAGE_SIZE:
+                        for line in format_rows(result.columns, page):
+                            print(line)
+                        shown += len(page)
+                        page   = []
+                        if input(Fore.CYAN + f"-- {shown} rows, Enter for more, q to stop --" + Fore.RESET).strip().lower() == 'q':
+                            break
+                else:
+                    if page or not shown:
+                        for line in format_rows(result.columns, page):
+                            print(line)
+                    shown += len(page)
+                print(f"({shown} rows, {time.perf_counter() - started:.2f}s)")
+        except Exception as e:
+            print(Fore.RED + str(e).strip() + Fore.RESET)
+
 def start():
     while True:
         print(Fore.MAGENTA + "\nDatabases Management:" + Fore.RESET)
         print("  1- List Databases")
         print("  2- Create new Database")
         print("  3- Remove Database")
+        print("  4- Backup All Databases")
+        print("  5- Clone Database")
+        print("  6- Query Console")
+        print("  7- Export Table or Query")
         print("  0- Back to Main Menu")
 
         try:
@@ -18,7 +72,7 @@ def start():
             print(Fore.RED + "Please, enter a valid choice!" + Fore.RESET)
             continue
         
-        if res < 0 or res > 3:
+        if res < 0 or res > 7:
             print(Fore.RED + "Please, enter a choice in valid range!" + Fore.RESET)
             continue
         
@@ -28,18 +82,20 @@ def start():
         
         if res == 1:
             print(Fore.YELLOW + "\nListing Databases...\n" + Fore.RESET)
-            db_list = list_user_databases()
-            if not db_list:
+            inventory = database_inventory()
+            if not inventory:
                 print("No databases found.")
             else:
-                for i, db in enumerate(db_list):
-                    print(f"   {i + 1}. {db}")
+                for line in format_inventory_table(inventory):
+                    print(f"   {line}")
+                print(f"\n   {len(inventory)} databases, {sum(db.size or 0 for db in inventory) / (1024 * 1024):.1f} MiB in total")
             input("\nPress Enter to continue...")
         
         if res == 2:
             db_name = input("Enter the name for the new database: ")
             print(f"Creating database: {db_name}")
-            create_db(db_name)
+            if not create_db(db_name):
+                print(Fore.RED + f"Creating database {db_name} failed." + Fore.RESET)
             input("Press Enter to continue...")
         
         if res == 3:
@@ -58,4 +114,71 @@ def start():
                 print(Fore.GREEN + message + Fore.RESET)
             else:
                 print(Fore.RED + message + Fore.RESET)
+            input("Press Enter to continue...")
+        
+        if res == 4:
+            force = input("Back up unchanged databases too? (yes/no, default no): ").strip().lower() == 'yes'
+            print(Fore.YELLOW + "\nBacking up databases...\n" + Fore.RESET)
+            started = time.perf_counter()
+            results = backup_databases(force=force)
+            for result in results:
+                if result.status == 'failed':
+                    print(Fore.RED + f"   {result.database}: failed: {result.error}" + Fore.RESET)
+                elif result.status == 'skipped':
+                    print(f"   {result.database}: unchanged, skipped")
+                else:
+                    print(Fore.GREEN + f"   {result.database}: {result.size / (1024 * 1024):.1f} MiB "
+                          f"({result.stored / (1024 * 1024):.1f} MiB new) in {result.duration:.1f}s" + Fore.RESET)
+            if not results:
+                print("No databases found.")
+            else:
+                print(f"\n{len(results)} databases in {time.perf_counter() - started:.1f}s")
+            input("Press Enter to continue...")
+        
+        if res == 5:
+            print(Fore.YELLOW + "\nListing Databases...\n" + Fore.RESET)
+            db_list = list_user_databases()
+            for i, db in enumerate(db_list):
+                print(f"   {i + 1}. {db}")
+
+            source = input("\nEnter the name of the database to clone: ").strip()
+            target = input(f"Enter the name for the copy (e.g. {source}_staging): ").strip()
+            if not source or not target:
+                print(Fore.RED + "Both names are required!" + Fore.RESET)
+                continue
+            print(f"Cloning {source} into {target}...")
+            result = clone_database(source, target)
+            for note in result.notes:
+                print(Fore.YELLOW + f"   {note}" + Fore.RESET)
+            steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in result.timings.items())
+            if result.success:
+                how = "copied from template" if result.strategy == 'template' else "restored from backup"
+                print(Fore.GREEN + f"Database {target} {how} in {result.duration:.2f}s ({steps})" + Fore.RESET)
+            else:
+                print(Fore.RED + f"Cloning failed after {result.duration:.2f}s ({steps}): {result.error}" + Fore.RESET)
+            input("Press Enter to continue...")
+        
+        if res == 6:
+            db_name = choose_database()
+            if db_name:
+                query_console(db_name)
+        
+        if res == 7:
+            db_name = choose_database()
+            source  = input("Enter a table name or a SELECT query: ").strip()
+            fmt     = input("Format, csv or ndjson (default csv): ").strip().lower() or 'csv'
+            path    = input(f"Save to (default ./export.{fmt}): ").strip() or f"export.{fmt}"
+
+            def progress(rows, size, seconds):
+                rate = rows / seconds if seconds > 0 else 0
+                print(f"\r   {rows:,} rows, {size / (1024 * 1024):.1f} MiB, {rate:,.0f} rows/s", end="", flush=True)
+
+            try:
+                result = export_query(db_name, source, path, fmt, progress)
+                print()
+                print(Fore.GREEN + f"Exported {result.rows:,} rows to {result.path} in {result.duration:.2f}s "
+                      f"({result.rate:,.0f} rows/s)" + Fore.RESET)
+            except Exception as e:
+                print()
+                print(Fore.RED + f"Export failed: {str(e).strip()}" + Fore.RESET)
             input("Press Enter to continue...")
\ No newline at end of file
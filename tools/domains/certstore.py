@@ -0,0 +1,112 @@
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+from .models import DomainSSLInfo
+
+def caddyDataDir() -> str:
+    """Caddy's data directory, following the same XDG rules Caddy does."""
+    data_home = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(data_home, 'caddy')
+
+class CertificateStore:
+    """
+    Offline inventory of the certificates Caddy manages, read from the .crt
+    files under its data directory and indexed by subject alternative name.
+    Each file is parsed once per mtime; a refresh only stats the files, so
+    checking a whole fleet takes milliseconds and no network access.
+    """
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.path.join(caddyDataDir(), 'certificates')
+        self.lock = threading.Lock()
+        # path -> ((mtime_ns, size), SANs, info)
+        self.files: Dict[str, Tuple[Tuple[int, int], List[str], DomainSSLInfo]] = {}
+        self.by_name: Dict[str, List[DomainSSLInfo]] = {}
+
+    def _parse(self, path: str) -> Tuple[List[str], DomainSSLInfo]:
+        with open(path, 'rb') as file:
+            # Caddy stores the full chain, the leaf certificate comes first
+            cert = x509.load_pem_x509_certificate(file.read(), default_backend())
+        try:
+            sans = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+        except x509.ExtensionNotFound:
+            sans = []
+
+        info = DomainSSLInfo(
+            subject=cert.subject.rfc4514_string(),
+            issuer=cert.issuer.rfc4514_string(),
+            expiry=cert.not_valid_after_utc,
+            issued=cert.not_valid_before_utc,
+            source=path,
+        )
+        return [san.lower() for san in sans], info
+
+    def refresh(self) -> 'CertificateStore':
+        with self.lock:
+            seen    = set()
+            changed = False
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    if not name.endswith('.crt'):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+
+                    seen.add(path)
+                    signature = (st.st_mtime_ns, st.st_size)
+                    cached    = self.files.get(path)
+                    if cached and cached[0] == signature:
+                        continue
+                    try:
+                        sans, info = self._parse(path)
+                    except (OSError, ValueError):
+                        continue
+                    self.files[path] = (signature, sans, info)
+                    changed = True
+
+            for path in set(self.files) - seen:
+                del self.files[path]
+                changed = True
+
+            if changed:
+                self.by_name = {}
+                for _, sans, info in self.files.values():
+                    for san in sans:
+                        self.by_name.setdefault(san, []).append(info)
+        return self
+
+    def lookup(self, domain: str) -> Optional[DomainSSLInfo]:
+        """The stored certificate covering `domain` that expires last, if any."""
+        domain     = domain.lower().rstrip('.')
+        candidates = list(self.by_name.get(domain, ()))
+        if '.' in domain:
+            candidates.extend(self.by_name.get('*.' + domain.split('.', 1)[1], ()))
+        if not candidates:
+            return None
+        return max(candidates, key=lambda info: info.expiry)
+
+    def domains(self) -> List[str]:
+        return sorted(self.by_name)
+
+_store = None
+
+def certificateStore() -> CertificateStore:
+    """The process-wide store, refreshed (by stat) on every call."""
+    global _store
+    if _store is None:
+        _store = CertificateStore()
+    return _store.refresh()
+
+def localSSLInfo(domain: str) -> Optional[DomainSSLInfo]:
+    """A certificate for `domain` from Caddy's storage that is still valid, or None."""
+    info = certificateStore().lookup(domain)
+    if info is None or info.expiry <= datetime.now(timezone.utc):
+        return None
+    return info
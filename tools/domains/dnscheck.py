@@ -0,0 +1,333 @@
+import asyncio
+import ipaddress
+import random
+import struct
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .templates import NEST_IPV4, NEST_IPV6
+
+A, CNAME, TXT, AAAA = 1, 5, 16, 28
+TYPE_NAMES = {A: 'A', CNAME: 'CNAME', TXT: 'TXT', AAAA: 'AAAA'}
+
+NOERROR, NXDOMAIN = 0, 3
+RCODES = {1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+
+RESOLV_CONF = '/etc/resolv.conf'
+FALLBACK_NAMESERVERS = [('1.1.1.1', 53), ('8.8.8.8', 53)]
+
+class DNSError(Exception):
+    pass
+
+def systemNameservers(path: str = RESOLV_CONF) -> List[Tuple[str, int]]:
+    """The nameservers from resolv.conf, or public ones if it lists none."""
+    servers = []
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == 'nameserver':
+                    servers.append((parts[1].split('%')[0], 53))
+    except OSError:
+        pass
+    return servers or list(FALLBACK_NAMESERVERS)
+
+def _encode_name(name: str) -> bytes:
+    try:
+        encoded = name.rstrip('.').encode('idna')
+    except UnicodeError:
+        raise DNSError(f"Invalid domain name: {name}") from None
+    out = bytearray()
+    for label in encoded.split(b'.'):
+        if not label or len(label) > 63:
+            raise DNSError(f"Invalid domain name: {name}")
+        out.append(len(label))
+        out += label
+    return bytes(out) + b'\0'
+
+def _decode_name(message: bytes, offset: int) -> Tuple[str, int]:
+    labels = []
+    end    = None
+    jumps  = 0
+    while True:
+        if offset >= len(message):
+            raise DNSError("Truncated name in response")
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            # Compression pointer; the name continues elsewhere in the message
+            if jumps > 32:
+                raise DNSError("Compression loop in response")
+            if end is None:
+                end = offset + 2
+            offset = struct.unpack_from('!H', message, offset)[0] & 0x3FFF
+            jumps += 1
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(message[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+    return '.'.join(labels).lower(), end if end is not None else offset
+
+def buildQuery(qid: int, name: str, qtype: int) -> bytes:
+    # Recursion desired, one question, class IN
+    return struct.pack('!HHHHHH', qid, 0x0100, 1, 0, 0, 0) + _encode_name(name) + struct.pack('!HH', qtype, 1)
+
+@dataclass
+class DNSAnswer:
+    name: str
+    qtype: int
+    rcode: int = NOERROR
+    # (owner, type, value) in answer order; CNAME chains come before the final records
+    records: List[Tuple[str, int, str]] = field(default_factory=list)
+
+    def values(self, qtype: int, owner: Optional[str] = None) -> List[str]:
+        return [value for name, rtype, value in self.records if rtype == qtype and (owner is None or name == owner)]
+
+def parseResponse(message: bytes, qtype: int) -> Tuple[int, bool, DNSAnswer]:
+    """(id, truncated, answer) from a raw response."""
+    if len(message) < 12:
+        raise DNSError("Short DNS response")
+    qid, flags, qdcount, ancount = struct.unpack_from('!HHHH', message, 0)
+    offset = 12
+    name   = ''
+    for _ in range(qdcount):
+        name, offset = _decode_name(message, offset)
+        offset += 4
+
+    answer = DNSAnswer(name, qtype, flags & 0x000F)
+    for _ in range(ancount):
+        owner, offset = _decode_name(message, offset)
+        rtype, _, _, length = struct.unpack_from('!HHIH', message, offset)
+        offset += 10
+        rdata   = message[offset:offset + length]
+        if rtype == A and length == 4:
+            value = str(ipaddress.IPv4Address(rdata))
+        elif rtype == AAAA and length == 16:
+            value = str(ipaddress.IPv6Address(rdata))
+        elif rtype == CNAME:
+            value = _decode_name(message, offset)[0]
+        elif rtype == TXT:
+            chunks, i = [], 0
+            while i < length:
+                chunks.append(rdata[i + 1:i + 1 + rdata[i]])
+                i += 1 + rdata[i]
+            value = b''.join(chunks).decode('utf-8', 'replace')
+        else:
+            value = None
+        if value is not None:
+            answer.records.append((owner, rtype, value))
+        offset += length
+    return qid, bool(flags & 0x0200), answer
+
+class _UDPClient(asyncio.DatagramProtocol):
+    """One socket per nameserver, shared by every query in flight to it."""
+    def __init__(self):
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 2:
+            return
+        future = self.pending.pop(struct.unpack_from('!H', data)[0], None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def error_received(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
+
+    def connection_lost(self, exc):
+        self.error_received(exc or DNSError("Socket closed"))
+
+class StubResolver:
+    """
+    A minimal asynchronous DNS client: sends recursive queries over UDP to
+    `nameservers` (resolv.conf by default), retries over TCP when an answer
+    is truncated and moves on to the next server on timeout. Pointing it at
+    a local stub server is all it takes to test the checks below.
+    """
+    def __init__(self, nameservers: Optional[Sequence[Tuple[str, int]]] = None,
+                 timeout: float = 2.0, attempts: int = 2):
+        self.nameservers = list(nameservers or systemNameservers())
+        self.timeout     = timeout
+        self.attempts    = attempts
+        self.clients: Dict[Tuple[str, int], _UDPClient] = {}
+
+    async def _client(self, server: Tuple[str, int]) -> _UDPClient:
+        client = self.clients.get(server)
+        if client is None or client.transport is None or client.transport.is_closing():
+            loop      = asyncio.get_running_loop()
+            _, client = await loop.create_datagram_endpoint(_UDPClient, remote_addr=server)
+            self.clients[server] = client
+        return client
+
+    async def _udp(self, server: Tuple[str, int], name: str, qtype: int) -> Tuple[bool, DNSAnswer]:
+        client = await self._client(server)
+        qid    = random.getrandbits(16)
+        while qid in client.pending:
+            qid = random.getrandbits(16)
+        future = asyncio.get_running_loop().create_future()
+        client.pending[qid] = future
+        try:
+            client.transport.sendto(buildQuery(qid, name, qtype))
+            data = await asyncio.wait_for(future, self.timeout)
+        finally:
+            client.pending.pop(qid, None)
+        _, truncated, answer = parseResponse(data, qtype)
+        return truncated, answer
+
+    async def _tcp(self, server: Tuple[str, int], name: str, qtype: int) -> DNSAnswer:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*server), self.timeout)
+        try:
+            query = buildQuery(random.getrandbits(16), name, qtype)
+            writer.write(struct.pack('!H', len(query)) + query)
+            length = struct.unpack('!H', await asyncio.wait_for(reader.readexactly(2), self.timeout))[0]
+            data   = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+        finally:
+            writer.close()
+        return parseResponse(data, qtype)[2]
+
+    async def query(self, name: str, qtype: int) -> DNSAnswer:
+        last_error = None
+        for _ in range(self.attempts):
+            for server in self.nameservers:
+                try:
+                    truncated, answer = await self._udp(server, name, qtype)
+                    if truncated:
+                        answer = await self._tcp(server, name, qtype)
+                except asyncio.TimeoutError:
+                    last_error = DNSError(f"{server[0]} did not answer within {self.timeout:g}s")
+                    continue
+                except (OSError, asyncio.IncompleteReadError, struct.error) as e:
+                    last_error = DNSError(f"{server[0]}: {e}")
+                    continue
+                if answer.rcode not in (NOERROR, NXDOMAIN):
+                    last_error = DNSError(f"{server[0]} answered {RCODES.get(answer.rcode, answer.rcode)}")
+                    continue
+                return answer
+        raise last_error or DNSError("No nameservers configured")
+
+    def close(self):
+        for client in self.clients.values():
+            if client.transport is not None:
+                client.transport.close()
+        self.clients.clear()
+
+@dataclass
+class DNSCheckResult:
+    domain: str
+    expected_cname: str
+    cname: List[str] = field(default_factory=list)
+    a: List[str] = field(default_factory=list)
+    aaaa: List[str] = field(default_factory=list)
+    txt: List[str] = field(default_factory=list)
+    exists: bool = True
+    problems: List[str] = field(default_factory=list)    # what stops the domain from verifying
+    warnings: List[str] = field(default_factory=list)
+    error: Optional[str] = None                          # the lookup itself failed
+
+    @property
+    def verified(self) -> bool:
+        return self.error is None and not self.problems
+
+def _normalize(name: str) -> str:
+    return name.strip().lower().rstrip('.')
+
+def evaluate(result: DNSCheckResult, username: str) -> DNSCheckResult:
+    """
+    Compare the records found against what Nest expects: either a CNAME to
+    <username>.hackclub.app, or A/AAAA records with Nest's addresses plus
+    the domain-verification TXT record.
+    """
+    expected_txt = f"domain-verification={username}"
+    if not result.exists:
+        result.problems.append(f"{result.domain} does not exist in DNS (NXDOMAIN)")
+        return result
+
+    if result.cname:
+        if result.expected_cname in result.cname:
+            return result
+        result.problems.append(f"CNAME points to {', '.join(result.cname)}, expected {result.expected_cname}")
+        return result
+
+    if not result.a:
+        result.problems.append(f"No CNAME to {result.expected_cname} and no A record (expected {NEST_IPV4})")
+    elif NEST_IPV4 not in result.a:
+        result.problems.append(f"A record is {', '.join(result.a)}, expected {NEST_IPV4}")
+    elif len(result.a) > 1:
+        others = [ip for ip in result.a if ip != NEST_IPV4]
+        result.problems.append(f"Extra A record(s) {', '.join(others)} besides {NEST_IPV4}")
+
+    if not result.aaaa:
+        result.warnings.append(f"No AAAA record, IPv6 clients will not reach Nest ({NEST_IPV6})")
+    elif [ip for ip in result.aaaa if ipaddress.ip_address(ip) != ipaddress.ip_address(NEST_IPV6)]:
+        result.problems.append(f"AAAA record is {', '.join(result.aaaa)}, expected {NEST_IPV6}")
+
+    if expected_txt not in result.txt:
+        found = [txt for txt in result.txt if txt.startswith('domain-verification=')]
+        hint  = f" (found {', '.join(found)})" if found else ""
+        result.problems.append(f"TXT record {expected_txt} is missing{hint}")
+    return result
+
+async def _check(domain: str, username: str, resolver: StubResolver, limit: asyncio.Semaphore) -> DNSCheckResult:
+    domain = _normalize(domain)
+    result = DNSCheckResult(domain, f"{username}.hackclub.app")
+    try:
+        _encode_name(domain)
+    except DNSError as e:
+        # Nothing to look up; the name itself is what needs fixing
+        result.exists = False
+        result.problems.append(str(e))
+        return result
+    # Answers name their owners in ASCII (xn--) form, whatever the user typed
+    owner = domain.encode('idna').decode().lower()
+    async with limit:
+        try:
+            cname, a, aaaa, txt = await asyncio.gather(*(resolver.query(domain, qtype) for qtype in (CNAME, A, AAAA, TXT)))
+        except DNSError as e:
+            result.error = str(e)
+            return result
+
+    result.exists = cname.rcode != NXDOMAIN
+    result.cname  = [_normalize(value) for value in cname.values(CNAME, owner)]
+    # Addresses are whatever the name ends up at, after following any CNAME
+    result.a      = list(dict.fromkeys(a.values(A)))
+    result.aaaa   = list(dict.fromkeys(aaaa.values(AAAA)))
+    # A TXT answer through a CNAME belongs to the target, not to this domain
+    result.txt    = txt.values(TXT, owner)
+    return evaluate(result, username)
+
+async def checkDomainsAsync(domains: Iterable[str], username: str, resolver: Optional[StubResolver] = None,
+                            concurrency: int = 64) -> List[DNSCheckResult]:
+    own_resolver = resolver is None
+    resolver     = resolver or StubResolver()
+    limit        = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(*(_check(domain, username, resolver, limit) for domain in domains))
+    finally:
+        if own_resolver:
+            resolver.close()
+
+def checkDomains(domains: Iterable[str], username: str, nameservers: Optional[Sequence[Tuple[str, int]]] = None,
+                 timeout: float = 2.0, concurrency: int = 64) -> List[DNSCheckResult]:
+    """
+    Check the DNS records of many domains in one batch: the four lookups of
+    every domain run concurrently over a shared socket per nameserver, at
+    most `concurrency` domains at a time.
+    """
+    async def run():
+        resolver = StubResolver(nameservers, timeout)
+        try:
+            return await checkDomainsAsync(list(domains), username, resolver, concurrency)
+        finally:
+            resolver.close()
+    return asyncio.run(run())
+
+def checkDomain(domain: str, username: str, **kwargs) -> DNSCheckResult:
+    return checkDomains([domain], username, **kwargs)[0]
@@ -3,7 +3,8 @@ import sys
 
 from colorama import Fore
 from .models import Domain
-from .management import getSSLInfo
+from .management import getSSLInfo, removeDomain
+from .whoiscache import whoisCache
 from datetime import datetime, timezone
 import whois
 
@@ -64,13 +65,16 @@ def start(domain:Domain):
             if ".hackclub.app" in domain.name:
                 print(Fore.RED + "   Note: This is a Hack Club's Nest subdomain. So no useful details about it." + Fore.RESET)
             else:
-                domain_lookup = whois.whois(domain.name)
-                print("   Registeration Date:", domain_lookup.creation_date)
-                print("   Expiration Date:", domain_lookup.expiration_date)
-                print("   Registrar:", domain_lookup.registrar)
-                print("   Name Servers:")
-                for ns in domain_lookup.name_servers:
-                    print("    -", ns)
+                try:
+                    domain_lookup = whoisCache().get(domain.name)
+                    print("   Registeration Date:", domain_lookup.creation_date)
+                    print("   Expiration Date:", domain_lookup.expiration_date)
+                    print("   Registrar:", domain_lookup.registrar)
+                    print("   Name Servers:")
+                    for ns in domain_lookup.name_servers or []:
+                        print("    -", ns)
+                except Exception as e:
+                    print(Fore.RED + f"   WHOIS lookup failed: {e}" + Fore.RESET)
 
         elif res == 2:
             print(Fore.YELLOW + f"\nSSL Details for {domain.name}:\n" + Fore.RESET)
@@ -80,6 +84,7 @@ def start(domain:Domain):
                 print(f"   Issuer: {ssl_info.issuer}")
                 print(f"   Issued On: {ssl_info.issued}")
                 print(f"   Expiry Date: {ssl_info.expiry}")
+                print(f"   Source: {'Caddy storage (' + ssl_info.source + ')' if ssl_info.source else 'live TLS handshake'}")
                 if ssl_info.expiry < datetime.now(timezone.utc):
                     print(Fore.RED + "   Status: Expired" + Fore.RESET)
                 else:
@@ -91,7 +96,7 @@ def start(domain:Domain):
             confirm = input(f"Are you sure you want to delete the domain {domain.name}? (yes/no): ")
             if confirm.lower() == 'yes':
                 print(f"Deleting domain: {domain.name}")
-                os.system(f'nest caddy rm {domain.name}')
+                removeDomain(domain.name)
             else:
                 print(Fore.YELLOW + "Domain deletion cancelled." + Fore.RESET)
         
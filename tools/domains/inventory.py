@@ -0,0 +1,140 @@
+import os
+import subprocess
+import threading
+from typing import Dict, List, Optional, Set
+
+from .models import Domain
+
+def parseDomainList(output: str) -> List[Domain]:
+    """Domains from the output of `nest caddy list`, lines like `- example.com (/path/to.sock)`."""
+    domains = []
+    for line in output.splitlines():
+        parts = line.replace("(", "").replace(")", "").split()
+        if len(parts) != 3:
+            continue
+        domains.append(Domain(name=parts[1], sock_path=parts[2]))
+    return domains
+
+def socketPath(bind: Optional[str]) -> Optional[str]:
+    """
+    The filesystem path behind a socket as Nest lists it or as a site's
+    `bind` has it (`unix/.name.webserver.sock|777`), so both compare equal.
+    Relative paths are relative to the home directory Caddy runs in.
+    """
+    if not bind:
+        return None
+    path = bind.split('|', 1)[0]
+    if path.startswith('unix/'):
+        path = path[len('unix/'):]
+    elif not path.startswith(('/', '.', '~')):
+        # A network address, not a socket
+        return None
+    return os.path.normpath(os.path.join(os.path.expanduser('~'), os.path.expanduser(path)))
+
+def _site_hosts(site) -> List[str]:
+    hosts = [site.domain]
+    for address in site.addresses:
+        hosts.append(address.split('://')[-1].split('/')[0].rsplit(':', 1)[0])
+    return [host.lower() for host in dict.fromkeys(hosts) if host]
+
+class DomainInventory:
+    """
+    Domains from `nest caddy list`, indexed by name and by socket path, and
+    joined with the sites of the (expanded) Caddyfile so that relating a
+    domain, its socket and its site block is a dict lookup.
+    """
+    def __init__(self, domains: List[Domain], caddy=None, error: Optional[str] = None):
+        self.domains   = domains
+        self.error     = error      # why `nest caddy list` gave nothing, if it failed
+        self.by_name:   Dict[str, Domain] = {domain.name.lower(): domain for domain in domains}
+        self.by_socket: Dict[str, List[Domain]] = {}
+        for domain in domains:
+            self.by_socket.setdefault(socketPath(domain.sock_path), []).append(domain)
+        self.join(caddy)
+
+    def join(self, caddy):
+        self.caddy            = caddy
+        self.sites            = {}
+        self.sites_by_socket  = {}
+        if caddy is not None:
+            for site in dict.values(caddy.sites):
+                for host in _site_hosts(site):
+                    self.sites.setdefault(host, site)
+                path = socketPath(site.bind)
+                if path is not None:
+                    self.sites_by_socket.setdefault(path, []).append(site)
+
+        self.without_site: Set[str] = {name for name in self.by_name if name not in self.sites}
+        self.without_domain: Set[str] = {
+            site.domain for site in dict.values(caddy.sites) if not any(host in self.by_name for host in _site_hosts(site))
+        } if caddy is not None else set()
+
+    def domain(self, name: str) -> Optional[Domain]:
+        return self.by_name.get(name.lower().rstrip('.'))
+
+    def site(self, name: str):
+        """The Caddy site block serving the domain `name`, if any."""
+        return self.sites.get(name.lower().rstrip('.'))
+
+    def domainsForSocket(self, path: str) -> List[Domain]:
+        return self.by_socket.get(socketPath(path), [])
+
+    def sitesForSocket(self, path: str) -> list:
+        """The site blocks bound to the socket at `path`."""
+        return self.sites_by_socket.get(socketPath(path), [])
+
+    def hasSite(self, name: str) -> bool:
+        return name.lower().rstrip('.') in self.sites
+
+    def domainsWithoutSite(self) -> List[Domain]:
+        return [domain for domain in self.domains if domain.name.lower() in self.without_site]
+
+    def sitesWithoutDomain(self) -> List[str]:
+        """Site blocks whose addresses are not registered with Nest."""
+        return sorted(self.without_domain)
+
+_inventory: Optional[DomainInventory] = None
+_lock = threading.Lock()
+
+def _fetch() -> List[Domain]:
+    try:
+        result = subprocess.run(['nest', 'caddy', 'list'], capture_output=True, text=True)
+    except OSError as e:
+        raise RuntimeError(f"Could not run `nest caddy list`: {e}") from None
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"`nest caddy list` exited with {result.returncode}")
+    return parseDomainList(result.stdout)
+
+def _caddy():
+    from tools.caddy.management import loadExpandedCaddyFile
+    try:
+        return loadExpandedCaddyFile().caddy
+    except (OSError, ValueError):
+        return None
+
+def domainInventory(refresh: bool = False, with_sites: bool = True) -> DomainInventory:
+    """
+    The cached inventory. `nest caddy list` runs once and again only after
+    a domain is added or removed (or with `refresh`); the join with the
+    Caddyfile is redone only when the parsed Caddyfile changed. When the
+    command fails, an empty inventory carrying the error is returned and
+    nothing is cached, so the next call tries again.
+    """
+    global _inventory
+    with _lock:
+        if _inventory is None or refresh:
+            try:
+                _inventory = DomainInventory(_fetch())
+            except RuntimeError as e:
+                _inventory = None
+                return DomainInventory([], _caddy() if with_sites else None, str(e))
+        if with_sites:
+            caddy = _caddy()
+            if caddy is not _inventory.caddy:
+                _inventory.join(caddy)
+        return _inventory
+
+def invalidateDomainInventory():
+    global _inventory
+    with _lock:
+        _inventory = None
@@ -4,35 +4,33 @@ import ssl, socket
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 
+from .inventory import domainInventory, invalidateDomainInventory
 from .models import Domain, DomainSSLInfo
 
-def listDomains():
-    domains = []
-    output  = os.popen('nest caddy list').read().splitlines()
+def listDomains(refresh=False):
+    return list(domainInventory(refresh, with_sites=False).domains)
 
-    for line in output:
-        _, name, sock_path = line.replace("(", "").replace(")", "").split()
-
-        domains.append(Domain(
-            name=name,
-            sock_path=sock_path
-        ))
+def sslInfoFromDer(der_cert):
+    cert = x509.load_der_x509_certificate(der_cert, default_backend())
+    return  DomainSSLInfo(
+        subject=cert.subject.rfc4514_string(),
+        issuer=cert.issuer.rfc4514_string(),
+        expiry=cert.not_valid_after_utc,
+        issued=cert.not_valid_before_utc,
+    )
 
-    return domains
+def getSSLInfo(domain, offline=True):
+    if offline:
+        from .certstore import localSSLInfo
+        info = localSSLInfo(domain)
+        if info is not None:
+            return info
 
-def getSSLInfo(domain):
     ctx = ssl.create_default_context()
     with ctx.wrap_socket(socket.socket(), server_hostname=domain) as s:
         s.settimeout(5)
         s.connect((domain, 443))
-        der_cert = s.getpeercert(True)
-        cert = x509.load_der_x509_certificate(der_cert, default_backend())
-        return  DomainSSLInfo(
-            subject=cert.subject.rfc4514_string(),
-            issuer=cert.issuer.rfc4514_string(),
-            expiry=cert.not_valid_after_utc,
-            issued=cert.not_valid_before_utc,
-        )
+        return sslInfoFromDer(s.getpeercert(True))
 
 def addDomain(domain):
     result = subprocess.run(
@@ -41,6 +39,7 @@ def addDomain(domain):
         text=True
     )
     output = result.stdout + result.stderr
+    invalidateDomainInventory()
 
     if "This domain already has already been taken" in output:
         return False, "Domain already exists."
@@ -50,4 +49,5 @@ def addDomain(domain):
     return True, "Domain added successfully."
 
 def removeDomain(domain):
-    os.system(f'nest caddy rm {domain}')
\ No newline at end of file
+    os.system(f'nest caddy rm {domain}')
+    invalidateDomainInventory()
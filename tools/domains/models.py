@@ -11,9 +11,12 @@ class DomainSSLInfo:
     issuer  = None
     expiry  = None
     issued  = None
+    source  = None
 
-    def __init__(self, subject, issuer, expiry, issued):
+    def __init__(self, subject, issuer, expiry, issued, source=None):
         self.subject = subject
         self.issuer  = issuer
         self.expiry  = expiry
-        self.issued  = issued
\ No newline at end of file
+        self.issued  = issued
+        # Path of the stored certificate, or None when read over the network
+        self.source  = source
\ No newline at end of file
@@ -0,0 +1,200 @@
+import asyncio
+import ipaddress
+import json
+import os
+import ssl
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils import atomic_write
+from .certstore import localSSLInfo
+from .management import listDomains, sslInfoFromDer
+from .models import DomainSSLInfo
+
+CACHE_PATH = '~/.cache/nest-cli/certificates.json'
+
+HOUR = 3600
+DAY  = 24 * HOUR
+
+@dataclass
+class CertScanResult:
+    domain: str
+    info: Optional[DomainSSLInfo] = None
+    error: Optional[str] = None      # connection failure, or why the chain did not verify
+    checked: float = 0.0
+    cached: bool = False
+
+    @property
+    def days_left(self) -> Optional[float]:
+        if self.info is None:
+            return None
+        return (self.info.expiry - datetime.now(timezone.utc)).total_seconds() / DAY
+
+def cacheTTL(result: CertScanResult) -> float:
+    """
+    How long a result stays fresh: a tenth of the certificate's remaining
+    life, between an hour and a day, so certificates close to expiry (or
+    just renewed) are looked at again soon while healthy ones are not.
+    """
+    if result.info is None or result.error:
+        return 10 * 60
+    remaining = result.days_left * DAY
+    if remaining <= 7 * DAY:
+        return HOUR
+    return min(max(remaining / 10, HOUR), DAY)
+
+def _dump(result: CertScanResult) -> dict:
+    info = result.info
+    return {
+        'checked': result.checked,
+        'error': result.error,
+        'info': None if info is None else {
+            'subject': info.subject,
+            'issuer': info.issuer,
+            'expiry': info.expiry.isoformat(),
+            'issued': info.issued.isoformat(),
+        },
+    }
+
+def _load(domain: str, data: dict) -> CertScanResult:
+    info = data.get('info')
+    if info is not None:
+        info = DomainSSLInfo(
+            subject=info['subject'],
+            issuer=info['issuer'],
+            expiry=datetime.fromisoformat(info['expiry']),
+            issued=datetime.fromisoformat(info['issued']),
+        )
+    return CertScanResult(domain, info, data.get('error'), data.get('checked', 0.0), cached=True)
+
+def loadCache(path: str = CACHE_PATH) -> Dict[str, CertScanResult]:
+    try:
+        with open(os.path.expanduser(path), 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        return {domain: _load(domain, entry) for domain, entry in data.items()}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def saveCache(results: Dict[str, CertScanResult], path: str = CACHE_PATH):
+    path = os.path.expanduser(path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps({domain: _dump(result) for domain, result in results.items()}))
+    except OSError:
+        pass
+
+async def _handshake(host: str, port: int, server_name: str, ctx: ssl.SSLContext, timeout: float) -> bytes:
+    _, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=ctx, server_hostname=server_name),
+        timeout
+    )
+    try:
+        return writer.get_extra_info('ssl_object').getpeercert(True)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+async def _scan(domain: str, target: Tuple[str, int], timeout: float, limit: asyncio.Semaphore,
+                verified: ssl.SSLContext, unverified: ssl.SSLContext) -> CertScanResult:
+    async with limit:
+        result = CertScanResult(domain, checked=time.time())
+        try:
+            try:
+                der = await _handshake(target[0], target[1], domain, verified, timeout)
+            except ssl.SSLCertVerificationError as e:
+                # Still read the certificate, an expired one is what we look for
+                result.error = e.verify_message or str(e)
+                der = await _handshake(target[0], target[1], domain, unverified, timeout)
+            result.info = sslInfoFromDer(der)
+        except asyncio.TimeoutError:
+            result.error = f"no TLS handshake within {timeout:g}s"
+        except (OSError, ssl.SSLError, ValueError) as e:
+            result.error = str(e)
+        return result
+
+async def scanCertificatesAsync(domains: Iterable[str], timeout: float = 5.0, concurrency: int = 50,
+                                targets: Optional[Dict[str, Tuple[str, int]]] = None,
+                                cafile: Optional[str] = None) -> List[CertScanResult]:
+    verified   = ssl.create_default_context(cafile=cafile)
+    unverified = ssl.create_default_context(cafile=cafile)
+    unverified.check_hostname = False
+    unverified.verify_mode    = ssl.CERT_NONE
+
+    limit   = asyncio.Semaphore(concurrency)
+    targets = targets or {}
+    return await asyncio.gather(*(
+        _scan(domain, targets.get(domain, (domain, 443)), timeout, limit, verified, unverified)
+        for domain in domains
+    ))
+
+def scanCertificates(domains: Iterable[str], timeout: float = 5.0, concurrency: int = 50, use_cache: bool = True,
+                     targets: Optional[Dict[str, Tuple[str, int]]] = None, cafile: Optional[str] = None,
+                     cache_path: str = CACHE_PATH, offline: bool = True) -> List[CertScanResult]:
+    """
+    TLS certificates of many domains at once. Valid certificates in Caddy's
+    own storage and fresh cached results are used as they are; everything
+    else is fetched concurrently, at most `concurrency` handshakes at a
+    time, each bounded by `timeout`. `targets` maps a domain to the
+    (host, port) to connect to instead.
+    """
+    domains = list(dict.fromkeys(domains))
+    cache   = loadCache(cache_path) if use_cache else {}
+    now     = time.time()
+
+    fresh = {
+        domain: cache[domain] for domain in domains
+        if domain in cache and now - cache[domain].checked < cacheTTL(cache[domain])
+    }
+    stale = [domain for domain in domains if domain not in fresh]
+
+    if offline:
+        remaining = []
+        for domain in stale:
+            info = localSSLInfo(domain)
+            if info is not None:
+                fresh[domain] = CertScanResult(domain, info, checked=now)
+            else:
+                remaining.append(domain)
+        stale = remaining
+
+    if stale:
+        for result in asyncio.run(scanCertificatesAsync(stale, timeout, concurrency, targets, cafile)):
+            fresh[result.domain] = result
+            cache[result.domain] = result
+        if use_cache:
+            saveCache(cache, cache_path)
+
+    return [fresh[domain] for domain in domains]
+
+def _is_public_name(host: str) -> bool:
+    if not host or '*' in host or '{' in host or host == 'localhost' or '.' not in host:
+        return False
+    try:
+        ipaddress.ip_address(host.strip('[]'))
+        return False
+    except ValueError:
+        return True
+
+def allDomainNames() -> List[str]:
+    """Every domain from `nest caddy list` and the Caddyfile's site addresses."""
+    from tools.caddy.management import loadExpandedCaddyFile
+
+    names = [domain.name for domain in listDomains()]
+    try:
+        for site in dict.values(loadExpandedCaddyFile().caddy.sites):
+            for address in site.addresses or [site.domain]:
+                names.append(address.split('://')[-1].split('/')[0].rsplit(':', 1)[0])
+    except (OSError, ValueError):
+        pass
+    return [name for name in dict.fromkeys(names) if _is_public_name(name)]
+
+def expiringWithin(results: List[CertScanResult], days: float) -> List[CertScanResult]:
+    """Results expiring within `days` (or already expired), soonest first; failures last."""
+    expiring = [r for r in results if r.info is not None and r.days_left <= days]
+    failed   = [r for r in results if r.info is None]
+    return sorted(expiring, key=lambda r: r.days_left) + failed
@@ -1,13 +1,16 @@
 from colorama import Fore, Style
 
+NEST_IPV4 = "37.27.51.34"
+NEST_IPV6 = "2a01:4f9:3081:399c::4"
 
-domain_connection_guide = """
+
+domain_connection_guide = f"""
 To connect your domain to Nest, please follow these steps:
 * Add a CNAME record to your domain pointing to <username>.hackclub.app
 OR
 * If you're using a root domain and you can't add a CNAME record, you can add an A record pointing to the following IP addresses:
-A record: 37.27.51.34
-AAAA record: 2a01:4f9:3081:399c::4
+A record: {NEST_IPV4}
+AAAA record: {NEST_IPV6}
 TXT record: domain-verification=<YOUR_NEST_USERNAME>
 
 If you have already done this, please wait a few minutes sometimes upto 24 hours for DNS records to propagate.
@@ -22,8 +25,8 @@ domain_connection_guide_styled = f"""
     {Fore.GREEN}<username>.hackclub.app{Style.RESET_ALL}
 
 {Fore.YELLOW + Style.BRIGHT}▶ Or, if you're using a root domain:{Style.RESET_ALL}
-    {Fore.BLUE}A record:{Style.RESET_ALL}      37.27.51.34
-    {Fore.BLUE}AAAA record:{Style.RESET_ALL}   2a01:4f9:3081:399c::4
+    {Fore.BLUE}A record:{Style.RESET_ALL}      {NEST_IPV4}
+    {Fore.BLUE}AAAA record:{Style.RESET_ALL}   {NEST_IPV6}
 
 {Fore.YELLOW + Style.BRIGHT}▶ Add a TXT record for verification:{Style.RESET_ALL}
     {Fore.MAGENTA}domain-verification=<username>{Style.RESET_ALL}
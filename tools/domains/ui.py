@@ -1,15 +1,37 @@
 import sys
 from colorama import Fore
 import os
+import time
 from .management import addDomain, listDomains, removeDomain
+from .dnscheck import checkDomain, checkDomains
+from .inventory import domainInventory
+from .scanner import allDomainNames, expiringWithin, scanCertificates
+from .whoiscache import externalDomains, whoisCache
 from utils import username
 
+def printDNSCheck(check):
+    if check.error:
+        print(Fore.RED + f"   {check.domain}: DNS lookup failed: {check.error}" + Fore.RESET)
+        return
+    if check.verified:
+        how = f"CNAME to {check.expected_cname}" if check.cname else "A/TXT records"
+        print(Fore.GREEN + f"   {check.domain}: OK ({how})" + Fore.RESET)
+    else:
+        print(Fore.RED + f"   {check.domain}:" + Fore.RESET)
+        for problem in check.problems:
+            print(Fore.RED + f"     - {problem}" + Fore.RESET)
+    for warning in check.warnings:
+        print(Fore.YELLOW + f"     - {warning}" + Fore.RESET)
+
 def start():
     while True:
         print(Fore.MAGENTA + "\nDomain Management:" + Fore.RESET)
         print("  1- List Domains")
         print("  2- Add Domain")
         print("  3- Remove Domain")
+        print("  4- Check SSL Expiry (All Domains)")
+        print("  5- WHOIS Lookup (All Domains)")
+        print("  6- Check DNS Records")
         print("  0- Back to Main Menu")
 
         try:
@@ -18,7 +40,7 @@ def start():
             print(Fore.RED + "Please, enter a valid choice!" + Fore.RESET)
             continue
         
-        if res < 0 or res > 3:
+        if res < 0 or res > 6:
             print(Fore.RED + "Please, enter a choice in valid range!" + Fore.RESET)
             continue
         
@@ -29,9 +51,16 @@ def start():
         
         if res == 1:
             print(Fore.YELLOW + "\nListing Domains...\n" + Fore.RESET)
-            domain_list = listDomains()
+            inventory   = domainInventory()
+            domain_list = list(inventory.domains)
+            if inventory.error:
+                print(Fore.RED + f"Listing domains failed: {inventory.error}" + Fore.RESET)
             for i, domain in enumerate(domain_list):
-                print(f"   {i + 1}. {domain.name}")
+                missing = "" if inventory.hasSite(domain.name) else Fore.YELLOW + " (no Caddy site block)" + Fore.RESET
+                print(f"   {i + 1}. {domain.name}{missing}")
+            unregistered = inventory.sitesWithoutDomain()
+            if unregistered:
+                print(Fore.YELLOW + f"\n   Caddy sites not registered with Nest: {', '.join(unregistered)}" + Fore.RESET)
 
             selected_domain = input("\nChoose domain to start working with it or 0 to go back: ")
 
@@ -55,6 +84,15 @@ def start():
         elif res == 2:
             domain = input("Enter the domain to add: ")
             print("Checking if eligible for adding first ...")
+            check = checkDomain(domain, username)
+            if not check.verified:
+                # Records can be right but not visible from here yet, the user decides
+                printDNSCheck(check)
+                print(Fore.YELLOW + "The DNS records do not point at Nest yet, so adding the domain may fail." + Fore.RESET)
+                if input("Add it anyway? (y/n): ").strip().lower() != 'y':
+                    from .templates import domain_connection_guide_styled
+                    print(domain_connection_guide_styled.replace("<username>", username))
+                    continue
             success, message = addDomain(domain)
             if not success:
                 print(Fore.RED + message + Fore.RESET)
@@ -71,4 +109,50 @@ def start():
 
             domain = input("\nEnter the domain to remove: ")
             print(f"Removing domain: {domain}")
-            removeDomain(domain)
\ No newline at end of file
+            removeDomain(domain)
+        elif res == 4:
+            days = input("Report certificates expiring within how many days? (default 30): ").strip()
+            days = int(days) if days.isdigit() else 30
+
+            names = allDomainNames()
+            print(Fore.YELLOW + f"\nChecking {len(names)} domains...\n" + Fore.RESET)
+            started  = time.perf_counter()
+            results  = scanCertificates(names)
+            expiring = expiringWithin(results, days)
+
+            for result in expiring:
+                if result.info is None:
+                    print(Fore.RED + f"   {result.domain}: {result.error}" + Fore.RESET)
+                    continue
+                color = Fore.RED if result.days_left < 7 else Fore.YELLOW
+                state = "expired" if result.days_left < 0 else f"{result.days_left:.0f} days left"
+                print(color + f"   {result.domain}: {state} ({result.info.expiry:%Y-%m-%d})" + Fore.RESET)
+
+            if not expiring:
+                print(Fore.GREEN + f"   No certificate expires within {days} days." + Fore.RESET)
+            cached = sum(result.cached for result in results)
+            print(f"\n{len(results)} domains checked in {time.perf_counter() - started:.2f}s ({cached} from cache)")
+        elif res == 5:
+            names = externalDomains(domain.name for domain in listDomains())
+            if not names:
+                print(Fore.YELLOW + "\nOnly Nest subdomains are connected, nothing to look up." + Fore.RESET)
+                continue
+            print(Fore.YELLOW + f"\nLooking up {len(names)} domains...\n" + Fore.RESET)
+            started = time.perf_counter()
+            for name, record in whoisCache().bulk(names).items():
+                if isinstance(record, Exception):
+                    print(Fore.RED + f"   {name}: {record}" + Fore.RESET)
+                    continue
+                expires = record.expires()
+                print(f"   {name}: {record.registrar or 'unknown registrar'}, expires {expires:%Y-%m-%d}" if expires else f"   {name}: {record.registrar or 'unknown registrar'}")
+            print(f"\n{len(names)} domains looked up in {time.perf_counter() - started:.2f}s")
+        elif res == 6:
+            names = input("Enter domains to check, separated by spaces (empty for all connected domains): ").split()
+            names = names or externalDomains(domain.name for domain in listDomains())
+            print(Fore.YELLOW + f"\nChecking DNS records of {len(names)} domains...\n" + Fore.RESET)
+            started = time.perf_counter()
+            results = checkDomains(names, username)
+            for check in results:
+                printDNSCheck(check)
+            verified = sum(check.verified for check in results)
+            print(f"\n{verified}/{len(results)} domains point at Nest, checked in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+import whois
+
+from utils import atomic_write
+
+CACHE_PATH  = '~/.cache/nest-cli/whois.json'
+DEFAULT_TTL = 7 * 24 * 3600
+# Registries throttle or ban clients that query too fast
+MIN_INTERVAL_PER_SERVER = 1.0
+
+FIELDS = ('domain_name', 'registrar', 'creation_date', 'expiration_date', 'updated_date', 'name_servers', 'status')
+
+def registrableDomain(name: str) -> str:
+    """`name` cut down to what is registered, e.g. blog.example.co.uk -> example.co.uk."""
+    return whois.extract_domain(name.lower().rstrip('.'))
+
+def whoisServer(domain: str) -> str:
+    """
+    The registry server a lookup for `domain` ends up at. Each TLD has its
+    own; asking NICClient would itself query IANA for most TLDs, so the TLD
+    stands in for the server.
+    """
+    return domain.rsplit('.', 1)[-1] + whois.NICClient.QNICHOST_TAIL
+
+class WhoisRecord:
+    """The parts of a WHOIS answer the UI shows, in a form that caches as JSON."""
+    def __init__(self, domain, fetched, **fields):
+        self.domain  = domain
+        self.fetched = fetched
+        for name in FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @staticmethod
+    def from_entry(domain: str, entry) -> 'WhoisRecord':
+        return WhoisRecord(domain, time.time(), **{name: entry.get(name) for name in FIELDS})
+
+    def to_json(self) -> dict:
+        def encode(value):
+            if isinstance(value, datetime):
+                return {'datetime': value.isoformat()}
+            if isinstance(value, (list, tuple)):
+                return [encode(item) for item in value]
+            return value
+        return {'fetched': self.fetched, **{name: encode(getattr(self, name)) for name in FIELDS}}
+
+    @staticmethod
+    def from_json(domain: str, data: dict) -> 'WhoisRecord':
+        def decode(value):
+            if isinstance(value, dict) and 'datetime' in value:
+                return datetime.fromisoformat(value['datetime'])
+            if isinstance(value, list):
+                return [decode(item) for item in value]
+            return value
+        return WhoisRecord(domain, data['fetched'], **{name: decode(data.get(name)) for name in FIELDS})
+
+    def expires(self) -> Optional[datetime]:
+        value = self.expiration_date
+        if isinstance(value, list):
+            value = min(value, default=None)
+        if isinstance(value, datetime) and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value if isinstance(value, datetime) else None
+
+class _ServerRateLimit:
+    """At most one query per `interval` seconds to each WHOIS server."""
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lock     = threading.Lock()
+        self.next_at: Dict[str, float] = {}
+
+    def wait(self, server: str):
+        with self.lock:
+            now  = time.monotonic()
+            slot = max(now, self.next_at.get(server, now))
+            self.next_at[server] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class WhoisCache:
+    """
+    Disk-backed WHOIS answers keyed by registrable domain, so every
+    subdomain of a registration shares one lookup. Entries live for `ttl`
+    seconds, or until the registration's own expiry if that comes first.
+    """
+    def __init__(self, path: str = CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 lookup: Callable = whois.whois, interval: float = MIN_INTERVAL_PER_SERVER):
+        self.path    = os.path.expanduser(path)
+        self.ttl     = ttl
+        self.lookup  = lookup
+        self.limit   = _ServerRateLimit(interval)
+        self.lock    = threading.Lock()
+        self.records = self._load()
+
+    def _load(self) -> Dict[str, WhoisRecord]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            return {domain: WhoisRecord.from_json(domain, entry) for domain, entry in data.items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self.lock:
+                data = {domain: record.to_json() for domain, record in self.records.items()}
+            atomic_write(self.path, json.dumps(data))
+        except OSError:
+            pass
+
+    def _fresh(self, record: WhoisRecord) -> bool:
+        now     = time.time()
+        expires = record.expires()
+        if expires is not None and expires.timestamp() < record.fetched + self.ttl:
+            # Renewal or lapse is due, look again once it has passed
+            return now < max(expires.timestamp(), record.fetched + 3600)
+        return now - record.fetched < self.ttl
+
+    def cached(self, name: str) -> Optional[WhoisRecord]:
+        with self.lock:
+            record = self.records.get(registrableDomain(name))
+        return record if record is not None and self._fresh(record) else None
+
+    def _fetch(self, domain: str) -> WhoisRecord:
+        self.limit.wait(whoisServer(domain))
+        record = WhoisRecord.from_entry(domain, self.lookup(domain))
+        with self.lock:
+            self.records[domain] = record
+        return record
+
+    def get(self, name: str, refresh: bool = False) -> WhoisRecord:
+        domain = registrableDomain(name)
+        record = None if refresh else self.cached(domain)
+        if record is None:
+            record = self._fetch(domain)
+            self.save()
+        return record
+
+    def bulk(self, names: Iterable[str], workers: int = 16) -> Dict[str, object]:
+        """
+        WHOIS for many domains at once: cached answers are used directly and
+        each registrable domain is looked up once. Lookups run on a thread
+        pool and are spaced out per WHOIS server. Maps every name to its
+        record, or to the exception its lookup raised.
+        """
+        names    = list(dict.fromkeys(names))
+        by_name  = {name: registrableDomain(name) for name in names}
+        results: Dict[str, object] = {}
+        missing  = []
+
+        for domain in dict.fromkeys(by_name.values()):
+            record = self.cached(domain)
+            if record is not None:
+                results[domain] = record
+            else:
+                missing.append(domain)
+
+        def fetch(domain):
+            try:
+                return domain, self._fetch(domain)
+            except Exception as e:
+                return domain, e
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for domain, outcome in pool.map(fetch, missing):
+                    results[domain] = outcome
+            self.save()
+
+        return {name: results[domain] for name, domain in by_name.items()}
+
+_cache = None
+
+def whoisCache() -> WhoisCache:
+    global _cache
+    if _cache is None:
+        _cache = WhoisCache()
+    return _cache
+
+def externalDomains(names: Iterable[str]) -> List[str]:
+    """Domains that have their own registration, i.e. not Nest subdomains."""
+    return [name for name in names if not name.endswith('.hackclub.app')]
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from colorama import Fore
 
 def welcome():
@@ -11,4 +12,29 @@ def welcome():
     print("\n")
 
 
-username = os.popen("whoami").read().strip()
\ No newline at end of file
+username = os.popen("whoami").read().strip()
+
+def atomic_write(path: str, text: str):
+    """Replace `path` with `text` via a synced temp file, so readers never see a partial file."""
+    path      = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, tmp   = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)